@@ -0,0 +1,249 @@
+"""
+apps_script_api.py
+
+Minimal client for the Apps Script API (https://script.googleapis.com/v1).
+
+Each worker thread keeps its own keep-alive connection to the API host, so a
+batch of requests pays for one TLS handshake per thread instead of one per
+request. The base URL can be overridden with the APPS_SCRIPT_API_BASE
+environment variable (or the api_base argument), e.g. to point the scripts at a
+local stand-in server such as http://127.0.0.1:8080/v1.
+
+Every request goes through the shared rate_limit.limiter: it waits for the
+per-minute budget, and a 429 or 5xx response is retried with backoff,
+honouring Retry-After.
+"""
+import concurrent.futures
+import http.client
+import json
+import os
+import sys
+import threading
+import urllib.parse
+
+import rate_limit
+
+DEFAULT_API_BASE = 'https://script.googleapis.com/v1'
+
+
+def get_api_base(api_base=None):
+    """Return the API base URL from the argument, the environment or the default."""
+    return (api_base or os.environ.get('APPS_SCRIPT_API_BASE') or DEFAULT_API_BASE).rstrip('/')
+
+
+class ApiError(Exception):
+    """Raised for a non-2xx response from the API."""
+
+    def __init__(self, status, reason, body=b'', headers=None):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+        self.reason = reason
+        self.body = body
+        self.headers = headers or {}
+
+
+def header(headers, name):
+    """Case-insensitive lookup in a response header dict."""
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), None)
+
+
+class ApiClient:
+    """
+    Apps Script API client with one persistent connection per thread.
+    Safe to share between threads.
+
+    token is either an access token string or a token_manager.TokenManager;
+    with a manager, a 401 response refreshes the shared token and the
+    request is sent once more. limiter defaults to the shared
+    rate_limit.limiter.
+    """
+
+    def __init__(self, token, api_base=None, timeout=30, limiter=None):
+        self.token = token
+        self.limiter = limiter or rate_limit.limiter
+        self.api_base = get_api_base(api_base)
+        self.timeout = timeout
+        parsed = urllib.parse.urlsplit(self.api_base)
+        self._scheme = parsed.scheme
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._path = parsed.path.rstrip('/')
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            if self._scheme == 'http':
+                conn = http.client.HTTPConnection(self._host, self._port, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPSConnection(self._host, self._port, timeout=self.timeout)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _drop_connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _access_token(self):
+        return self.token if isinstance(self.token, str) else self.token.get_token()
+
+    def request(self, method, path, query=None):
+        """
+        Send one request and return (status, reason, headers, body).
+        An expired token is refreshed once through the token manager; a 429
+        or 5xx response is retried up to limiter.max_retries times.
+        """
+        refreshed = False
+        attempt = 0
+        while True:
+            attempt += 1
+            self.limiter.acquire('api')
+            access_token = self._access_token()
+            response = self._send(method, path, query, access_token)
+            status, _, headers, _ = response
+            if status == 401 and not refreshed and not isinstance(self.token, str):
+                self.token.refresh(stale_token=access_token)
+                refreshed = True
+                continue
+            if status in rate_limit.RETRY_STATUSES and attempt <= self.limiter.max_retries:
+                retry_after = rate_limit.parse_retry_after(header(headers, 'Retry-After'))
+                self.limiter.backoff('api', attempt, retry_after, quota=status == 429)
+                continue
+            return response
+
+    def _send(self, method, path, query, access_token):
+        """
+        Send one request on this thread's connection.
+        A connection closed by the server while idle is reopened once.
+        """
+        url = self._path + path
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+        headers = {
+            'Authorization': f"Bearer {access_token}",
+            'Accept': 'application/json',
+        }
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.request(method, url, headers=headers)
+                res = conn.getresponse()
+                body = res.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError,
+                    http.client.CannotSendRequest, http.client.BadStatusLine):
+                self._drop_connection()
+                if attempt == 2:
+                    raise
+                continue
+            if res.getheader('Connection', '').lower() == 'close':
+                self._drop_connection()
+            return res.status, res.reason, dict(res.getheaders()), body
+
+    def get_json(self, path, query=None):
+        """GET a path below the API base and return the decoded JSON body."""
+        status, reason, headers, body = self.request('GET', path, query)
+        if not 200 <= status < 300:
+            raise ApiError(status, reason, body, headers)
+        return json.loads(body) if body else {}
+
+    def get_project(self, script_id):
+        """projects.get: project metadata including updateTime."""
+        return self.get_json(f"/projects/{urllib.parse.quote(script_id)}")
+
+    def get_content(self, script_id, version_number=None):
+        """projects.getContent: the project's files, at HEAD or at a numbered version."""
+        query = {'versionNumber': version_number} if version_number else None
+        return self.get_json(f"/projects/{urllib.parse.quote(script_id)}/content", query)
+
+    def iter_pages(self, path, key, query=None):
+        """
+        GET a paginated list and yield the items of each page in turn,
+        following nextPageToken, so callers can stop early.
+        """
+        query = dict(query or {})
+        while True:
+            page = self.get_json(path, query)
+            yield page.get(key, [])
+            token = page.get('nextPageToken')
+            if not token:
+                return
+            query['pageToken'] = token
+
+    def list_versions(self, script_id, newer_than=0, page_size=50):
+        """
+        projects.versions.list: the versions numbered above newer_than, in
+        ascending order. The API lists the newest versions first, so paging
+        stops at the first page that reaches an already known version.
+        """
+        found = []
+        path = f"/projects/{urllib.parse.quote(script_id)}/versions"
+        for page in self.iter_pages(path, 'versions', {'pageSize': page_size}):
+            numbers = [v.get('versionNumber', 0) for v in page]
+            found.extend(v for v in page if v.get('versionNumber', 0) > newer_than)
+            # Only trust the early stop when the page really is newest-first.
+            if numbers and min(numbers) <= newer_than and numbers == sorted(numbers, reverse=True):
+                break
+        return sorted(found, key=lambda v: v['versionNumber'])
+
+    def list_deployments(self, script_id, page_size=50):
+        """projects.deployments.list: every deployment of the project."""
+        path = f"/projects/{urllib.parse.quote(script_id)}/deployments"
+        deployments = []
+        for page in self.iter_pages(path, 'deployments', {'pageSize': page_size}):
+            deployments.extend(page)
+        return deployments
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+
+
+def fetch_update_times(client, script_ids, jobs=8, tracer=None):
+    """
+    Fetch updateTime for every scriptId concurrently.
+    Returns a dict with an entry for every requested scriptId; the value is
+    None when the metadata could not be fetched. With a sync_trace.Tracer,
+    each check is recorded as a 'freshness' span.
+    """
+    def fetch(script_id):
+        try:
+            if tracer is None:
+                return script_id, client.get_project(script_id).get('updateTime')
+            with tracer.span(script_id, 'freshness'):
+                return script_id, client.get_project(script_id).get('updateTime')
+        except Exception as e:
+            print(f"Error fetching metadata for {script_id}: {e}", file=sys.stderr)
+            return script_id, None
+
+    script_ids = list(dict.fromkeys(script_ids))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return dict(executor.map(fetch, script_ids))
+
+
+def local_file_name(file, clasp_config=None):
+    """
+    Map an API file entry ({"name", "type", ...}) to the path clasp pull would
+    write it to, relative to the project directory.
+    """
+    clasp_config = clasp_config or {}
+    script_ext = clasp_config.get('fileExtension')
+    if not script_ext and clasp_config.get('scriptExtensions'):
+        script_ext = clasp_config['scriptExtensions'][0]
+    script_ext = (script_ext or 'js').lstrip('.')
+    html_ext = 'html'
+    if clasp_config.get('htmlExtensions'):
+        html_ext = clasp_config['htmlExtensions'][0].lstrip('.')
+    ext = {'SERVER_JS': script_ext, 'HTML': html_ext, 'JSON': 'json'}.get(file.get('type'))
+    if ext is None:
+        raise ValueError(f"unknown file type {file.get('type')!r} for {file.get('name')!r}")
+    root_dir = clasp_config.get('rootDir') or '.'
+    return os.path.normpath(os.path.join(root_dir, f"{file['name']}.{ext}"))
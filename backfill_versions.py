@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+backfill_versions.py
+
+Archive the contents of every numbered version listed in the projects'
+versions.json, which clasp-pull.py does not keep (it only pulls HEAD).
+
+Each missing version costs one projects.getContent?versionNumber=N request;
+the requests for all projects run on a shared pool of --jobs workers. Files
+go into a content-addressed blob store, so a file that is identical across
+versions or projects is stored once:
+
+  version-archive/blobs/ab/cdef...        the file's source, named by its sha256
+  version-archive/<scriptId>/<N>.json     {"scriptId", "versionNumber", "description",
+                                           "files": [{"name", "type", "path", "sha256", "size"}]}
+
+A version's manifest is written after its blobs, so a version whose manifest
+exists is complete and is skipped on the next run.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import importlib
+import json
+import os
+import sys
+import threading
+
+import apps_script_api
+import fsutil
+import rate_limit
+import sync_trace
+import token_manager
+import workspace
+
+clasp_pull = importlib.import_module('clasp-pull')
+
+ARCHIVE_DIR = 'version-archive'
+
+
+class BlobStore:
+    """Files stored once per content under blobs/<first 2 hex digits>/<rest of the sha256>."""
+
+    def __init__(self, root):
+        self.root = os.path.join(root, 'blobs')
+        self._lock = threading.Lock()
+        self._stored = set()
+        self.written = 0
+        self.reused = 0
+        self.bytes_written = 0
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, data):
+        """Store data unless a blob with the same hash exists. Returns the sha256."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            with self._lock:
+                self.reused += 1
+            return digest
+        # Two workers may store the same new content at once; both writes are
+        # atomic and identical, but it is only counted once.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fsutil.atomic_write(path, data)
+        with self._lock:
+            if digest not in self._stored:
+                self._stored.add(digest)
+                self.written += 1
+                self.bytes_written += len(data)
+        return digest
+
+    def get(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+
+def manifest_path(archive_dir, script_id, version_number):
+    return os.path.join(archive_dir, script_id, f"{version_number}.json")
+
+
+def load_clasp_config(project_dir):
+    try:
+        with open(os.path.join(project_dir, '.clasp.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def archive_version(client, store, archive_dir, script_id, version, clasp_config, tracer):
+    """Fetch one version's files into the blob store and write its manifest."""
+    number = version['version']
+    with tracer.span(script_id, 'backfill', version=number) as span:
+        content = client.get_content(script_id, number)
+        files = []
+        size = 0
+        for file in content.get('files', []):
+            data = (file.get('source') or '').encode('utf-8')
+            try:
+                path = apps_script_api.local_file_name(file, clasp_config).replace(os.sep, '/')
+            except ValueError:
+                path = None
+            files.append({'name': file.get('name'), 'type': file.get('type'), 'path': path,
+                          'sha256': store.put(data), 'size': len(data)})
+            size += len(data)
+        span['bytes'] = size
+        manifest = {
+            'scriptId': script_id,
+            'versionNumber': number,
+            'description': version.get('description'),
+            'files': files,
+        }
+        path = manifest_path(archive_dir, script_id, number)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fsutil.atomic_write(path, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+    return len(files)
+
+
+def missing_versions(projects, archive_dir):
+    """(script_id, project_dir, version entry) for every listed version without a manifest, and the count of archived ones."""
+    tasks = []
+    archived = 0
+    for _, project_dir, script_id in projects:
+        if not script_id:
+            continue
+        for version in clasp_pull.load_versions(project_dir):
+            if os.path.exists(manifest_path(archive_dir, script_id, version['version'])):
+                archived += 1
+            else:
+                tasks.append((script_id, project_dir, version))
+    return tasks, archived
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive the contents of every numbered version of the projects.')
+    parser.add_argument('script_ids', nargs='*', help='Only backfill these scriptIds (default: every project).')
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help=f'Archive directory (default: {ARCHIVE_DIR}).')
+    parser.add_argument('--jobs', '-j', type=int, default=8,
+                        help='Maximum number of versions fetched at the same time (default: 8).')
+    parser.add_argument('--shard', type=workspace.parse_shard,
+                        help='Only backfill the projects of shard i of N (e.g. 0/4).')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the versions that would be fetched.')
+    parser.add_argument('--api-base', help='Apps Script API base URL (default: $APPS_SCRIPT_API_BASE or '
+                                           f'{apps_script_api.DEFAULT_API_BASE}).')
+    parser.add_argument('--api-per-minute', type=float, default=float(os.environ.get('API_PER_MINUTE') or 0),
+                        help='Budget of API requests per minute (default: $API_PER_MINUTE or 0 = unlimited).')
+    parser.add_argument('--token-endpoint', help='OAuth token endpoint used to refresh credentials.')
+    parser.add_argument('--trace', help=f'Append timing spans to this JSONL file; empty to disable '
+                                        f'(default: $SYNC_TRACE or {sync_trace.DEFAULT_TRACE_PATH}).')
+    args = parser.parse_args()
+
+    projects = workspace.load_index().projects(args.shard)
+    if args.script_ids:
+        wanted = set(args.script_ids)
+        projects = [p for p in projects if p[2] in wanted]
+    tasks, archived = missing_versions(projects, args.archive_dir)
+    print(f"{len(tasks)} version(s) to fetch; {archived} already archived.")
+    if args.dry_run:
+        for script_id, _, version in tasks:
+            print(f"  {script_id} version {version['version']}")
+        return
+    if not tasks:
+        return
+
+    tokens = token_manager.TokenManager(token_endpoint=args.token_endpoint)
+    if not tokens.get_token():
+        print("Error: no access token in .clasprc.json; cannot call the Apps Script API.", file=sys.stderr)
+        sys.exit(1)
+    rate_limit.limiter.configure(api_per_minute=args.api_per_minute)
+    client = apps_script_api.ApiClient(tokens, args.api_base)
+    tracer = sync_trace.Tracer(args.trace, script='backfill_versions')
+    store = BlobStore(args.archive_dir)
+    configs = {project_dir: load_clasp_config(project_dir) for _, project_dir, _ in tasks}
+
+    def run(task):
+        script_id, project_dir, version = task
+        try:
+            count = archive_version(client, store, args.archive_dir, script_id, version, configs[project_dir], tracer)
+            return task, count, None
+        except Exception as e:
+            return task, 0, e
+
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.jobs)) as executor:
+        for (script_id, _, version), count, error in executor.map(run, tasks):
+            if error:
+                failed += 1
+                print(f"  FAILED {script_id} version {version['version']}: {error}", file=sys.stderr)
+            else:
+                print(f"  {script_id} version {version['version']}: {count} file(s)")
+    client.close()
+    rate_limit.limiter.record(tracer)
+    tracer.close()
+
+    print(f"Archived {len(tasks) - failed} version(s), {failed} failed. "
+          f"Blobs: {store.written} new ({store.bytes_written} bytes), {store.reused} reused.")
+    print(rate_limit.limiter.summary())
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
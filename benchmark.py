@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+
+End-to-end benchmark of the sync pipeline without touching Google.
+
+Builds a synthetic workspace with --projects project directories (each with a
+.clasp.json, a few source files and a metadata.json), a matching
+clasp-list.txt and gas-project-finder.json, a stub `clasp` executable and a
+local HTTP stand-in for script.googleapis.com and the OAuth token endpoint.
+Both stubs have configurable latency and failure rates.
+
+It then runs parse_clasp_list.py, create_missing_scriptid_dirs.py,
+clasp-pull.py and manifest.py against that workspace, in that order, and
+reports for each script: wall time, number of clasp subprocesses, number of
+HTTP requests and peak RSS of the script's process.
+
+Example:
+  python3 benchmark.py --projects 1000 --api-latency-ms 50 --jobs 8 --runs 2
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPTS = {
+    'parse_clasp_list': ['parse_clasp_list.py'],
+    'create_missing_scriptid_dirs': ['create_missing_scriptid_dirs.py', 'clasp-list.txt'],
+    'clasp-pull': ['clasp-pull.py'],
+    'manifest': ['manifest.py'],
+}
+
+# Stub clasp. Latency, failure rate and the call log come from the environment.
+FAKE_CLASP = r'''#!/usr/bin/env python3
+import os, random, sys, time
+with open(os.environ['FAKE_CLASP_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\n')
+time.sleep(float(os.environ.get('FAKE_CLASP_LATENCY', '0')))
+cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+if cmd == '-v':
+    print('0.0.0-benchmark')
+    sys.exit(0)
+if random.random() < float(os.environ.get('FAKE_CLASP_FAILURE_RATE', '0')):
+    print('Error: simulated failure (503 backendError)', file=sys.stderr)
+    sys.exit(1)
+if cmd == 'pull':
+    with open('Code.js', 'w') as f:
+        f.write('function main() {\n  Logger.log("pulled");\n}\n')
+    print('Cloned 2 files.')
+elif cmd == 'deployments':
+    print('Found 1 deployment.')
+    print('- AKfycbBenchmarkHead @HEAD')
+elif cmd == 'versions':
+    print('Found 2 versions.')
+    print('2 - second')
+    print('1 - first')
+elif cmd == 'list':
+    with open(os.environ['FAKE_CLASP_LIST']) as f:
+        sys.stdout.write(f.read())
+'''
+
+
+def script_id_for(i):
+    """A deterministic, scriptId-shaped identifier."""
+    rng = random.Random(i)
+    alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789_-'
+    return '1' + ''.join(rng.choice(alphabet) for _ in range(56))
+
+
+class FakeApi:
+    """
+    Local stand-in for the Apps Script API and the OAuth token endpoint.
+    Projects are served from the catalog dict {scriptId: updateTime}.
+    """
+
+    def __init__(self, catalog, latency=0.0, failure_rate=0.0, seed=0):
+        self.catalog = catalog
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = set()
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.connections = set()
+
+    def _fail(self):
+        with self.lock:
+            return self.rng.random() < self.failure_rate
+
+    def _handler(self):
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _begin(self):
+                with api.lock:
+                    api.requests += 1
+                    api.connections.add(self.client_address)
+                if api.latency:
+                    time.sleep(api.latency)
+                if api._fail():
+                    self._send_json(503, {'error': {'code': 503, 'status': 'UNAVAILABLE'}})
+                    return False
+                return True
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if not self._begin():
+                    return
+                if self.path.rstrip('/').endswith('/token'):
+                    self._send_json(200, {'access_token': 'benchmark-token', 'expires_in': 3600})
+                else:
+                    self._send_json(404, {'error': {'code': 404}})
+
+            def do_GET(self):
+                if not self._begin():
+                    return
+                m = re.match(r'^/v1/projects/([^/?]+)(/[a-z]+)?(?:\?.*)?$', self.path)
+                script_id = m and m.group(1)
+                if not m or script_id not in api.catalog:
+                    self._send_json(404, {'error': {'code': 404, 'status': 'NOT_FOUND'}})
+                    return
+                sub = m.group(2)
+                if sub is None:
+                    self._send_json(200, {'scriptId': script_id, 'title': script_id[:8],
+                                          'updateTime': api.catalog[script_id]})
+                elif sub == '/content':
+                    self._send_json(200, {'scriptId': script_id, 'files': [
+                        {'name': 'appsscript', 'type': 'JSON',
+                         'source': '{\n  "timeZone": "Asia/Tokyo",\n  "runtimeVersion": "V8"\n}'},
+                        {'name': 'Code', 'type': 'SERVER_JS',
+                         'source': 'function main() {\n  Logger.log("pulled");\n}\n'},
+                    ]})
+                elif sub == '/versions':
+                    self._send_json(200, {'versions': [
+                        {'versionNumber': 2, 'description': 'second'},
+                        {'versionNumber': 1, 'description': 'first'},
+                    ]})
+                elif sub == '/deployments':
+                    self._send_json(200, {'deployments': [
+                        {'deploymentId': 'AKfycbBenchmarkHead',
+                         'deploymentConfig': {'scriptId': script_id, 'description': ''}},
+                    ]})
+                else:
+                    self._send_json(404, {'error': {'code': 404}})
+
+        return Handler
+
+
+def build_workspace(root, projects, changed_rate, missing_rate, seed=0):
+    """
+    Create the synthetic workspace. Returns the API catalog {scriptId: updateTime}.
+    changed_rate of the projects have a remote updateTime newer than the local
+    one; missing_rate of the listed projects have no directory yet.
+    """
+    rng = random.Random(seed)
+    catalog = {}
+    finder = []
+    list_lines = [f"Found {projects} scripts."]
+    for i in range(projects):
+        script_id = script_id_for(i)
+        local_time = '2024-01-01T00:00:00.000Z'
+        changed = rng.random() < changed_rate
+        catalog[script_id] = '2025-06-01T00:00:00.000Z' if changed else local_time
+        name = f"Project {i:05d}"
+        list_lines.append(f"{name} - https://script.google.com/d/{script_id}/edit")
+        finder.append({
+            'name': name,
+            'id': script_id,
+            'url': f"https://script.google.com/d/{script_id}/edit?usp=drivesdk",
+            'lastUpdated': catalog[script_id],
+        })
+        if rng.random() < missing_rate:
+            continue
+        project_dir = os.path.join(root, script_id)
+        os.makedirs(project_dir)
+        with open(os.path.join(project_dir, '.clasp.json'), 'w') as f:
+            json.dump({'scriptId': script_id}, f, indent=2)
+        with open(os.path.join(project_dir, 'Code.js'), 'w') as f:
+            f.write(f"function main() {{\n  Logger.log({i});\n}}\n")
+        with open(os.path.join(project_dir, 'appsscript.json'), 'w') as f:
+            f.write('{\n  "timeZone": "Asia/Tokyo",\n  "runtimeVersion": "V8"\n}')
+        with open(os.path.join(project_dir, 'metadata.json'), 'w') as f:
+            json.dump({'id': script_id, 'lastUpdated': local_time}, f, indent=2)
+    with open(os.path.join(root, 'clasp-list.txt'), 'w') as f:
+        f.write('\n'.join(list_lines) + '\n')
+    with open(os.path.join(root, 'gas-project-finder.json'), 'w') as f:
+        json.dump(finder, f, ensure_ascii=False, indent=2)
+    return catalog
+
+
+def install_fake_clasp(bin_dir):
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 'clasp')
+    with open(path, 'w') as f:
+        f.write(FAKE_CLASP)
+    os.chmod(path, 0o755)
+
+
+def run_script(name, workspace, env, api, clasp_log, extra_args):
+    """Run one script in the workspace and return its measurements."""
+    argv = [sys.executable, os.path.join(REPO_DIR, SCRIPTS[name][0])] + SCRIPTS[name][1:] + extra_args
+    open(clasp_log, 'w').close()
+    api.reset_counters()
+    log_path = os.path.join(workspace, f".benchmark-{name}.log")
+    start = time.perf_counter()
+    with open(log_path, 'w') as out:
+        proc = subprocess.Popen(argv, cwd=workspace, env=env, stdout=out, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    with open(clasp_log) as f:
+        clasp_calls = sum(1 for _ in f)
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    peak_rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+    return {
+        'script': name,
+        'exit': proc.returncode,
+        'wall_s': round(elapsed, 3),
+        'subprocesses': clasp_calls,
+        'http_requests': api.requests,
+        'http_connections': len(api.connections),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        'log': log_path,
+    }
+
+
+def print_table(results):
+    header = f"{'run':>3}  {'script':<30} {'exit':>4} {'wall_s':>8} {'clasp':>6} {'http':>6} {'conns':>6} {'rss_mb':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['run']:>3}  {r['script']:<30} {r['exit']:>4} {r['wall_s']:>8.3f} "
+              f"{r['subprocesses']:>6} {r['http_requests']:>6} {r['http_connections']:>6} {r['peak_rss_mb']:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sync pipeline against local stubs.')
+    parser.add_argument('--projects', type=int, default=100, help='Number of synthetic projects (default: 100).')
+    parser.add_argument('--changed-rate', type=float, default=0.1,
+                        help='Fraction of projects whose remote copy is newer (default: 0.1).')
+    parser.add_argument('--missing-rate', type=float, default=0.02,
+                        help='Fraction of listed projects without a directory (default: 0.02).')
+    parser.add_argument('--api-latency-ms', type=float, default=20, help='Latency of every HTTP response.')
+    parser.add_argument('--api-failure-rate', type=float, default=0.0, help='Fraction of HTTP requests answered 503.')
+    parser.add_argument('--clasp-latency-ms', type=float, default=300,
+                        help='Latency of every stub clasp call, standing in for Node startup (default: 300).')
+    parser.add_argument('--clasp-failure-rate', type=float, default=0.0, help='Fraction of clasp calls that fail.')
+    parser.add_argument('--scripts', default=','.join(SCRIPTS),
+                        help=f"Comma-separated scripts to run, in order (default: {','.join(SCRIPTS)}).")
+    parser.add_argument('--runs', type=int, default=1,
+                        help='Run the pipeline this many times on the same workspace (warm runs show caching).')
+    parser.add_argument('--clasp-pull-args', default='',
+                        help='Extra arguments for clasp-pull.py, e.g. "--jobs 8".')
+    parser.add_argument('--workspace', help='Build the workspace here instead of a temporary directory.')
+    parser.add_argument('--keep', action='store_true', help='Keep the workspace afterwards.')
+    parser.add_argument('--json', help='Also write the results as JSON to this file.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.scripts.split(',') if n.strip()]
+    unknown = [n for n in names if n not in SCRIPTS]
+    if unknown:
+        parser.error(f"unknown scripts: {', '.join(unknown)}")
+
+    root = args.workspace or tempfile.mkdtemp(prefix='gas-benchmark-')
+    workspace = os.path.join(root, 'workspace')
+    home = os.path.join(root, 'home')
+    bin_dir = os.path.join(root, 'bin')
+    clasp_log = os.path.join(root, 'clasp-calls.log')
+    os.makedirs(workspace)
+    os.makedirs(home)
+
+    print(f"Building {args.projects} projects in {workspace}...")
+    catalog = build_workspace(workspace, args.projects, args.changed_rate, args.missing_rate, args.seed)
+    install_fake_clasp(bin_dir)
+    api = FakeApi(catalog, args.api_latency_ms / 1000, args.api_failure_rate, args.seed).start()
+    with open(os.path.join(home, '.clasprc.json'), 'w') as f:
+        json.dump({
+            'token': {'access_token': 'benchmark-token', 'refresh_token': 'benchmark-refresh',
+                      'expiry_date': int((time.time() + 3600) * 1000)},
+            'oauth2ClientSettings': {'clientId': 'benchmark', 'clientSecret': 'benchmark'},
+        }, f)
+
+    env = dict(os.environ)
+    env.update({
+        'HOME': home,
+        'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+        'APPS_SCRIPT_API_BASE': api.base_url + '/v1',
+        'OAUTH_TOKEN_ENDPOINT': api.base_url + '/token',
+        'FAKE_CLASP_LOG': clasp_log,
+        'FAKE_CLASP_LIST': os.path.join(workspace, 'clasp-list.txt'),
+        'FAKE_CLASP_LATENCY': str(args.clasp_latency_ms / 1000),
+        'FAKE_CLASP_FAILURE_RATE': str(args.clasp_failure_rate),
+        'PYTHONDONTWRITEBYTECODE': '1',
+    })
+    env.pop('SYNC_STATE_DB', None)
+
+    results = []
+    try:
+        for run in range(1, args.runs + 1):
+            for name in names:
+                extra = args.clasp_pull_args.split() if name == 'clasp-pull' else []
+                result = run_script(name, workspace, env, api, clasp_log, extra)
+                result['run'] = run
+                results.append(result)
+    finally:
+        api.stop()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+    if args.keep or args.workspace:
+        print(f"Workspace kept at {root}")
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+    if any(r['exit'] != 0 for r in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+catalog.py
+
+Build the consolidated project catalog that index.html and find.html load
+instead of clasp-list.json plus one README.md per project.
+
+Projects are split into a fixed number of shards by workspace.shard_of(), and
+each shard is written once per content as
+
+  catalog/catalog-NN.<hash>.json     [{"id", "name", "directory", "url",
+  catalog/catalog-NN.<hash>.json.gz    "lastUpdated", "deployments",
+  catalog/catalog-NN.<hash>.json.br    "versionCount", "readme", "files"}, ...]
+
+where <hash> is the first 12 hex digits of the sha256 of the JSON bytes, so
+the files can be cached forever. catalog/index.json is the only mutable file:
+it lists the current shard file names and is small enough to revalidate on
+every load. The .gz copy is always written; the .br copy only when the
+optional brotli module is installed. Shard files that are no longer listed
+are deleted.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+
+import fsutil
+import workspace
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_DIR = 'catalog'
+CATALOG_VERSION = 1
+DEFAULT_SHARDS = 4
+EXCERPT_LENGTH = 300
+
+
+def load_json(path, default=None):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def readme_excerpt(project_dir, limit=EXCERPT_LENGTH):
+    """First paragraph of the project's README.md below the headings, or None."""
+    try:
+        with open(os.path.join(project_dir, 'README.md'), 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return None
+    paragraph = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('#') or (not line and not paragraph):
+            continue
+        if not line:
+            break
+        paragraph.append(line)
+    excerpt = ' '.join(paragraph)
+    if len(excerpt) > limit:
+        excerpt = excerpt[:limit - 1].rstrip() + '…'
+    return excerpt or None
+
+
+def deployments_summary(project_dir):
+    """Count of versioned deployments and the newest one, from deployments.json."""
+    deployments = load_json(os.path.join(project_dir, 'deployments.json'), [])
+    versioned = [d for d in deployments if isinstance(d, dict) and str(d.get('target', '')).isdigit()]
+    summary = {'count': len(versioned), 'latest': None}
+    if versioned:
+        latest = max(versioned, key=lambda d: int(d['target']))
+        summary['latest'] = {'id': latest.get('id'), 'version': int(latest['target']),
+                             'description': latest.get('description') or ''}
+    return summary
+
+
+def project_files(project_dir):
+    """Relative paths of the project's files (hidden files and directories excluded), sorted."""
+    paths = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if not name.startswith('.'):
+                paths.append(os.path.relpath(os.path.join(root, name), project_dir).replace(os.sep, '/'))
+    return sorted(paths)
+
+
+def catalog_entry(directory, project_dir, script_id, finder_entry, list_name):
+    versions = load_json(os.path.join(project_dir, 'versions.json'), [])
+    return {
+        'id': script_id,
+        'name': finder_entry.get('name') or list_name or directory,
+        'directory': directory,
+        'url': finder_entry.get('url'),
+        'lastUpdated': finder_entry.get('lastUpdated'),
+        'deployments': deployments_summary(project_dir),
+        'versionCount': len(versions) if isinstance(versions, list) else 0,
+        'readme': readme_excerpt(project_dir),
+        'files': project_files(project_dir),
+    }
+
+
+def previous_entries(catalog_dir):
+    """scriptId -> entry of the catalog currently listed in catalog_dir/index.json ({} if none)."""
+    index = load_json(os.path.join(catalog_dir, 'index.json'), {})
+    if index.get('version') != CATALOG_VERSION:
+        return {}
+    previous = {}
+    for shard in index.get('shards', []):
+        for entry in load_json(os.path.join(catalog_dir, shard['file']), []):
+            previous[entry['id']] = entry
+    return previous
+
+
+def build(catalog_dir=CATALOG_DIR, shards=DEFAULT_SHARDS, only=None):
+    """
+    Write the catalog into catalog_dir. With only (a set of scriptIds), the
+    other projects keep their entries from the current catalog instead of
+    being read again. Returns the list of paths that were written or deleted.
+    """
+    os.makedirs(catalog_dir, exist_ok=True)
+    finder = {e['id']: e for e in load_json('gas-project-finder.json', []) if isinstance(e, dict) and 'id' in e}
+    listed = {e['id']: e.get('name') for e in load_json('clasp-list.json', []) if isinstance(e, dict) and 'id' in e}
+    previous = previous_entries(catalog_dir) if only is not None else {}
+
+    entries = [[] for _ in range(shards)]
+    for directory, project_dir, script_id in workspace.load_index().projects():
+        if not script_id:
+            continue
+        entry = previous.get(script_id)
+        if not entry or script_id in only or entry.get('directory') != directory:
+            entry = catalog_entry(directory, project_dir, script_id, finder.get(script_id, {}), listed.get(script_id))
+        entries[workspace.shard_of(script_id, shards)].append(entry)
+
+    written = []
+    keep = {'index.json'}
+    index = {'version': CATALOG_VERSION, 'shards': []}
+    for n, shard in enumerate(entries):
+        shard.sort(key=lambda e: e['name'].lower())
+        data = json.dumps(shard, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        name = f"catalog-{n:02d}.{hashlib.sha256(data).hexdigest()[:12]}.json"
+        copies = {name: data, name + '.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            copies[name + '.br'] = brotli.compress(data)
+        for file_name, content in copies.items():
+            keep.add(file_name)
+            # Hashed names are immutable, so an existing file is never rewritten.
+            path = os.path.join(catalog_dir, file_name)
+            if not os.path.exists(path):
+                fsutil.atomic_write(path, content)
+                written.append(path)
+        index['shards'].append({'file': name, 'projects': len(shard), 'bytes': len(data)})
+
+    index_path = os.path.join(catalog_dir, 'index.json')
+    if fsutil.write_if_changed(index_path, json.dumps(index, ensure_ascii=False, indent=1)):
+        written.append(index_path)
+    for name in sorted(os.listdir(catalog_dir)):
+        if re.match(r'^catalog-\d+\.[0-9a-f]+\.json', name) and name not in keep:
+            os.remove(os.path.join(catalog_dir, name))
+            written.append(os.path.join(catalog_dir, name))
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the consolidated project catalog for the static site.')
+    parser.add_argument('--catalog-dir', default=CATALOG_DIR, help=f'Output directory (default: {CATALOG_DIR}).')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                        help=f'Number of catalog shards (default: {DEFAULT_SHARDS}).')
+    parser.add_argument('--changed-paths', help='Append the paths of written or deleted files to this file.')
+    args = parser.parse_args()
+
+    if brotli is None:
+        print("brotli module not installed; writing gzip copies only.")
+    written = build(args.catalog_dir, args.shards)
+    print(f"{len(written)} catalog file(s) changed.")
+    for path in written:
+        print(f"  {path}")
+    if args.changed_paths:
+        with open(args.changed_paths, 'a', encoding='utf-8') as f:
+            f.writelines(os.path.relpath(path) + '\n' for path in written)
+
+
+if __name__ == '__main__':
+    main()
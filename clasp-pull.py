@@ -4,17 +4,54 @@ clasp-pull.py
 
 Iterate over all immediate subdirectories of the current working directory.
 For each subdirectory containing a .clasp.json file, check if update is needed.
-If needed, change into that directory and execute `clasp pull`, then fetch and save 
-deployments and versions.
+If needed, download its sources (via the Apps Script API, or `clasp pull` as a
+fallback) and fetch and save deployments and versions. With --jobs N, up to N
+projects are synced in parallel; each project's output is buffered and printed
+in one block, and a summary is printed at the end.
+
+Every file is written through fsutil.write_if_changed, so unchanged files keep
+their bytes and mtime; `clasp pull` runs in a hidden staging directory whose
+files are then copied over the same way. With --changed-paths, the paths that
+actually changed are written to a file for the commit step to stage.
+
+Whether a project needs a pull is decided against the sync-state store
+(sync_state.py), which also records the result of every pull.
+
+With --time-budget SECONDS, projects are started in priority order (see
+prioritize()) and no project is started once the remaining budget is shorter
+than the longest project of the run so far; those are reported as deferred.
+The round-robin position among the quiet projects is saved in the state
+store, so the next run continues where this one stopped.
+
+The freshness check starts with the local gas-project-finder.json snapshot: a
+project whose finder lastUpdated is not newer than its last sync is skipped
+without any request. Only the remaining projects (changed, unknown to the
+finder, or never synced) are checked through the API. If the snapshot is older
+than --finder-max-age hours (counted from the fetch recorded in the state store,
+or else from its last commit), every project is checked live.
 """
+import argparse
+import concurrent.futures
+import datetime
+import hashlib
 import os
 import subprocess
 import sys
 import json
 import re
-import urllib.request
-import urllib.error
+import shutil
+import tempfile
 import time
+import threading
+
+import apps_script_api
+import clasp_watchdog
+import rate_limit
+import fsutil
+import sync_state
+import sync_trace
+import token_manager
+import workspace
 
 def parse_deployments(raw_text):
     """
@@ -52,240 +89,843 @@ def parse_versions(raw_text):
             })
     return versions
 
-def refresh_clasp_token():
-    """Run `clasp list` to force token refresh."""
-    print("Refreshing clasp token via `clasp list`...")
+def load_finder_times(path='gas-project-finder.json'):
+    """scriptId -> lastUpdated from the GAS Project Finder snapshot ({} if missing)."""
     try:
-        subprocess.run('clasp list', shell=True, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    except subprocess.CalledProcessError:
-        print("Warning: `clasp list` failed. Token might be invalid.", file=sys.stderr)
+        with open(path, 'r', encoding='utf-8') as f:
+            finder = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return {e['id']: e.get('lastUpdated') for e in finder if isinstance(e, dict) and 'id' in e}
 
-def get_access_token():
-    """Read access token from ~/.clasprc.json"""
-    rc_path = os.path.expanduser('~/.clasprc.json')
-    print(f"Debug: Checking for credentials at {rc_path}", file=sys.stderr)
 
-    if not os.path.exists(rc_path):
-        print(f"Debug: File {rc_path} does not exist.", file=sys.stderr)
-        return None
+# Sync-state meta key of the last successful finder fetch: {"time", "sha256"}.
+FINDER_FETCHED_KEY = 'finder_fetched'
+
+
+def file_sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def record_finder_fetch(state, path='gas-project-finder.json'):
+    """Note in the sync state that the finder snapshot at path was fetched just now."""
+    state.set_meta(FINDER_FETCHED_KEY, {'time': sync_state.utc_now(), 'sha256': file_sha256(path)})
 
+
+def finder_snapshot_age(path, state=None):
+    """
+    Seconds since the finder snapshot was fetched. The fetch time recorded in
+    the sync state (see record_finder_fetch) is used while the file still has
+    the recorded content. Otherwise the age of its last commit, or of its
+    mtime when it has uncommitted changes or is not tracked. None if there is
+    no snapshot. reconcile.py does not ask: it fetched the snapshot itself.
+    """
+    if not os.path.exists(path):
+        return None
+    fetched = state.get_meta(FINDER_FETCHED_KEY) if state else None
+    if isinstance(fetched, dict) and fetched.get('sha256') == file_sha256(path):
+        when = datetime.datetime.strptime(fetched['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
+        when = when.replace(tzinfo=datetime.timezone.utc)
+        return max(0.0, time.time() - when.timestamp())
+    stamp = None
     try:
-        with open(rc_path, 'r') as f:
-            content = f.read()
-            if not content.strip():
-                print("Debug: .clasprc.json is empty.", file=sys.stderr)
-                return None
-            data = json.loads(content)
-        
-        # Log top-level keys safely
-        print(f"Debug: .clasprc.json top-level keys: {list(data.keys())}", file=sys.stderr)
-
-        # Try to find 'access_token' in common structures
-        access_token_found = None
-        if 'token' in data and isinstance(data['token'], dict) and 'access_token' in data['token']:
-            access_token_found = data['token']['access_token']
-            print(f"Debug: 'access_token' found inside 'token' object.", file=sys.stderr)
-        elif 'access_token' in data:
-            access_token_found = data['access_token']
-            print(f"Debug: 'access_token' found at root level.", file=sys.stderr)
-        elif 'tokens' in data and isinstance(data['tokens'], dict):
-            print(f"Debug: Top-level 'tokens' key found. Iterating through values.", file=sys.stderr)
-            for key, token_data in data['tokens'].items():
-                if isinstance(token_data, dict) and 'access_token' in token_data:
-                    access_token_found = token_data['access_token']
-                    print(f"Debug: 'access_token' found in tokens['{key}'] object.", file=sys.stderr)
-                    break
-            if not access_token_found:
-                print("Debug: No 'access_token' found within any token object under 'tokens'.", file=sys.stderr)
-        
-        if access_token_found:
-            return access_token_found
+        status = subprocess.run(['git', 'status', '--porcelain', '--', path],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        if not status:
+            out = subprocess.run(['git', 'log', '-1', '--format=%ct', '--', path],
+                                 capture_output=True, text=True, check=True).stdout.strip()
+            stamp = int(out) if out.isdigit() else None
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    if stamp is None:
+        stamp = os.path.getmtime(path)
+    return max(0.0, time.time() - stamp)
+
+
+def synced_time(record):
+    """The later of the recorded updateTime and the last pull ('' if never synced)."""
+    return max(record.get('remote_update_time') or '', record.get('last_pulled') or '')
+
+
+def finder_fresh_ids(script_ids, records, finder_times):
+    """
+    The scriptIds that the finder snapshot shows as unchanged since they were
+    last synced; these need no freshness request at all.
+    """
+    fresh = set()
+    for script_id in script_ids:
+        synced = synced_time(records.get(script_id) or {})
+        finder_time = finder_times.get(script_id)
+        if synced and finder_time and finder_time <= synced:
+            fresh.add(script_id)
+    return fresh
+
+
+def listed_projects(projects, records):
+    """
+    Drop the projects that have disappeared from the project listing
+    (deleted in Google, or no longer shared): pulling them can only fail.
+    """
+    delisted = [p for p in projects if (records.get(p[2]) or {}).get('delisted_time')]
+    if delisted:
+        print(f"Skipping {len(delisted)} project(s) no longer in the project listing.")
+        projects = [p for p in projects if p not in delisted]
+    return projects
+
+
+def prioritize(projects, records, finder_times, cursor=None):
+    """
+    Order projects for a time-budgeted run:
+      1. likely changed: never synced, or the finder's lastUpdated is newer
+         than both the recorded updateTime and the last pull (most recently
+         updated first);
+      2. failed last time (longest since the last pull first);
+      3. everything else, by scriptId, rotated to start at cursor.
+    Returns (ordered projects, the projects of the third group in order).
+    """
+    hot, failed, cold = [], [], []
+    for project in projects:
+        script_id = project[2]
+        record = records.get(script_id) or {}
+        finder_time = finder_times.get(script_id)
+        synced = synced_time(record)
+        if not script_id or not synced or (finder_time and finder_time > synced):
+            hot.append(project)
+        elif record.get('last_error'):
+            failed.append(project)
         else:
-            print("Debug: Could not find 'access_token' in any expected location.", file=sys.stderr)
+            cold.append(project)
+    hot.sort(key=lambda p: finder_times.get(p[2]) or '', reverse=True)
+    failed.sort(key=lambda p: records[p[2]].get('last_pulled') or '')
+    cold.sort(key=lambda p: p[2])
+    if cursor:
+        start = next((i for i, p in enumerate(cold) if p[2] >= cursor), 0)
+        cold = cold[start:] + cold[:start]
+    return hot + failed + cold, cold
 
-    except json.JSONDecodeError as e:
-        print(f"Error parsing .clasprc.json: {e}", file=sys.stderr)
-    except Exception as e:
-        print(f"Error reading .clasprc.json: {e}", file=sys.stderr)
-    return None
-
-def get_remote_update_time(script_id, access_token):
-    """Fetch updateTime from Apps Script API."""
-    url = f"https://script.googleapis.com/v1/projects/{script_id}"
-    req = urllib.request.Request(url)
-    req.add_header("Authorization", f"Bearer {access_token}")
-    try:
-        with urllib.request.urlopen(req) as res:
-            data = json.load(res)
-            return data.get('updateTime')
-    except Exception as e:
-        print(f"Error fetching metadata for {script_id}: {e}", file=sys.stderr)
-        return None
 
-def get_local_last_updated(project_dir):
-    meta_path = os.path.join(project_dir, 'metadata.json')
-    if os.path.exists(meta_path):
-        try:
-            with open(meta_path, 'r') as f:
-                data = json.load(f)
-            return data.get('lastUpdated')
-        except:
-            return None
-    return None
-
-def update_local_metadata(project_dir, update_time):
-    meta_path = os.path.join(project_dir, 'metadata.json')
-    data = {}
-    if os.path.exists(meta_path):
-        try:
-            with open(meta_path, 'r') as f:
-                data = json.load(f)
-        except:
-            pass
-    
-    data['lastUpdated'] = update_time
-    
-    with open(meta_path, 'w') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def deployment_entry(deployment):
+    """Map an API deployment resource to the entry parse_deployments() produces."""
+    config = deployment.get('deploymentConfig', {})
+    version = config.get('versionNumber')
+    return {
+        "id": deployment.get('deploymentId'),
+        "target": str(version) if version else 'HEAD',
+        "description": config.get('description') or ""
+    }
+
+
+def version_entry(version):
+    """Map an API version resource to the entry parse_versions() produces."""
+    return {
+        "version": int(version['versionNumber']),
+        "description": version.get('description') or 'No description'
+    }
 
-def run_clasp_with_retry(cmd, cwd=None, capture_output=False, retries=3):
+
+def format_deployments(deployments):
+    """Render deployments the way `clasp deployments` prints them."""
+    n = len(deployments)
+    lines = [f"Found {n} deployment{'' if n == 1 else 's'}."]
+    for d in deployments:
+        description = f"- {d['description']}" if d['description'] else ''
+        lines.append(f"- {d['id']} @{d['target']} {description}")
+    return '\n'.join(lines) + '\n'
+
+
+def format_versions(versions):
+    """Render versions the way `clasp versions` prints them."""
+    if not versions:
+        return ""
+    n = len(versions)
+    lines = [f"Found {n} version{'' if n == 1 else 's'}."]
+    lines.extend(f"{v['version']} - {v['description']}" for v in versions)
+    return '\n'.join(lines) + '\n'
+
+
+class ProjectLog:
     """
-    Run a clasp command with retries.
-    If it fails, try to refresh token via `clasp list` and retry.
+    Collect the output and timing spans of one project.
+    When buffered, lines are held back and written in one block by flush(),
+    so that projects synced in parallel do not interleave their logs.
     """
+    _lock = threading.Lock()
+
+    def __init__(self, buffered=False, project=None, tracer=None):
+        self.buffered = buffered
+        self.project = project
+        self.tracer = tracer or sync_trace.Tracer(path='')
+        self.lines = []
+
+    def span(self, phase, **fields):
+        """Trace a phase of this project (see sync_trace.Tracer.span)."""
+        return self.tracer.span(self.project, phase, **fields)
+
+    def print(self, *args, file=None):
+        if not self.buffered:
+            print(*args, file=file)
+            return
+        self.lines.append((file, ' '.join(str(a) for a in args)))
+
+    def flush(self):
+        with ProjectLog._lock:
+            for stream, text in self.lines:
+                print(text, file=stream or sys.stdout)
+            sys.stdout.flush()
+        self.lines = []
+
+
+def run_clasp_with_retry(cmd, cwd=None, capture_output=False, retries=3, log=None, tokens=None, span=None,
+                         hedgeable=False):
+    """
+    Run a clasp command with retries, within the shared clasp budget and
+    under the watchdog's deadline for this project and command.
+    Only a failure whose output looks like an authentication error refreshes
+    the shared token (through the token manager) before the retry; any other
+    failure, or a hang, backs off, and a quota error pauses every worker's
+    clasp runs. hedgeable marks read-only commands the watchdog may hedge.
+    If a trace span is given, its attempt number is kept up to date.
+    """
+    log = log or ProjectLog()
     attempt = 0
     while attempt < retries:
         attempt += 1
-        print(f"  Running: {cmd} (Attempt {attempt}/{retries})")
+        if span is not None:
+            span['attempt'] = attempt
+        waited = rate_limit.limiter.acquire('clasp')
+        if waited >= 1:
+            log.print(f"  Waited {waited:.1f}s for the clasp budget.")
+        log.print(f"  Running: {cmd} (Attempt {attempt}/{retries})")
+        stale_token = tokens.access_token if tokens else None
         
         try:
-            result = subprocess.run(
+            result = clasp_watchdog.watchdog.run(
                 cmd,
-                shell=True,
                 cwd=cwd,
-                check=True,
-                stdout=subprocess.PIPE if capture_output else None,
-                stderr=subprocess.PIPE if capture_output else None,
-                encoding='utf-8',
-                errors='replace'
+                capture_output=capture_output,
+                project=log.project,
+                hedgeable=hedgeable,
+                log=log,
+                before_hedge=lambda: rate_limit.limiter.acquire('clasp'),
             )
+            if result.returncode:
+                raise subprocess.CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
             return result
+        except subprocess.TimeoutExpired as e:
+            if span is not None:
+                span['hung'] = span.get('hung', 0) + 1
+            if attempt < retries:
+                delay = rate_limit.limiter.backoff('clasp', attempt)
+                log.print(f"    Backing off {delay:.1f}s before retrying.", file=sys.stderr)
+            else:
+                raise e
         except subprocess.CalledProcessError as e:
-            print(f"    Command failed with exit code {e.returncode}.", file=sys.stderr)
+            log.print(f"    Command failed with exit code {e.returncode}.", file=sys.stderr)
             if capture_output:
-                print(f"    Stdout: {e.stdout}", file=sys.stderr)
-                print(f"    Stderr: {e.stderr}", file=sys.stderr)
+                log.print(f"    Stdout: {e.stdout}", file=sys.stderr)
+                log.print(f"    Stderr: {e.stderr}", file=sys.stderr)
             
-            # If it's an auth error, try to refresh
-            # We suspect "Request is missing required authentication credential" or similar
             if attempt < retries:
-                print("    Attempting to refresh token via `clasp list`...", file=sys.stderr)
-                try:
-                    subprocess.run('clasp list', shell=True, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                except:
-                    pass
-                time.sleep(2)  # Wait a bit
+                output = f"{e.stdout or ''}\n{e.stderr or ''}"
+                if tokens and token_manager.is_auth_error(output):
+                    log.print("    Authentication error; refreshing token...", file=sys.stderr)
+                    tokens.refresh(stale_token=stale_token)
+                else:
+                    quota = rate_limit.is_rate_limit_error(output)
+                    delay = rate_limit.limiter.backoff('clasp', attempt, quota=quota)
+                    log.print(f"    {'Quota exceeded; b' if quota else 'B'}acking off {delay:.1f}s.", file=sys.stderr)
             else:
                 raise e
 
+
+def copy_if_changed(src_dir, dst_dir, changed):
+    """
+    Copy every file under src_dir to the same relative path under dst_dir,
+    skipping files whose bytes are already identical. Returns the bytes written.
+    """
+    written = 0
+    for root, _, files in os.walk(src_dir):
+        for name in files:
+            src = os.path.join(root, name)
+            rel_path = os.path.relpath(src, src_dir)
+            if rel_path == '.clasp.json':
+                continue
+            dst = os.path.join(dst_dir, rel_path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(src, 'rb') as f:
+                data = f.read()
+            if fsutil.write_if_changed(dst, data):
+                changed.append(os.path.relpath(dst))
+                written += len(data)
+    return written
+
+
+def pull_sources_with_clasp(project_dir, log, tokens=None, span=None, changed=None):
+    """
+    Run `clasp pull`, keeping its output in the project log. clasp rewrites
+    every file it pulls, so it runs in a hidden staging directory next to the
+    project's files (found first by clasp's upward .clasp.json search) and
+    only files whose bytes differ are moved into place.
+    Returns the number of bytes written.
+    """
+    changed = changed if changed is not None else []
+    with open(os.path.join(project_dir, '.clasp.json'), 'r', encoding='utf-8') as f:
+        clasp_config = json.load(f)
+    if os.path.isabs(clasp_config.get('rootDir') or ''):
+        # An absolute rootDir would make clasp bypass the staging directory.
+        proc = run_clasp_with_retry('clasp pull', cwd=project_dir, capture_output=True, log=log, tokens=tokens, span=span)
+        for line in proc.stdout.splitlines():
+            log.print(f"    {line}")
+        return None
+
+    staging = tempfile.mkdtemp(prefix='.clasp-pull-', dir=project_dir)
+    try:
+        shutil.copy2(os.path.join(project_dir, '.clasp.json'), staging)
+        proc = run_clasp_with_retry('clasp pull', cwd=staging, capture_output=True, log=log, tokens=tokens, span=span)
+        for line in proc.stdout.splitlines():
+            log.print(f"    {line}")
+        return copy_if_changed(staging, project_dir, changed)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def pull_sources_with_api(project_dir, script_id, client, log, changed=None):
+    """
+    Download the project's files with projects.getContent and write them
+    under the same names and extensions that `clasp pull` uses, skipping
+    files whose bytes are unchanged. Returns the number of bytes written.
+    """
+    changed = changed if changed is not None else []
+    with open(os.path.join(project_dir, '.clasp.json'), 'r', encoding='utf-8') as f:
+        clasp_config = json.load(f)
+    content = client.get_content(script_id)
+    files = content.get('files', [])
+    written = 0
+    for file in files:
+        rel_path = apps_script_api.local_file_name(file, clasp_config)
+        path = os.path.join(project_dir, rel_path)
+        if not os.path.abspath(path).startswith(os.path.abspath(project_dir) + os.sep):
+            raise ValueError(f"refusing to write outside the project: {rel_path}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = file.get('source', '').encode('utf-8')
+        if fsutil.write_if_changed(path, data):
+            changed.append(os.path.relpath(path))
+            written += len(data)
+    log.print(f"    Downloaded {len(files)} files via the Apps Script API.")
+    return written
+
+
+def pull_sources(project_dir, script_id, client, log, tokens=None, changed=None):
+    """Pull the sources via the API when possible, falling back to `clasp pull`."""
+    with log.span('pull') as span:
+        if client and script_id:
+            try:
+                span['via'] = 'api'
+                span['bytes'] = pull_sources_with_api(project_dir, script_id, client, log, changed)
+                return
+            except Exception as e:
+                log.print(f"    API download failed ({e}); falling back to `clasp pull`.", file=sys.stderr)
+        span['via'] = 'clasp'
+        span['bytes'] = pull_sources_with_clasp(project_dir, log, tokens, span, changed)
+
+
+def save_if_changed(path, data, changed):
+    """write_if_changed, recording the path in changed. Returns the bytes written."""
+    if fsutil.write_if_changed(path, data):
+        changed.append(os.path.relpath(path))
+        return len(data.encode('utf-8'))
+    return 0
+
+
+def fetch_deployments(project_dir, script_id, client, log, tokens=None, changed=None):
+    """
+    Save deployments.txt / deployments.json, listed through the API when a
+    client is given (falling back to `clasp deployments`). Like the sources,
+    deployments are only refreshed when the project's updateTime changed,
+    because sync_project is not called otherwise.
+    """
+    changed = changed if changed is not None else []
+    with log.span('deployments') as span:
+        deps = None
+        if client and script_id:
+            try:
+                span['via'] = 'api'
+                deps = [deployment_entry(d) for d in client.list_deployments(script_id)]
+                raw_dep = format_deployments(deps)
+            except Exception as e:
+                log.print(f"    API deployments failed ({e}); falling back to `clasp deployments`.", file=sys.stderr)
+                deps = None
+        if deps is None:
+            span['via'] = 'clasp'
+            proc_dep = run_clasp_with_retry(
+                'clasp deployments',
+                cwd=project_dir,
+                capture_output=True,
+                log=log,
+                tokens=tokens,
+                span=span,
+                hedgeable=True
+            )
+            raw_dep = proc_dep.stdout
+            deps = parse_deployments(raw_dep)
+        data = json.dumps(deps, ensure_ascii=False, indent=2)
+        span['bytes'] = (save_if_changed(os.path.join(project_dir, 'deployments.txt'), raw_dep, changed)
+                         + save_if_changed(os.path.join(project_dir, 'deployments.json'), data, changed))
+    return deps
+
+
+def no_versions_text(project_dir):
+    """
+    versions.txt for a project without versions: empty, unless the file
+    already holds an equivalent text such as clasp's "No deployed versions
+    of script.", which is kept so it is not rewritten.
+    """
+    try:
+        with open(os.path.join(project_dir, 'versions.txt'), 'r', encoding='utf-8') as f:
+            text = f.read()
+    except OSError:
+        return ""
+    return text if not parse_versions(text) else ""
+
+
+def load_versions(project_dir):
+    """The versions saved in versions.json ([] if missing or unreadable)."""
+    try:
+        with open(os.path.join(project_dir, 'versions.json'), 'r', encoding='utf-8') as f:
+            versions = json.load(f)
+    except (OSError, ValueError):
+        return []
+    return [v for v in versions if isinstance(v, dict) and isinstance(v.get('version'), int)] \
+        if isinstance(versions, list) else []
+
+
+def fetch_versions(project_dir, script_id, client, log, tokens=None, changed=None):
+    """
+    Save versions.txt / versions.json. With a client, only the versions
+    numbered above the highest one in versions.json are requested (versions
+    are immutable, so the list only ever grows) and merged into it; otherwise,
+    or if that fails, the whole list comes from `clasp versions`.
+    """
+    changed = changed if changed is not None else []
+    with log.span('versions') as span:
+        vers = None
+        if client and script_id:
+            try:
+                span['via'] = 'api'
+                vers = load_versions(project_dir)
+                known = max((v['version'] for v in vers), default=0)
+                new = [version_entry(v) for v in client.list_versions(script_id, newer_than=known)]
+                span['new'] = len(new)
+                if new:
+                    log.print(f"    {len(new)} new version(s) since version {known}.")
+                vers = vers + new
+                raw_ver = format_versions(vers) if vers else no_versions_text(project_dir)
+            except Exception as e:
+                log.print(f"    API versions failed ({e}); falling back to `clasp versions`.", file=sys.stderr)
+                vers = None
+        if vers is None:
+            span['via'] = 'clasp'
+            proc_ver = run_clasp_with_retry(
+                'clasp versions',
+                cwd=project_dir,
+                capture_output=True,
+                log=log,
+                tokens=tokens,
+                span=span,
+                hedgeable=True
+            )
+            raw_ver = proc_ver.stdout
+            vers = parse_versions(raw_ver)
+        data = json.dumps(vers, ensure_ascii=False, indent=2)
+        span['bytes'] = (save_if_changed(os.path.join(project_dir, 'versions.txt'), raw_ver, changed)
+                         + save_if_changed(os.path.join(project_dir, 'versions.json'), data, changed))
+    return vers
+
+
+class SyncContext:
+    """State shared by all project workers of one run."""
+
+    def __init__(self, state, records, remote_times, client=None, tokens=None, tracer=None, buffered=False,
+                 finder_fresh=None):
+        self.state = state
+        self.finder_fresh = finder_fresh or set()
+        self.tracer = tracer
+        self.tokens = tokens
+        self.records = records
+        self.remote_times = remote_times
+        self.client = client
+        self.buffered = buffered
+        self.changed_paths = []
+        self.deadline = None
+        self.durations = []
+        self._lock = threading.Lock()
+
+    def can_start(self):
+        """False once the remaining time budget is shorter than the expected project duration."""
+        if self.deadline is None:
+            return True
+        with self._lock:
+            estimate = max(self.durations, default=0.0)
+        return time.monotonic() + estimate <= self.deadline
+
+    def add_duration(self, seconds):
+        with self._lock:
+            self.durations.append(seconds)
+
+    def add_changed(self, paths):
+        with self._lock:
+            self.changed_paths.extend(paths)
+
+
+def sync_project(entry, project_dir, script_id, ctx, log):
+    """
+    Pull one project if its remote updateTime (from the freshness check) is
+    newer than the one recorded in the sync state. Sources are downloaded with
+    the API client when one is given, otherwise with `clasp pull`.
+    Returns 'pulled' or 'skipped'; raises on failure.
+    """
+    log.print(f"Processing project '{entry}'...")
+
+    if script_id in ctx.finder_fresh:
+        log.print(f"  Skipping pull: unchanged since the last sync ({synced_time(ctx.records[script_id])}) "
+                  "according to the finder snapshot")
+        return 'skipped'
+
+    should_pull = True
+    remote_update_time = ctx.remote_times.get(script_id)
+
+    if script_id in ctx.remote_times:
+        local_last_updated = (ctx.records.get(script_id) or {}).get('remote_update_time')
+
+        if remote_update_time and local_last_updated:
+            if remote_update_time <= local_last_updated:
+                 log.print(f"  Skipping pull: Remote ({remote_update_time}) <= Local ({local_last_updated})")
+                 should_pull = False
+            else:
+                 log.print(f"  Update needed: Remote ({remote_update_time}) > Local ({local_last_updated})")
+        elif not remote_update_time:
+             log.print("  Pulling: Could not fetch remote metadata.")
+        elif not local_last_updated:
+             log.print("  Pulling: No local metadata.")
+
+    if not should_pull:
+        if script_id:
+            ctx.state.update(script_id, last_checked=sync_state.utc_now())
+        return 'skipped'
+
+    log.print("  Pulling sources, deployments and versions...")
+    changed = []
+    if ctx.client:
+        # Over the API everything runs on this worker thread, so it keeps
+        # reusing its own pooled connection; the requests are cheap next to
+        # the pull.
+        try:
+            pull_sources(project_dir, script_id, ctx.client, log, ctx.tokens, changed)
+            deps = fetch_deployments(project_dir, script_id, ctx.client, log, ctx.tokens, changed)
+            vers = fetch_versions(project_dir, script_id, ctx.client, log, ctx.tokens, changed)
+        finally:
+            # Files written before a failure still have to be committed.
+            ctx.add_changed(changed)
+    else:
+        # `clasp deployments` and `clasp versions` only read .clasp.json and
+        # write their own files, so they can run while `clasp pull` rewrites
+        # the sources.
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            deps = executor.submit(fetch_deployments, project_dir, script_id, None, log, ctx.tokens, changed)
+            vers = executor.submit(fetch_versions, project_dir, script_id, None, log, ctx.tokens, changed)
+            try:
+                pull_sources(project_dir, script_id, None, log, ctx.tokens, changed)
+            finally:
+                concurrent.futures.wait([deps, vers])
+                ctx.add_changed(changed)
+            deps, vers = deps.result(), vers.result()
+    log.print(f"  {len(changed)} file(s) changed.")
+
+    if script_id:
+        now = sync_state.utc_now()
+        record = {
+            'directory': entry,
+            'last_pulled': now,
+            'last_checked': now,
+            'content_hash': sync_state.content_hash(project_dir),
+            'deployment_count': len(deps),
+            'version_count': len(vers),
+            'last_error': None,
+            'last_error_time': None,
+            'command_durations': clasp_watchdog.watchdog.history_json(script_id),
+        }
+        # Without a remote updateTime, keep the recorded one so the next run checks again.
+        if remote_update_time:
+            record['remote_update_time'] = remote_update_time
+        ctx.state.update(script_id, **record)
+
+    log.print(f"  Completed project '{entry}'.")
+    return 'pulled'
+
+
+def run_project(entry, project_dir, script_id, ctx):
+    """Worker wrapper: isolate failures and flush the project's log in one piece."""
+    if not ctx.can_start():
+        return entry, 'deferred', None
+    log = ProjectLog(buffered=ctx.buffered, project=script_id or entry, tracer=ctx.tracer)
+    start = time.monotonic()
+    try:
+        status = sync_project(entry, project_dir, script_id, ctx, log)
+        error = None
+    except subprocess.TimeoutExpired as e:
+        log.print(f"Error: command hung in {entry}: {e}", file=sys.stderr)
+        status, error = 'hung', str(e)
+    except subprocess.CalledProcessError as e:
+        log.print(f"Error: command failed in {entry}: {e}", file=sys.stderr)
+        status, error = 'failed', str(e)
+    except Exception as e:
+        log.print(f"Error: unexpected failure in {entry}: {e!r}", file=sys.stderr)
+        status, error = 'failed', repr(e)
+    finally:
+        log.flush()
+        ctx.add_duration(time.monotonic() - start)
+    if error and script_id:
+        ctx.state.record_error(script_id, error)
+    return entry, status, error
+
+
+def print_summary(results):
+    counts = {}
+    for _, status, _ in results:
+        counts[status] = counts.get(status, 0) + 1
+    print("Summary: " + ", ".join(f"{k}={counts.get(k, 0)}" for k in ('pulled', 'skipped', 'failed', 'hung', 'deferred')))
+    for entry, status, error in results:
+        if status in ('failed', 'hung'):
+            print(f"  {status.upper()} {entry}: {error}", file=sys.stderr)
+
+
+def add_sync_arguments(parser):
+    """The options of the freshness check and the pull, shared with reconcile.py."""
+    parser.add_argument(
+        '--jobs', '-j', type=int, default=1,
+        help='Number of projects to sync in parallel (default: 1).'
+    )
+    parser.add_argument(
+        '--api-base',
+        help='Apps Script API base URL (default: $APPS_SCRIPT_API_BASE or '
+             f'{apps_script_api.DEFAULT_API_BASE}).'
+    )
+    parser.add_argument(
+        '--pull-with', choices=('api', 'clasp'), default='api',
+        help='Download sources with the Apps Script API (falling back to clasp) '
+             'or always with `clasp pull` (default: api).'
+    )
+    parser.add_argument(
+        '--token-endpoint',
+        help='OAuth token endpoint used to refresh credentials (default: $OAUTH_TOKEN_ENDPOINT or '
+             f'{token_manager.DEFAULT_TOKEN_ENDPOINT}).'
+    )
+    parser.add_argument(
+        '--time-budget', type=float,
+        help='Stop starting projects so that the run ends within this many seconds; '
+             'projects are taken in priority order and the rest resume next run.'
+    )
+    parser.add_argument(
+        '--finder', default='gas-project-finder.json',
+        help='GAS Project Finder snapshot used as the first freshness check (default: gas-project-finder.json).'
+    )
+    parser.add_argument(
+        '--finder-max-age', type=float, default=6,
+        help='Check every project live when the finder snapshot is older than this many hours; '
+             '0 disables the snapshot (default: 6).'
+    )
+    parser.add_argument(
+        '--api-per-minute', type=float, default=float(os.environ.get('API_PER_MINUTE') or 0),
+        help='Budget of Apps Script API requests per minute, shared by all workers '
+             '(default: $API_PER_MINUTE or 0 = unlimited).'
+    )
+    parser.add_argument(
+        '--clasp-per-minute', type=float, default=float(os.environ.get('CLASP_PER_MINUTE') or 0),
+        help='Budget of clasp runs per minute, shared by all workers (default: $CLASP_PER_MINUTE or 0 = unlimited).'
+    )
+    parser.add_argument(
+        '--clasp-timeout', type=float, default=clasp_watchdog.DEFAULT_MAX_TIMEOUT,
+        help='Longest a clasp command may run before its process group is killed; commands with a '
+             f'history get {clasp_watchdog.DEADLINE_FACTOR:g}x their p95, but at least '
+             f'{clasp_watchdog.DEFAULT_MIN_TIMEOUT:g}s (default: {clasp_watchdog.DEFAULT_MAX_TIMEOUT:g}).'
+    )
+    parser.add_argument(
+        '--hedge', action='store_true',
+        help='Start a second `clasp deployments` / `clasp versions` when one runs past '
+             f'{clasp_watchdog.HEDGE_FACTOR:g}x its p95, and keep whichever finishes first.'
+    )
+
+
+def open_client(args):
+    """
+    Apply the rate budgets and the clasp watchdog settings and return (token
+    manager, API client or None if there is no access token).
+    """
+    rate_limit.limiter.configure(args.api_per_minute, args.clasp_per_minute)
+    clasp_watchdog.watchdog.configure(args.clasp_timeout, args.hedge)
+    # One token manager is shared by every worker; it refreshes before expiry.
+    tokens = token_manager.TokenManager(token_endpoint=args.token_endpoint)
+    access_token = tokens.get_token()
+
+    if not access_token:
+        print("Warning: Could not read access token from .clasprc.json. Optimization (skipping unchanged projects) will be disabled. Proceeding with full pull.", file=sys.stderr)
+    client = apps_script_api.ApiClient(tokens, args.api_base) if access_token else None
+    return tokens, client
+
+
+class Freshness:
+    """Result of the freshness check, consumed by pull_projects()."""
+
+    def __init__(self, finder_times, finder_fresh, remote_times):
+        self.finder_times = finder_times
+        self.finder_fresh = finder_fresh
+        self.remote_times = remote_times
+
+
+def check_freshness(ids, records, client, args, tracer=None, finder_age=None, state=None):
+    """
+    Decide which projects may have changed. finder_age overrides the age of
+    the finder snapshot (e.g. 0 right after fetching it); state is the sync
+    state holding the recorded fetch time.
+    """
+    # First tier: the finder snapshot, which costs no requests.
+    finder_times = load_finder_times(args.finder)
+    finder_fresh = set()
+    age = None
+    if finder_times and args.finder_max_age > 0:
+        age = finder_age if finder_age is not None else finder_snapshot_age(args.finder, state)
+    if age is not None and age > args.finder_max_age * 3600:
+        print(f"Finder snapshot is {age / 3600:.1f}h old; checking every project live.")
+    elif age is not None:
+        finder_fresh = finder_fresh_ids(ids, records, finder_times)
+        print(f"Finder snapshot ({age / 3600:.1f}h old): {len(finder_fresh)} of {len(ids)} projects unchanged.")
+
+    # Second tier: fetch the remaining projects' updateTime over pooled connections.
+    # A project missing from the map (no token or no scriptId) is always pulled.
+    remote_times = {}
+    if client:
+        to_check = [sid for sid in ids if sid not in finder_fresh]
+        print(f"Checking {len(to_check)} projects for remote updates...")
+        remote_times = apps_script_api.fetch_update_times(client, to_check, jobs=max(args.jobs, 8), tracer=tracer)
+    return Freshness(finder_times, finder_fresh, remote_times)
+
+
+def pull_projects(projects, state, records, freshness, client, tokens, args, tracer=None, started=None, cursor_key='pull_cursor'):
+    """
+    Sync the projects that the freshness check did not rule out, with
+    args.jobs workers and within args.time_budget seconds of started.
+    Returns (results, sorted list of changed paths).
+    """
+    jobs = max(1, args.jobs)
+    clasp_watchdog.watchdog.load(records)
+    ctx = SyncContext(
+        state,
+        records,
+        freshness.remote_times,
+        client=client if args.pull_with == 'api' else None,
+        tokens=tokens,
+        tracer=tracer,
+        buffered=jobs > 1,
+        finder_fresh=freshness.finder_fresh,
+    )
+
+    cold = []
+    if args.time_budget:
+        ctx.deadline = (started or time.monotonic()) + args.time_budget
+        projects, cold = prioritize(projects, records, freshness.finder_times, state.get_meta(cursor_key))
+        print(f"Time budget {args.time_budget:g}s: {len(projects) - len(cold)} priority project(s) first.")
+
+    if jobs == 1:
+        results = [run_project(entry, project_dir, script_id, ctx) for entry, project_dir, script_id in projects]
+    else:
+        print(f"Syncing {len(projects)} projects with {jobs} workers...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [
+                executor.submit(run_project, entry, project_dir, script_id, ctx)
+                for entry, project_dir, script_id in projects
+            ]
+            results = [future.result() for future in futures]
+
+    if args.time_budget:
+        # Resume the round-robin at the first quiet project this run did not reach.
+        deferred = {entry for entry, status, _ in results if status == 'deferred'}
+        cursor = next((script_id for entry, _, script_id in cold if entry in deferred), None)
+        state.set_meta(cursor_key, cursor)
+        if deferred:
+            print(f"Time budget reached: {len(deferred)} project(s) deferred to the next run.")
+
+    return results, sorted(set(ctx.changed_paths))
+
+
 def main():
+    parser = argparse.ArgumentParser(
+        description='Pull every Apps Script project under the current directory.'
+    )
+    add_sync_arguments(parser)
+    parser.add_argument(
+        '--state',
+        help=f'Path of the sync-state database (default: $SYNC_STATE_DB or {sync_state.DEFAULT_STATE_PATH}).'
+    )
+    parser.add_argument(
+        '--trace',
+        help=f'Append timing spans to this JSONL file; empty to disable (default: $SYNC_TRACE or {sync_trace.DEFAULT_TRACE_PATH}).'
+    )
+    parser.add_argument(
+        '--changed-paths',
+        help='Write the paths of the files that changed to this file, one per line.'
+    )
+    parser.add_argument(
+        '--shard', type=workspace.parse_shard,
+        help='Only sync the projects of shard i of N (e.g. 0/4), by a stable hash of the scriptId.'
+    )
+    args = parser.parse_args()
+    started = time.monotonic()
+
     base_dir = os.getcwd()
-    entries = os.listdir(base_dir)
-    
+    index = workspace.load_index(base_dir)
+
     # Check clasp version
     try:
-        subprocess.run('clasp -v', shell=True, check=True)
+        subprocess.run('clasp -v', shell=True, check=True, timeout=60)
     except:
         print("Warning: could not check clasp version.")
 
-    # Refresh token once at the start
-    refresh_clasp_token()
-    access_token = get_access_token()
-    
-    if not access_token:
-        print("Warning: Could not read access token from .clasprc.json. Optimization (skipping unchanged projects) will be disabled. Proceeding with full pull.", file=sys.stderr)
+    tokens, client = open_client(args)
 
-    for entry in entries:
-        project_dir = os.path.join(base_dir, entry)
-        clasp_config = os.path.join(project_dir, '.clasp.json')
+    projects = index.projects(args.shard)
+    if args.shard:
+        print(f"Shard {workspace.format_shard(args.shard)}: {len(projects)} of {len(index)} projects.")
 
-        if os.path.isdir(project_dir) and os.path.isfile(clasp_config):
-            print(f"Processing project '{entry}'...")
-            
-            should_pull = True
-            script_id = None
-            remote_update_time = None
-            
-            if access_token:
-                try:
-                    with open(clasp_config, 'r') as f:
-                        cfg = json.load(f)
-                        script_id = cfg.get('scriptId')
-                except:
-                    pass
-                
-                if script_id:
-                    remote_update_time = get_remote_update_time(script_id, access_token)
-                    local_last_updated = get_local_last_updated(project_dir)
-                    
-                    if remote_update_time and local_last_updated:
-                        if remote_update_time <= local_last_updated:
-                             print(f"  Skipping pull: Remote ({remote_update_time}) <= Local ({local_last_updated})")
-                             should_pull = False
-                        else:
-                             print(f"  Update needed: Remote ({remote_update_time}) > Local ({local_last_updated})")
-                    elif not remote_update_time:
-                         print("  Pulling: Could not fetch remote metadata.")
-                    elif not local_last_updated:
-                         print("  Pulling: No local metadata.")
-
-            if should_pull:
-                try:
-                    # 1) Pull latest files via shell
-                    print("  Running `clasp pull` via shell...")
-                    run_clasp_with_retry('clasp pull', cwd=project_dir)
-
-                    # 2) Fetch deployments via shell
-                    print("  Fetching deployments via shell...")
-                    proc_dep = run_clasp_with_retry(
-                        'clasp deployments',
-                        cwd=project_dir,
-                        capture_output=True
-                    )
-                    raw_dep = proc_dep.stdout
-                    with open(os.path.join(project_dir, 'deployments.txt'), 'w', encoding='utf-8') as f:
-                        f.write(raw_dep)
-                    deps = parse_deployments(raw_dep)
-                    with open(os.path.join(project_dir, 'deployments.json'), 'w', encoding='utf-8') as f:
-                        json.dump(deps, f, ensure_ascii=False, indent=2)
-
-                    # 3) Fetch versions via shell
-                    print("  Fetching versions via shell...")
-                    proc_ver = run_clasp_with_retry(
-                        'clasp versions',
-                        cwd=project_dir,
-                        capture_output=True
-                    )
-                    raw_ver = proc_ver.stdout
-                    with open(os.path.join(project_dir, 'versions.txt'), 'w', encoding='utf-8') as f:
-                        f.write(raw_ver)
-                    vers = parse_versions(raw_ver)
-                    with open(os.path.join(project_dir, 'versions.json'), 'w', encoding='utf-8') as f:
-                        json.dump(vers, f, ensure_ascii=False, indent=2)
-                    
-                    # Update metadata if we have the time
-                    if remote_update_time:
-                        update_local_metadata(project_dir, remote_update_time)
-
-                    print(f"  Completed project '{entry}'.")
-
-                except subprocess.CalledProcessError as e:
-                    print(f"Error: command failed in {entry}: {e}", file=sys.stderr)
-                finally:
-                    pass  # We used cwd argument, so we don't need to chdir back
+    tracer = sync_trace.Tracer(args.trace, script='clasp-pull')
+
+    state = sync_state.SyncState(args.state)
+    state.import_legacy_metadata(projects)
+    records = state.all()
+    projects = listed_projects(projects, records)
+    ids = [sid for _, _, sid in projects if sid]
+
+    freshness = check_freshness(ids, records, client, args, tracer, state=state)
+    cursor_key = 'pull_cursor' + (f":{workspace.format_shard(args.shard)}" if args.shard else '')
+    results, changed_paths = pull_projects(projects, state, records, freshness, client, tokens, args,
+                                           tracer, started, cursor_key)
+
+    if client:
+        client.close()
+    state.close()
+    rate_limit.limiter.record(tracer)
+    clasp_watchdog.watchdog.record(tracer)
+    tracer.close()
 
     print("All projects processed.")
+    print_summary(results)
+    print(rate_limit.limiter.summary())
+    print(clasp_watchdog.watchdog.summary())
+    print(f"{len(changed_paths)} file(s) changed.")
+    if args.changed_paths:
+        with open(args.changed_paths, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in changed_paths)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
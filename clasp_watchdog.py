@@ -0,0 +1,251 @@
+"""
+clasp_watchdog.py
+
+Deadlines for clasp subprocesses, so one hung `clasp pull` (e.g. stuck on a
+stalled socket) costs one project a few minutes instead of stalling the run
+until the runner is killed.
+
+Each command runs in its own process group. Its deadline adapts to history:
+a multiple of the p95 of the project's earlier successful runs of the same
+command (or of every project's, when the project has too few), clamped
+between min_timeout and max_timeout; with no history at all it is
+max_timeout. An overdue process group is sent SIGTERM, then SIGKILL after a
+grace period, and subprocess.TimeoutExpired is raised so the caller can back
+off and retry.
+
+With hedging enabled, a read-only command that is still running at
+hedge_factor times its usual p95 gets a second, concurrent attempt; the first
+to succeed wins and the other is killed. Commands that write files (clasp
+pull) are never hedged.
+
+Time lost to hangs is counted apart from time spent in failed runs; the
+module-level `watchdog` is the instance the scripts share.
+"""
+import json
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+import sync_trace
+
+DEFAULT_MIN_TIMEOUT = 60.0
+DEFAULT_MAX_TIMEOUT = 600.0
+DEADLINE_FACTOR = 4.0
+HEDGE_FACTOR = 2.0
+MIN_SAMPLES = 3
+HISTORY_LENGTH = 20
+KILL_GRACE = 5.0
+
+
+def command_name(cmd):
+    """'clasp pull' -> 'pull': the key durations are kept under."""
+    parts = cmd.split()
+    return parts[1] if len(parts) > 1 else parts[0] if parts else ''
+
+
+def kill_group(proc, grace=KILL_GRACE):
+    """Terminate proc and every process it started; SIGKILL what is left after grace seconds."""
+    if proc.poll() is not None:
+        return
+    try:
+        if os.name == 'posix':
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.terminate()
+    except ProcessLookupError:
+        return
+    try:
+        proc.wait(grace)
+    except subprocess.TimeoutExpired:
+        try:
+            if os.name == 'posix':
+                os.killpg(proc.pid, signal.SIGKILL)
+            else:
+                proc.kill()
+        except ProcessLookupError:
+            pass
+
+
+class _Attempt(threading.Thread):
+    """One running process; reports to the queue when it exits."""
+
+    def __init__(self, cmd, cwd, capture_output, finished, hedge=False):
+        super().__init__(daemon=True)
+        self.hedge = hedge
+        self.finished = finished
+        self.stdout = self.stderr = None
+        self.proc = subprocess.Popen(
+            cmd,
+            shell=True,
+            cwd=cwd,
+            stdout=subprocess.PIPE if capture_output else None,
+            stderr=subprocess.PIPE if capture_output else None,
+            encoding='utf-8',
+            errors='replace',
+            start_new_session=os.name == 'posix',
+        )
+        self.start()
+
+    def run(self):
+        self.stdout, self.stderr = self.proc.communicate()
+        self.finished.put(self)
+
+
+class Watchdog:
+    """Adaptive deadlines, process-group kills and optional hedging for clasp commands."""
+
+    def __init__(self, min_timeout=DEFAULT_MIN_TIMEOUT, max_timeout=DEFAULT_MAX_TIMEOUT, hedge=False,
+                 factor=DEADLINE_FACTOR, hedge_factor=HEDGE_FACTOR):
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.hedge = hedge
+        self.factor = factor
+        self.hedge_factor = hedge_factor
+        self.history = {}
+        self._lock = threading.Lock()
+        self.stats = {'runs': 0, 'hung': 0, 'hung_seconds': 0.0, 'failed': 0, 'failed_seconds': 0.0,
+                      'hedged': 0, 'hedge_wins': 0}
+
+    def configure(self, max_timeout=None, hedge=None):
+        if max_timeout is not None:
+            self.max_timeout = max_timeout
+            self.min_timeout = min(self.min_timeout, max_timeout)
+        if hedge is not None:
+            self.hedge = hedge
+
+    # History of successful durations, {project: {command: [seconds, ...]}}.
+
+    def load(self, records):
+        """Read the command_durations of sync-state records."""
+        with self._lock:
+            for script_id, record in records.items():
+                try:
+                    durations = json.loads(record.get('command_durations') or '{}')
+                except ValueError:
+                    continue
+                if isinstance(durations, dict):
+                    self.history[script_id] = durations
+
+    def history_json(self, project):
+        """The project's durations as stored in the command_durations field."""
+        with self._lock:
+            return json.dumps(self.history.get(project, {}), sort_keys=True)
+
+    def observe(self, project, name, seconds):
+        with self._lock:
+            samples = self.history.setdefault(project, {}).setdefault(name, [])
+            samples.append(round(seconds, 3))
+            del samples[:-HISTORY_LENGTH]
+
+    def p95(self, project, name):
+        """p95 of the project's durations of the command, else of every project's; None if too few."""
+        with self._lock:
+            samples = list(self.history.get(project, {}).get(name, []))
+            if len(samples) < MIN_SAMPLES:
+                samples = [s for durations in self.history.values() for s in durations.get(name, [])]
+        return sync_trace.percentile(samples, 95) if len(samples) >= MIN_SAMPLES else None
+
+    def deadline(self, project, name):
+        p95 = self.p95(project, name)
+        if p95 is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, self.factor * p95))
+
+    # Running commands.
+
+    def run(self, cmd, cwd=None, capture_output=False, project=None, hedgeable=False, log=None, before_hedge=None):
+        """
+        Run a shell command like subprocess.run (without check) under its
+        deadline. Raises subprocess.TimeoutExpired after killing every attempt.
+        before_hedge is called before a hedged attempt starts (e.g. to take
+        a rate-limit token).
+        """
+        name = command_name(cmd)
+        deadline = self.deadline(project, name)
+        hedge_at = None
+        if self.hedge and hedgeable:
+            p95 = self.p95(project, name)
+            if p95 is not None and self.hedge_factor * p95 < deadline:
+                hedge_at = self.hedge_factor * p95
+
+        start = time.monotonic()
+        finished = queue.Queue()
+        attempts = [_Attempt(cmd, cwd, capture_output, finished)]
+        running = 1
+        result = None
+        while result is None:
+            elapsed = time.monotonic() - start
+            wait = deadline - elapsed
+            if hedge_at is not None and len(attempts) == 1:
+                wait = min(wait, hedge_at - elapsed)
+            try:
+                attempt = finished.get(timeout=max(0.0, wait))
+            except queue.Empty:
+                if time.monotonic() - start < deadline:
+                    if hedge_at is None or len(attempts) > 1:
+                        continue
+                    if log:
+                        log.print(f"    `{cmd}` is past {hedge_at:.1f}s ({self.hedge_factor:g}x its p95); "
+                                  "starting a hedged attempt.")
+                    if before_hedge:
+                        before_hedge()
+                    attempts.append(_Attempt(cmd, cwd, capture_output, finished, hedge=True))
+                    running += 1
+                    with self._lock:
+                        self.stats['hedged'] += 1
+                    continue
+                for a in attempts:
+                    kill_group(a.proc)
+                elapsed = time.monotonic() - start
+                with self._lock:
+                    self.stats['runs'] += 1
+                    self.stats['hung'] += 1
+                    self.stats['hung_seconds'] += elapsed
+                if log:
+                    log.print(f"    `{cmd}` hung: killed after {elapsed:.1f}s (deadline {deadline:.0f}s).")
+                first = attempts[0]
+                raise subprocess.TimeoutExpired(cmd, deadline, output=first.stdout, stderr=first.stderr)
+            running -= 1
+            # A quick failure of one attempt still leaves the other a chance.
+            if attempt.proc.returncode == 0 or running == 0:
+                result = attempt
+
+        for a in attempts:
+            if a is not result:
+                kill_group(a.proc)
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self.stats['runs'] += 1
+            if result.proc.returncode == 0:
+                if result.hedge:
+                    self.stats['hedge_wins'] += 1
+            else:
+                self.stats['failed'] += 1
+                self.stats['failed_seconds'] += elapsed
+        if result.proc.returncode == 0 and project:
+            self.observe(project, name, elapsed)
+        return subprocess.CompletedProcess(cmd, result.proc.returncode, result.stdout, result.stderr)
+
+    def summary(self):
+        with self._lock:
+            s = dict(self.stats)
+        text = (f"clasp watchdog: {s['runs']} run(s); {s['hung']} hung and killed ({s['hung_seconds']:.1f}s lost); "
+                f"{s['failed']} failed ({s['failed_seconds']:.1f}s)")
+        if s['hedged']:
+            text += f"; {s['hedged']} hedged, {s['hedge_wins']} won by the hedge"
+        return text
+
+    def record(self, tracer):
+        """Add a 'hang' span with the time lost to hung commands to a sync_trace.Tracer."""
+        with self._lock:
+            s = dict(self.stats)
+        if s['runs']:
+            tracer.record(project=None, phase='hang', duration=round(s['hung_seconds'], 6), outcome='ok',
+                          hung=s['hung'], failed=s['failed'], failed_seconds=round(s['failed_seconds'], 6),
+                          hedged=s['hedged'], hedge_wins=s['hedge_wins'])
+
+
+watchdog = Watchdog()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+code_analysis.py
+
+Static analysis of every project's sources, so questions such as "which
+projects call GmailApp" or "which ones declare a gmail scope" are answered
+from one index instead of grepping the tree.
+
+  python3 code_analysis.py build [--jobs N] [--changed-paths FILE]
+  python3 code_analysis.py query [--service S] [--scope TEXT] [--function F]
+                                 [--trigger F] [--entry-point doGet|doPost] [--include F] [--webapp]
+
+From each project's .js/.gs/.html files and appsscript.json the build
+extracts the top-level functions, the Apps Script services used, the
+simple triggers and the handlers of installable triggers (ScriptApp.newTrigger),
+the web-app entry points (doGet/doPost), the oauthScopes, advanced
+services and webapp section of the manifest, and the HTML files included with createHtmlOutputFromFile,
+createTemplateFromFile or include(). The analysis is lexical (comments and
+string contents are masked, braces are counted); it does not execute or
+fully parse the code. appsscript.json is looked up in the rootDir of the
+project's .clasp.json, where clasp keeps it.
+
+  code-index/projects.json  {"version", "projects": {scriptId: {"directory", "files": {path: sha256},
+                             "functions", "services", "advancedServices", "scopes", "triggers",
+                             "entryPoints", "includes", "webapp"}}}
+  code-index/files.json     {"version", "files": {sha256: analysis of one file}}
+
+files.json is the cache: a file is only analysed again when its content
+hash is new, and the misses are analysed on a pool of --jobs processes.
+manifest.py merges each project's entry into its metadata.json.
+"""
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
+
+import apps_script_api
+import fsutil
+import workspace
+
+INDEX_DIR = 'code-index'
+# Bump when the analysis changes, so every cached result is recomputed.
+ANALYSIS_VERSION = 2
+
+SOURCE_EXTENSIONS = ('.js', '.gs', '.html')
+MANIFEST_NAME = 'appsscript.json'
+
+# The global services of the Apps Script runtime.
+SERVICES = (
+    'Browser', 'CacheService', 'CalendarApp', 'CardService', 'Charts', 'ConferenceDataService', 'ContactsApp',
+    'ContentService', 'DataStudioApp', 'DocumentApp', 'DriveApp', 'FormApp', 'GmailApp', 'GroupsApp',
+    'HtmlService', 'Jdbc', 'LanguageApp', 'LinearOptimizationService', 'LockService', 'Logger', 'MailApp',
+    'Maps', 'PropertiesService', 'ScriptApp', 'Session', 'SitesApp', 'SlidesApp', 'SpreadsheetApp',
+    'UrlFetchApp', 'Utilities', 'XmlService',
+)
+SIMPLE_TRIGGERS = ('onOpen', 'onEdit', 'onInstall', 'onSelectionChange')
+ENTRY_POINTS = ('doGet', 'doPost')
+
+SERVICE_RE = re.compile(r"\b(" + '|'.join(SERVICES) + r")\s*\.")
+FUNCTION_RE = re.compile(r"\bfunction\s*\*?\s*([A-Za-z_$][\w$]*)\s*\(")
+ASSIGNED_FUNCTION_RE = re.compile(
+    r"\b(?:const|let|var)\s+([A-Za-z_$][\w$]*)\s*=\s*(?:async\s+)?(?:function\b|\([^()]*\)\s*=>|[A-Za-z_$][\w$]*\s*=>)"
+)
+NEW_TRIGGER_RE = re.compile(r"\bScriptApp\s*\.\s*newTrigger\s*\(\s*(['\"`])([^'\"`]+)\1")
+INCLUDE_RE = re.compile(
+    r"(?:\bHtmlService\s*\.\s*create(?:HtmlOutput|Template)FromFile|\binclude)\s*\(\s*(['\"`])([^'\"`]+)\1"
+)
+HTML_COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+
+
+def mask(source):
+    """
+    Two copies of source with the same length: (code, skeleton). code has
+    the comments blanked; skeleton also has the contents of string and
+    template literals blanked, so braces and keywords inside them are not
+    counted.
+    """
+    code = list(source)
+    skeleton = list(source)
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c == '/' and source.startswith('//', i):
+            end = source.find('\n', i)
+            end = n if end < 0 else end
+            code[i:end] = skeleton[i:end] = ' ' * (end - i)
+            i = end
+        elif c == '/' and source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = n if end < 0 else end + 2
+            blank = [ch if ch == '\n' else ' ' for ch in source[i:end]]
+            code[i:end] = skeleton[i:end] = blank
+            i = end
+        elif c in '\'"`':
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '\n' and c != '`':
+                    break
+                j += 1
+            for k in range(i + 1, min(j, n)):
+                if source[k] != '\n':
+                    skeleton[k] = ' '
+            i = j + 1
+        else:
+            i += 1
+    return ''.join(code), ''.join(skeleton)
+
+
+def top_level_functions(skeleton):
+    """Names of the functions declared (or assigned to a const/let/var) outside any braces."""
+    matches = sorted([(m.start(), m.group(1)) for m in FUNCTION_RE.finditer(skeleton)] +
+                     [(m.start(), m.group(1)) for m in ASSIGNED_FUNCTION_RE.finditer(skeleton)])
+    names = []
+    depth = 0
+    pos = 0
+    for start, name in matches:
+        segment = skeleton[pos:start]
+        depth += segment.count('{') - segment.count('}')
+        pos = start
+        if depth <= 0 and name not in names:
+            names.append(name)
+    return names
+
+
+def analyze_source(kind, text):
+    """Analysis of one file: kind is 'script', 'html' or 'manifest'."""
+    if kind == 'manifest':
+        try:
+            manifest = json.loads(text)
+        except ValueError:
+            manifest = {}
+        if not isinstance(manifest, dict):
+            manifest = {}
+        advanced = (manifest.get('dependencies') or {}).get('enabledAdvancedServices') or []
+        return {
+            'scopes': sorted(manifest.get('oauthScopes') or []),
+            'advancedServices': sorted({s.get('userSymbol') for s in advanced if isinstance(s, dict)} - {None}),
+            'webapp': 'webapp' in manifest,
+        }
+    if kind == 'html':
+        text = HTML_COMMENT_RE.sub(lambda m: ' ' * len(m.group(0)), text)
+    code, skeleton = mask(text)
+    return {
+        # Functions in an HTML file run in the browser, not on the server.
+        'functions': top_level_functions(skeleton) if kind == 'script' else [],
+        'services': sorted(set(SERVICE_RE.findall(skeleton))),
+        'triggerHandlers': sorted({m.group(2) for m in NEW_TRIGGER_RE.finditer(code)}),
+        'includes': sorted({m.group(2) for m in INCLUDE_RE.finditer(code)}),
+    }
+
+
+def manifest_path(project_dir):
+    """Path of the project's appsscript.json relative to project_dir, under the rootDir of its .clasp.json."""
+    clasp_config = load_json(os.path.join(project_dir, '.clasp.json'), {})
+    if not isinstance(clasp_config, dict):
+        clasp_config = {}
+    path = apps_script_api.local_file_name({'name': 'appsscript', 'type': 'JSON'}, clasp_config)
+    return os.path.relpath(os.path.join(project_dir, path), project_dir).replace(os.sep, '/')
+
+
+def file_kind(rel_path, manifest=MANIFEST_NAME):
+    if rel_path == manifest:
+        return 'manifest'
+    if rel_path.endswith('.html'):
+        return 'html'
+    if rel_path.endswith(SOURCE_EXTENSIONS):
+        return 'script'
+    return None
+
+
+def project_sources(project_dir, manifest=MANIFEST_NAME):
+    """(relative path, kind) of the project's analysed files, hidden directories excluded, sorted."""
+    sources = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            rel_path = os.path.relpath(os.path.join(root, name), project_dir).replace(os.sep, '/')
+            kind = file_kind(rel_path, manifest)
+            if kind:
+                sources.append((rel_path, kind))
+    return sorted(sources)
+
+
+def summarize(directory, files, results, manifest=MANIFEST_NAME):
+    """A project's index entry from {path: sha256} and {sha256: analysis}; manifest is the appsscript.json path."""
+    functions, services, handlers, includes = [], set(), set(), set()
+    scopes, advanced, webapp = [], [], False
+    for path in sorted(files):
+        result = results[files[path]]
+        if path == manifest:
+            scopes, advanced, webapp = result['scopes'], result['advancedServices'], result['webapp']
+            continue
+        functions.extend(f for f in result['functions'] if f not in functions)
+        services.update(result['services'])
+        handlers.update(result['triggerHandlers'])
+        includes.update(result['includes'])
+    return {
+        'directory': directory,
+        'files': files,
+        'functions': functions,
+        'services': sorted(services),
+        'advancedServices': advanced,
+        'scopes': scopes,
+        'triggers': {
+            'simple': [f for f in SIMPLE_TRIGGERS if f in functions],
+            'installable': sorted(handlers),
+        },
+        'entryPoints': [f for f in ENTRY_POINTS if f in functions],
+        'includes': sorted(includes),
+        'webapp': webapp,
+    }
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def load_projects(index_dir=INDEX_DIR):
+    """scriptId -> index entry from code-index/projects.json ({} if there is none)."""
+    index = load_json(os.path.join(index_dir, 'projects.json'), {})
+    if index.get('version') != ANALYSIS_VERSION:
+        return {}
+    return index.get('projects', {})
+
+
+def _analyze(task):
+    kind, text = task
+    return analyze_source(kind, text)
+
+
+def build(index_dir=INDEX_DIR, jobs=None, only=None, force=False):
+    """
+    Update the index in index_dir. With only (a set of scriptIds), the other
+    projects that are already indexed keep their entries without their files
+    being read. Returns (list of scriptIds whose entry changed, list of paths
+    of the index files that were rewritten).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    projects_path = os.path.join(index_dir, 'projects.json')
+    files_path = os.path.join(index_dir, 'files.json')
+    cache = load_json(files_path, {})
+    if force or cache.get('version') != ANALYSIS_VERSION:
+        cache = {}
+    results = cache.get('files', {})
+    previous = {} if force else load_projects(index_dir)
+
+    projects = {}
+    pending = {}
+    hashes = {}
+    for directory, project_dir, script_id in workspace.load_index().projects():
+        if not script_id:
+            continue
+        old = previous.get(script_id)
+        if old and only is not None and script_id not in only and old.get('directory') == directory:
+            projects[script_id] = old
+            continue
+        files = {}
+        manifest = manifest_path(project_dir)
+        for rel_path, kind in project_sources(project_dir, manifest):
+            with open(os.path.join(project_dir, rel_path), 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            files[rel_path] = digest
+            if digest not in results and digest not in pending:
+                pending[digest] = (kind, data.decode('utf-8', errors='replace'))
+        hashes[script_id] = (directory, files, manifest)
+
+    if pending:
+        digests = list(pending)
+        tasks = [pending[d] for d in digests]
+        if jobs == 1 or len(tasks) == 1:
+            analyses = [_analyze(task) for task in tasks]
+        else:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+                analyses = list(executor.map(_analyze, tasks, chunksize=16))
+        results.update(zip(digests, analyses))
+
+    for script_id, (directory, files, manifest) in hashes.items():
+        projects[script_id] = summarize(directory, files, results, manifest)
+    changed = sorted(sid for sid in projects if projects[sid] != previous.get(sid))
+
+    # Only the results some project still refers to are kept in the cache.
+    used = {digest for entry in projects.values() for digest in entry['files'].values()}
+    written = []
+    data = json.dumps({'version': ANALYSIS_VERSION,
+                       'files': {d: results[d] for d in sorted(used) if d in results}},
+                      ensure_ascii=False, separators=(',', ':'))
+    if fsutil.write_if_changed(files_path, data):
+        written.append(files_path)
+    data = json.dumps({'version': ANALYSIS_VERSION,
+                       'projects': {sid: projects[sid] for sid in sorted(projects)}},
+                      ensure_ascii=False, indent=1)
+    if fsutil.write_if_changed(projects_path, data):
+        written.append(projects_path)
+    print(f"Code analysis: {len(hashes)} project(s) scanned, {len(pending)} file(s) analysed, "
+          f"{len(changed)} entr{'y' if len(changed) == 1 else 'ies'} changed.")
+    return changed, written
+
+
+def matches(entry, args):
+    """True if an index entry satisfies every filter given on the query command line."""
+    if args.service and not set(args.service) <= set(entry['services']) | set(entry['advancedServices']):
+        return False
+    if args.scope and not all(any(s in scope for scope in entry['scopes']) for s in args.scope):
+        return False
+    if args.function and not set(args.function) <= set(entry['functions']):
+        return False
+    triggers = set(entry['triggers']['simple']) | set(entry['triggers']['installable'])
+    if args.trigger and not set(args.trigger) <= triggers:
+        return False
+    if args.entry_point and not set(args.entry_point) <= set(entry['entryPoints']):
+        return False
+    if args.include and not set(args.include) <= set(entry['includes']):
+        return False
+    if args.webapp and not entry['webapp']:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build and query the code-analysis index of the projects.')
+    parser.add_argument('--index-dir', default=INDEX_DIR, help=f'Index directory (default: {INDEX_DIR}).')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    b = sub.add_parser('build', help='Analyse the projects whose files changed and update the index.')
+    b.add_argument('--jobs', '-j', type=int, default=None,
+                   help='Number of analysis processes (default: the number of CPUs).')
+    b.add_argument('--force', action='store_true', help='Ignore the cache and analyse every file again.')
+    b.add_argument('--changed-paths', help='Append the paths of rewritten index files to this file.')
+
+    q = sub.add_parser('query', help='List the projects that match every given filter.')
+    q.add_argument('--service', action='append', help='Uses this service, e.g. GmailApp or an advanced service.')
+    q.add_argument('--scope', action='append', help='Declares an oauthScope containing this text, e.g. gmail.')
+    q.add_argument('--function', action='append', help='Defines this top-level function.')
+    q.add_argument('--trigger', action='append', help='Has this simple trigger or installable trigger handler.')
+    q.add_argument('--entry-point', action='append', choices=ENTRY_POINTS, help='Is a web app with this entry point.')
+    q.add_argument('--include', action='append', help='Includes this HTML file.')
+    q.add_argument('--webapp', action='store_true', help='Declares a webapp in appsscript.json.')
+    q.add_argument('--json', action='store_true', help='Print the matching entries as JSON.')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        _, written = build(args.index_dir, args.jobs, force=args.force)
+        if args.changed_paths:
+            with open(args.changed_paths, 'a', encoding='utf-8') as f:
+                f.writelines(os.path.relpath(path) + '\n' for path in written)
+        return
+
+    found = {sid: entry for sid, entry in sorted(load_projects(args.index_dir).items()) if matches(entry, args)}
+    if args.json:
+        print(json.dumps(found, ensure_ascii=False, indent=2))
+        return
+    for script_id, entry in found.items():
+        print(f"{script_id}  {entry['directory']}")
+    print(f"{len(found)} project(s).")
+
+
+if __name__ == '__main__':
+    main()
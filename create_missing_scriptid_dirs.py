@@ -18,6 +18,9 @@ import json
 import argparse
 import sys
 
+import sync_state
+import workspace
+
 
 def parse_input_file(input_path):
     """
@@ -47,24 +50,40 @@ def parse_input_file(input_path):
 
 def load_existing_scriptids(base_path=os.getcwd()):
     """
-    Scan each subdirectory under base_path, load .clasp.json if present,
-    and collect the ScriptIDs found.
+    Collect the ScriptIDs of the .clasp.json files in the subdirectories of
+    base_path, using the shared workspace index.
+    """
+    return workspace.load_index(base_path).script_ids()
+
+
+def create_missing(entries, existing_ids, state=None, dry_run=False, shard=None):
+    """
+    Create a directory with a .clasp.json for every (script_id, human_name)
+    in entries whose ScriptID is not in existing_ids, registering it in the
+    sync state when one is given. Returns the list of ScriptIDs that were
+    (or, in dry-run mode, would be) created.
     """
-    existing = set()
-    for entry in os.listdir(base_path):
-        dir_path = os.path.join(base_path, entry)
-        if not os.path.isdir(dir_path):
+    missing = [ (sid, name) for sid, name in entries
+                if sid not in existing_ids and workspace.in_shard(sid, shard) ]
+    count = len(missing)
+    print(f"{count} scriptId(s) are missing.")
+
+    for idx, (script_id, human_name) in enumerate(missing, start=1):
+        print(f"[{idx}/{count}] Missing: {script_id} ({human_name})")
+        dir_name = script_id
+        if dry_run:
             continue
-        config_path = os.path.join(dir_path, '.clasp.json')
-        if os.path.isfile(config_path):
-            try:
-                data = json.load(open(config_path, encoding='utf-8'))
-                sid = data.get('scriptId')
-                if sid:
-                    existing.add(sid)
-            except json.JSONDecodeError:
-                print(f"Warning: invalid JSON in {config_path}", file=sys.stderr)
-    return existing
+        # Create the directory
+        os.makedirs(dir_name, exist_ok=True)
+        # Create .clasp.json
+        config = {"scriptId": script_id}
+        config_path = os.path.join(dir_name, '.clasp.json')
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        # Register the new project in the sync state; it has never been pulled.
+        if state:
+            state.update(script_id, directory=dir_name)
+    return [sid for sid, _ in missing]
 
 
 def main():
@@ -77,6 +96,14 @@ def main():
     parser.add_argument(
         '--dry-run', action='store_true', help='Show what would be done without making changes.'
     )
+    parser.add_argument(
+        '--shard', type=workspace.parse_shard,
+        help='Only create the directories of shard i of N (e.g. 0/4), by a stable hash of the ScriptID.'
+    )
+    parser.add_argument(
+        '--delta',
+        help='Only consider the projects added in this delta JSON (written by parse_clasp_list.py --delta).'
+    )
     args = parser.parse_args()
 
     entries = parse_input_file(args.input_file)
@@ -84,25 +111,19 @@ def main():
     if total == 0:
         print("No valid entries found in the input file.")
         return
+    if args.delta:
+        with open(args.delta, encoding='utf-8') as f:
+            added = set(json.load(f).get('added', []))
+        entries = [(sid, name) for sid, name in entries if sid in added]
+        print(f"{len(entries)} of {total} entries were added since the previous listing.")
 
     existing_ids = load_existing_scriptids()
 
-    missing = [ (sid, name) for sid, name in entries if sid not in existing_ids ]
-    count = len(missing)
-    print(f"{count} scriptId(s) are missing.")
+    state = None if args.dry_run else sync_state.SyncState()
+    create_missing(entries, existing_ids, state, args.dry_run, args.shard)
 
-    for idx, (script_id, human_name) in enumerate(missing, start=1):
-        print(f"[{idx}/{count}] Missing: {script_id} ({human_name})")
-        dir_name = script_id
-        if args.dry_run:
-            continue
-        # Create the directory
-        os.makedirs(dir_name, exist_ok=True)
-        # Create .clasp.json
-        config = {"scriptId": script_id}
-        config_path = os.path.join(dir_name, '.clasp.json')
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config, f, indent=2)
+    if state:
+        state.close()
 
     if args.dry_run:
         print("Dry-run mode: no directories or files were created.")
@@ -3,25 +3,12 @@
 
 import os
 import json
-import sys
 
-def main():
-    result = {}
-    base_dir = os.getcwd()
-
-    for entry in os.listdir(base_dir):
-        subdir_path = os.path.join(base_dir, entry)
-        clasp_path = os.path.join(subdir_path, '.clasp.json')
+import workspace
 
-        if os.path.isdir(subdir_path) and os.path.isfile(clasp_path):
-            try:
-                with open(clasp_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    script_id = data.get('scriptId')
-                    if script_id:
-                        result[entry] = script_id
-            except (json.JSONDecodeError, IOError) as e:
-                print(f"Warning: Failed to read {clasp_path}: {e}", file=sys.stderr)
+def main():
+    index = workspace.load_index(os.getcwd())
+    result = {entry: script_id for entry, script_id in index.by_directory.items() if script_id}
 
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
@@ -0,0 +1,50 @@
+"""
+fsutil.py
+
+File-writing helpers shared by the sync and metadata scripts.
+
+Generated files are only rewritten when their bytes actually change, and
+always through a temporary file plus rename, so an interrupted run never
+leaves a half-written file behind and an unchanged file keeps its mtime
+(which keeps git's index refresh cheap).
+"""
+import os
+import tempfile
+
+
+def atomic_write(path, data):
+    """Write bytes to path via a temporary file in the same directory and os.replace."""
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def write_if_changed(path, data):
+    """
+    Atomically write data (bytes, or str encoded as UTF-8) to path unless the
+    file already holds exactly these bytes. Returns True if the file was written.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    atomic_write(path, data)
+    return True
@@ -1,6 +1,24 @@
+"""
+manifest.py
+
+Regenerate metadata.json in every project from gas-project-finder.json, the
+sync-state store, the code-analysis index (code_analysis.py) and the
+project's own JSON files.
+
+metadata.json is only rewritten (atomically) when its content changes, and the
+projects that changed are reported; --changed-paths writes their paths to a
+file so the commit step can stage just those.
+"""
+import argparse
 import json
 import os
-from typing import Any, Dict
+from typing import Any, Dict, List
+
+import code_analysis
+import fsutil
+import sync_state
+import sync_trace
+import workspace
 
 def load_json(path: str) -> Any:
     if not os.path.exists(path):
@@ -11,30 +29,106 @@ def load_json(path: str) -> Any:
         except json.JSONDecodeError:
             return None
 
-def main():
-    with open('gas-project-finder.json', 'r', encoding='utf-8') as f:
-        finder_list = json.load(f)
+def generate(projects, state, finder_list, force=False, tracer=None, code_index=None) -> List[str]:
+    """
+    Regenerate metadata.json for projects, a list of (directory, path,
+    scriptId). code_index is {scriptId: entry} as returned by
+    code_analysis.load_projects(). Returns the paths of the files that were
+    written.
+    """
+    tracer = tracer or sync_trace.Tracer(path='')
     finder_map: Dict[str, Dict[str, Any]] = {
         entry['id']: entry for entry in finder_list if 'id' in entry
     }
 
-    for root, dirs, files in os.walk('.'):
-        if '.clasp.json' in files:
-            clasp_path = os.path.join(root, '.clasp.json')
-            clasp_data = load_json(clasp_path) or {}
-            script_id = clasp_data.get('scriptId')
+    # Sync results come from the shared state store; clasp-pull.py owns those
+    # records and this script only reads them, so the two no longer overwrite
+    # each other's metadata.json fields.
+    records = state.all()
+
+    # Only the project roots from the workspace index are visited; the
+    # previous os.walk('.') also descended into .git and every project's files.
+    changed: List[str] = []
+    for directory, root, script_id in projects:
+        metadata: Dict[str, Any] = {}
+        if script_id and script_id in finder_map:
+            metadata.update(finder_map[script_id])
+        if script_id and 'id' not in metadata:
+            metadata['id'] = script_id
+
+        record = records.get(script_id) if script_id else None
+        if record:
+            metadata['sync'] = {
+                'remoteUpdateTime': record['remote_update_time'],
+                'lastPulled': record['last_pulled'],
+                'contentHash': record['content_hash'],
+                'deploymentCount': record['deployment_count'],
+                'versionCount': record['version_count'],
+                'lastError': record['last_error'],
+            }
+            if record['delisted_time']:
+                metadata['sync']['delistedTime'] = record['delisted_time']
+            if record['directory'] != directory:
+                state.update(script_id, directory=directory)
 
-            metadata: Dict[str, Any] = {}
-            if script_id and script_id in finder_map:
-                metadata.update(finder_map[script_id])
-            if script_id and 'id' not in metadata:
-                metadata['id'] = script_id
+        analysis = (code_index or {}).get(script_id) if script_id else None
+        if analysis:
+            metadata['codeAnalysis'] = {k: v for k, v in analysis.items() if k not in ('directory', 'files')}
+
+        metadata['application.json'] = load_json(os.path.join(root, 'application.json'))
+        metadata['deployments.json'] = load_json(os.path.join(root, 'deployments.json'))
+
+        meta_path = os.path.join(root, 'metadata.json')
+        data = json.dumps(metadata, ensure_ascii=False, indent=2).encode('utf-8')
+        with tracer.span(script_id or directory, 'metadata') as span:
+            if force:
+                fsutil.atomic_write(meta_path, data)
+                written = True
+            else:
+                written = fsutil.write_if_changed(meta_path, data)
+            span['bytes'] = len(data) if written else 0
+            if not written:
+                span['outcome'] = 'unchanged'
+        if written:
+            changed.append(os.path.relpath(meta_path))
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate metadata.json for every project.')
+    parser.add_argument(
+        '--changed-paths',
+        help='Write the paths of the files that changed to this file, one per line.'
+    )
+    parser.add_argument(
+        '--force', action='store_true',
+        help='Rewrite every metadata.json even if its content is unchanged.'
+    )
+    parser.add_argument(
+        '--trace',
+        help=f'Append timing spans to this JSONL file; empty to disable (default: $SYNC_TRACE or {sync_trace.DEFAULT_TRACE_PATH}).'
+    )
+    parser.add_argument(
+        '--shard', type=workspace.parse_shard,
+        help='Only regenerate the projects of shard i of N (e.g. 0/4).'
+    )
+    args = parser.parse_args()
+    tracer = sync_trace.Tracer(args.trace, script='manifest')
+
+    with open('gas-project-finder.json', 'r', encoding='utf-8') as f:
+        finder_list = json.load(f)
 
-            metadata['application.json'] = load_json(os.path.join(root, 'application.json'))
-            metadata['deployments.json'] = load_json(os.path.join(root, 'deployments.json'))
+    state = sync_state.SyncState()
+    projects = workspace.load_index().projects(args.shard)
+    changed = generate(projects, state, finder_list, args.force, tracer, code_analysis.load_projects())
+    state.close()
+    tracer.close()
 
-            with open(os.path.join(root, 'metadata.json'), 'w', encoding='utf-8') as f:
-                json.dump(metadata, f, ensure_ascii=False, indent=2)
+    print(f"metadata.json changed in {len(changed)} of {len(projects)} projects.")
+    for path in changed:
+        print(f"  {path}")
+    if args.changed_paths:
+        with open(args.changed_paths, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in changed)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+merge_shards.py
+
+Combine the results of sharded runs (--shard i/N) into one working tree, so
+that a job matrix can sync in parallel and a single job commits.
+
+  python3 merge_shards.py pack --shard i/N --out DIR [--changed-paths FILE]
+      run in each shard job after the sync: copies the changed files, the
+      sync-state store and the trace into DIR (to be uploaded as an artifact).
+
+  python3 merge_shards.py merge DIR [DIR ...] [--changed-paths FILE]
+      run in the commit job on a fresh checkout: writes every shard's files
+      into the tree, merges the records each shard owns into the sync-state
+      store, appends the traces and writes the union of the changed paths.
+
+A pack directory holds:
+  shard.json          {"shard": "i/N", "changed": [...], "deleted": [...]}
+  files/<path>        the changed files, at their paths in the repository
+  sync-state.db       a backup of the shard's sync-state store
+  sync-trace.jsonl    the shard's timing spans (if any)
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+
+import fsutil
+import sync_state
+import sync_trace
+import workspace
+
+
+def read_paths(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return sorted({line.strip() for line in f if line.strip()})
+
+
+def check_relative(path):
+    """Reject paths that would escape the repository."""
+    norm = os.path.normpath(path)
+    if os.path.isabs(norm) or norm == '..' or norm.startswith('..' + os.sep):
+        raise ValueError(f"refusing path outside the repository: {path}")
+    return norm
+
+
+def pack(shard, out_dir, changed_paths=None, state_path=None, trace_path=None):
+    paths = read_paths(changed_paths)
+    changed, deleted = [], []
+    files_dir = os.path.join(out_dir, 'files')
+    os.makedirs(files_dir, exist_ok=True)
+    for path in paths:
+        path = check_relative(path)
+        if os.path.isfile(path):
+            dst = os.path.join(files_dir, path)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(path, dst)
+            changed.append(path)
+        else:
+            deleted.append(path)
+
+    state_path = sync_state.get_state_path(state_path)
+    if os.path.exists(state_path):
+        with sync_state.SyncState(state_path) as state:
+            state.backup(os.path.join(out_dir, 'sync-state.db'))
+    trace_path = sync_trace.get_trace_path(trace_path)
+    if trace_path and os.path.exists(trace_path):
+        shutil.copyfile(trace_path, os.path.join(out_dir, 'sync-trace.jsonl'))
+
+    with open(os.path.join(out_dir, 'shard.json'), 'w', encoding='utf-8') as f:
+        json.dump({'shard': workspace.format_shard(shard), 'changed': changed, 'deleted': deleted},
+                  f, ensure_ascii=False, indent=2)
+    print(f"Packed shard {workspace.format_shard(shard)}: {len(changed)} changed, {len(deleted)} deleted file(s).")
+
+
+def merge(pack_dirs, changed_paths=None, state_path=None, trace_path=None):
+    state = sync_state.SyncState(state_path)
+    # Every shard starts from the checked-out store, so a meta value equal to
+    # it is just a copy (e.g. another shard's pull_cursor), not an update.
+    base_meta = state.all_meta()
+    trace_path = sync_trace.get_trace_path(trace_path)
+    all_paths = set()
+    for pack_dir in pack_dirs:
+        with open(os.path.join(pack_dir, 'shard.json'), 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        shard = workspace.parse_shard(info['shard'])
+
+        written = 0
+        for path in info.get('changed', []):
+            path = check_relative(path)
+            with open(os.path.join(pack_dir, 'files', path), 'rb') as f:
+                data = f.read()
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if fsutil.write_if_changed(path, data):
+                written += 1
+            all_paths.add(path)
+        for path in info.get('deleted', []):
+            path = check_relative(path)
+            if os.path.exists(path):
+                os.remove(path)
+            all_paths.add(path)
+
+        # Each shard only ever updates the records of its own projects; the
+        # other rows in its copy are just what it checked out.
+        records = 0
+        shard_db = os.path.join(pack_dir, 'sync-state.db')
+        if os.path.exists(shard_db):
+            with sync_state.SyncState(shard_db) as shard_state:
+                for script_id, record in shard_state.all().items():
+                    if workspace.in_shard(script_id, shard):
+                        state.update(script_id, **{k: record[k] for k in sync_state.FIELDS})
+                        records += 1
+                for key, value in shard_state.all_meta().items():
+                    if key not in base_meta or base_meta[key] != value:
+                        state.set_meta(key, value)
+
+        shard_trace = os.path.join(pack_dir, 'sync-trace.jsonl')
+        if trace_path and os.path.exists(shard_trace):
+            with open(shard_trace, 'r', encoding='utf-8') as src, open(trace_path, 'a', encoding='utf-8') as dst:
+                shutil.copyfileobj(src, dst)
+
+        print(f"Merged shard {info['shard']} from {pack_dir}: {written} file(s) written, "
+              f"{len(info.get('deleted', []))} deleted, {records} state record(s).")
+    state.close()
+
+    if changed_paths:
+        with open(changed_paths, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in sorted(all_paths))
+    return sorted(all_paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack and merge the results of sharded sync runs.')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('pack', help='Collect one shard\'s results into a directory.')
+    p.add_argument('--shard', type=workspace.parse_shard, required=True, help='The shard, as i/N.')
+    p.add_argument('--out', required=True, help='Directory to write the pack to.')
+    p.add_argument('--changed-paths', help='File listing the paths the shard changed.')
+    p.add_argument('--state', help='Sync-state store to include (default: $SYNC_STATE_DB or sync-state.db).')
+    p.add_argument('--trace', help='Trace file to include (default: $SYNC_TRACE or sync-trace.jsonl).')
+
+    m = sub.add_parser('merge', help='Apply shard packs to the working tree.')
+    m.add_argument('packs', nargs='+', help='Pack directories written by `pack`.')
+    m.add_argument('--changed-paths', help='Write the union of the changed paths to this file.')
+    m.add_argument('--state', help='Sync-state store to merge into (default: $SYNC_STATE_DB or sync-state.db).')
+    m.add_argument('--trace', help='Trace file to append to (default: $SYNC_TRACE or sync-trace.jsonl).')
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        pack(args.shard, args.out, args.changed_paths, args.state, args.trace)
+    else:
+        try:
+            paths = merge(args.packs, args.changed_paths, args.state, args.trace)
+        except (OSError, ValueError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"{len(paths)} path(s) changed across {len(args.packs)} shard(s).")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,112 @@
+import argparse
 import json
 import re
 
+import sync_state
+
+# Regex to capture script name (handling potential "..." and whitespace)
+# and script ID from the URL.
+# Example line: Script Name (...) - https://script.google.com/d/SCRIPT_ID_FOOBAR/edit
+# Another example: Another Script Name - https://script.google.com/d/SCRIPT_ID_BAZQUX/edit
+project_line_regex = re.compile(r"^(.*?)(?:\s*\(\.\.\.\))?\s+-\s+https://script\.google\.com/d/([^/]+)/edit.*$")
+
+
+def parse_lines(lines):
+    """
+    Parses the lines of `clasp list` output into [{"name": ..., "id": ...}, ...].
+    """
+    projects = []
+    for line in lines[1:]:  # Skip the first line "Found X scripts."
+        line = line.strip()
+        if not line:
+            continue
+
+        match = project_line_regex.match(line)
+        if match:
+            script_name = match.group(1).strip()
+            script_id = match.group(2).strip()
+            projects.append({"name": script_name, "id": script_id})
+        else:
+            print(f"Warning: Could not parse line: '{line}'")
+    return projects
+
+
+def to_json(projects):
+    """The clasp-list.json text for a parsed project list."""
+    return json.dumps(projects, indent=4, ensure_ascii=False)
+
+
+def expected_count(lines):
+    """The N of the "Found N scripts." header, or None if there is none."""
+    match = re.match(r"^Found (\d+) scripts?\.", lines[0].strip()) if lines else None
+    return int(match.group(1)) if match else None
+
+
+# A snapshot of the listing is {scriptId: {"name": ..., "lastUpdated": ...}}.
+# It is kept in the sync state so the next run can tell what changed.
+SNAPSHOT_KEY = 'list_snapshot'
+
+
+def snapshot(projects, finder_list=()):
+    """
+    Snapshot of a parsed listing. Names and lastUpdated come from the finder
+    snapshot when it has the project (`clasp list` truncates long names).
+    """
+    finder = {e['id']: e for e in finder_list if isinstance(e, dict) and 'id' in e}
+    current = {}
+    for project in projects:
+        entry = finder.get(project['id'], {})
+        current[project['id']] = {'name': entry.get('name') or project.get('name'),
+                                  'lastUpdated': entry.get('lastUpdated')}
+    return current
+
+
+class ListDelta:
+    """What changed between two listing snapshots; each list holds scriptIds, sorted."""
+
+    def __init__(self, added=(), removed=(), renamed=(), touched=()):
+        self.added = sorted(added)
+        self.removed = sorted(removed)
+        self.renamed = sorted(renamed)
+        self.touched = sorted(touched)
+
+    def script_ids(self):
+        """Every scriptId in the delta."""
+        return set(self.added) | set(self.removed) | set(self.renamed) | set(self.touched)
+
+    def summary(self):
+        return (f"{len(self.added)} added, {len(self.removed)} removed, "
+                f"{len(self.renamed)} renamed, {len(self.touched)} touched")
+
+    def to_dict(self):
+        return {'added': self.added, 'removed': self.removed, 'renamed': self.renamed, 'touched': self.touched}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('added', ()), data.get('removed', ()), data.get('renamed', ()), data.get('touched', ()))
+
+
+def diff(previous, current, complete=True):
+    """
+    The ListDelta from snapshot previous to snapshot current. A project is
+    touched when its lastUpdated moved forward (or appeared), and renamed
+    when its name changed; it can be both. With complete=False (the listing
+    may be truncated) nothing is reported as removed.
+    """
+    added = [sid for sid in current if sid not in previous]
+    removed = [sid for sid in previous if sid not in current] if complete else []
+    renamed, touched = [], []
+    for sid, entry in current.items():
+        old = previous.get(sid)
+        if old is None:
+            continue
+        if entry.get('name') != old.get('name'):
+            renamed.append(sid)
+        if entry.get('lastUpdated') and entry['lastUpdated'] > (old.get('lastUpdated') or ''):
+            touched.append(sid)
+    return ListDelta(added, removed, renamed, touched)
+
+
 def parse_clasp_list(input_filepath="clasp-list.txt", output_filepath="clasp-list.json"):
     """
     Parses a list of Google Apps Script projects from a text file and outputs a JSON file.
@@ -8,52 +114,100 @@ def parse_clasp_list(input_filepath="clasp-list.txt", output_filepath="clasp-lis
     Args:
         input_filepath (str): Path to the input text file (default: "clasp-list.txt").
         output_filepath (str): Path to the output JSON file (default: "clasp-list.json").
+
+    Returns:
+        (projects, complete): the parsed list (None on error) and whether it
+        has as many projects as the "Found N scripts." header announced.
     """
-    projects = []
     try:
         with open(input_filepath, 'r', encoding='utf-8') as f:
             lines = f.readlines()
     except FileNotFoundError:
         print(f"Error: Input file '{input_filepath}' not found.")
-        return
+        return None, False
     except IOError as e:
         print(f"Error reading file '{input_filepath}': {e}")
-        return
+        return None, False
 
     if not lines:
         print(f"Warning: Input file '{input_filepath}' is empty.")
-        return
+        return None, False
 
-    # Regex to capture script name (handling potential "..." and whitespace)
-    # and script ID from the URL.
-    # Example line: Script Name (...) - https://script.google.com/d/SCRIPT_ID_FOOBAR/edit
-    # Another example: Another Script Name - https://script.google.com/d/SCRIPT_ID_BAZQUX/edit
-    project_line_regex = re.compile(r"^(.*?)(?:\s*\(\.\.\.\))?\s+-\s+https://script\.google\.com/d/([^/]+)/edit.*$")
-
-    for line in lines[1:]:  # Skip the first line "Found X scripts."
-        line = line.strip()
-        if not line:
-            continue
-
-        match = project_line_regex.match(line)
-        if match:
-            script_name = match.group(1).strip()
-            script_id = match.group(2).strip()
-            projects.append({"name": script_name, "id": script_id})
-        else:
-            print(f"Warning: Could not parse line: '{line}'")
+    projects = parse_lines(lines)
+    complete = expected_count(lines) == len(projects)
+    if not complete:
+        print(f"Warning: '{input_filepath}' announces {expected_count(lines)} scripts but {len(projects)} were parsed.")
 
     try:
         with open(output_filepath, 'w', encoding='utf-8') as f:
-            json.dump(projects, f, indent=4, ensure_ascii=False)
+            f.write(to_json(projects))
         print(f"Successfully parsed {len(projects)} projects and saved to '{output_filepath}'")
     except IOError as e:
         print(f"Error writing JSON to file '{output_filepath}': {e}")
     except Exception as e:
         print(f"An unexpected error occurred during JSON writing: {e}")
+    return projects, complete
+
+
+def write_delta(projects, complete, delta_path, finder_path="gas-project-finder.json", state_path=None):
+    """
+    Diff projects against the snapshot in the sync state and write the delta
+    to delta_path as JSON, together with the new snapshot. The stored
+    snapshot is not changed: run advance() once the steps that consume the
+    delta have succeeded, so a failed run sees the same delta again. Without
+    a previous snapshot every project is reported as added.
+    """
+    try:
+        with open(finder_path, 'r', encoding='utf-8') as f:
+            finder_list = json.load(f)
+    except (OSError, ValueError):
+        finder_list = []
+    current = snapshot(projects, finder_list)
+    with sync_state.SyncState(state_path) as state:
+        previous = state.get_meta(SNAPSHOT_KEY) or {}
+    delta = diff(previous, current, complete)
+    if not complete:
+        # Keep the projects missing from a truncated listing until a full one confirms they are gone.
+        current = dict({sid: entry for sid, entry in previous.items() if sid not in current}, **current)
+    with open(delta_path, 'w', encoding='utf-8') as f:
+        json.dump(dict(delta.to_dict(), snapshot=current), f, indent=2, ensure_ascii=False)
+    print(f"Delta: {delta.summary()}; saved to '{delta_path}'")
+    return delta
+
+
+def advance(delta_path, state_path=None):
+    """Store the snapshot of a delta written by write_delta() as the previous listing."""
+    with open(delta_path, 'r', encoding='utf-8') as f:
+        current = json.load(f)['snapshot']
+    with sync_state.SyncState(state_path) as state:
+        state.set_meta(SNAPSHOT_KEY, current)
+    print(f"Listing snapshot advanced to the {len(current)} projects of '{delta_path}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parse clasp-list.txt into clasp-list.json.')
+    parser.add_argument('input', nargs='?', default='clasp-list.txt', help='`clasp list` output (default: clasp-list.txt).')
+    parser.add_argument('output', nargs='?', default='clasp-list.json', help='JSON output (default: clasp-list.json).')
+    parser.add_argument(
+        '--delta',
+        help='Also write the projects added, removed, renamed and touched since the previous run to this JSON file.'
+    )
+    parser.add_argument(
+        '--advance', metavar='DELTA',
+        help='Only store the snapshot of this delta file as the previous listing (after its consumers succeeded).'
+    )
+    parser.add_argument('--finder', default='gas-project-finder.json',
+                        help='GAS Project Finder snapshot with names and lastUpdated (default: gas-project-finder.json).')
+    parser.add_argument('--state', help='Path of the sync-state database that keeps the previous listing.')
+    args = parser.parse_args()
+
+    if args.advance:
+        advance(args.advance, args.state)
+        return
+    projects, complete = parse_clasp_list(args.input, args.output)
+    if projects is not None and args.delta:
+        write_delta(projects, complete, args.delta, args.finder, args.state)
 
 
 if __name__ == "__main__":
-    parse_clasp_list()
-    # Example of how to use it with different file names:
-    # parse_clasp_list(input_filepath="my_scripts.txt", output_filepath="my_scripts.json")
+    main()
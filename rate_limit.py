@@ -0,0 +1,185 @@
+"""
+rate_limit.py
+
+Shared scheduling of the outbound Apps Script API calls and clasp runs, so a
+parallel sync stays inside the per-user quotas instead of tripping them.
+
+Every call first takes a token from the bucket of its kind ('api' or
+'clasp'). A budget of Q calls per minute is split into a burst of Q/10 and a
+steady refill of the remaining 9Q/10 per minute, so no 60-second window ever
+sees more than Q calls; a budget of 0 means no limit.
+
+A failed call is retried with exponential backoff and full jitter (a random
+delay between 0 and base * 2^(attempt-1), capped). A Retry-After value is
+honoured as a minimum. A quota error (HTTP 429, or clasp reporting a rate
+limit) pauses the whole bucket, because the quota is shared by every worker.
+
+The module-level `limiter` is the one instance the scripts share. It counts
+the time spent waiting for budget and backing off; summary() reports it.
+"""
+import email.utils
+import random
+import re
+import threading
+import time
+
+# HTTP statuses worth retrying: quota exhaustion and transient server errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 64.0
+
+# clasp output (or an API error body) that indicates a quota problem.
+RATE_LIMIT_PATTERN = re.compile(
+    r"\b429\b|rate limit|ratelimitexceeded|quota|resource_exhausted|too many requests",
+    re.IGNORECASE,
+)
+
+
+def is_rate_limit_error(text):
+    """True if a clasp/API error message reports an exhausted quota."""
+    return bool(text and RATE_LIMIT_PATTERN.search(text))
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+class TokenBucket:
+    """Thread-safe token bucket; callers queue for tokens in the order they ask."""
+
+    def __init__(self, per_minute=0, clock=time.monotonic):
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.configure(per_minute)
+
+    def configure(self, per_minute):
+        with self._lock:
+            self.per_minute = per_minute or 0
+            if self.per_minute > 0:
+                self.capacity = max(1.0, self.per_minute / 10)
+                self.rate = max(self.per_minute - self.capacity, 1.0) / 60
+            else:
+                self.capacity = self.rate = None
+            self.tokens = self.capacity or 0.0
+            self._last = self.clock()
+
+    def reserve(self):
+        """Take a token and return how many seconds the caller must wait before using it."""
+        with self._lock:
+            now = self.clock()
+            wait = max(0.0, self._paused_until - now)
+            if self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+                self._last = now
+                # The balance may go negative: later callers queue behind earlier ones.
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def pause(self, seconds):
+        """Hold back every caller for the next seconds (e.g. after a 429)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, self.clock() + seconds)
+
+
+class RateLimiter:
+    """Per-kind token buckets plus the retry backoff policy, with throttling statistics."""
+
+    def __init__(self, api_per_minute=0, clasp_per_minute=0, max_retries=DEFAULT_MAX_RETRIES,
+                 base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 clock=time.monotonic, sleep=time.sleep, rng=None):
+        self.clock = clock
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.buckets = {
+            'api': TokenBucket(api_per_minute, clock),
+            'clasp': TokenBucket(clasp_per_minute, clock),
+        }
+        self._lock = threading.Lock()
+        self.stats = {kind: {'calls': 0, 'waited': 0.0, 'retries': 0, 'backoff': 0.0, 'quota_errors': 0}
+                      for kind in self.buckets}
+
+    def configure(self, api_per_minute=None, clasp_per_minute=None, max_retries=None):
+        """Change the budgets of the shared limiter (None keeps the current value)."""
+        if api_per_minute is not None:
+            self.buckets['api'].configure(api_per_minute)
+        if clasp_per_minute is not None:
+            self.buckets['clasp'].configure(clasp_per_minute)
+        if max_retries is not None:
+            self.max_retries = max_retries
+
+    def acquire(self, kind):
+        """Wait until a call of this kind fits the budget. Returns the seconds waited."""
+        wait = self.buckets[kind].reserve()
+        if wait > 0:
+            self.sleep(wait)
+        with self._lock:
+            self.stats[kind]['calls'] += 1
+            self.stats[kind]['waited'] += wait
+        return wait
+
+    def delay(self, attempt, retry_after=None):
+        """Backoff before retry number attempt (1-based): full jitter, at least retry_after."""
+        ceiling = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        delay = self.rng.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def backoff(self, kind, attempt, retry_after=None, quota=False):
+        """
+        Sleep before retrying a failed call and return the delay. A quota
+        error pauses the whole bucket, so the other workers back off too.
+        """
+        delay = self.delay(attempt, retry_after)
+        if quota:
+            self.buckets[kind].pause(delay)
+        with self._lock:
+            stats = self.stats[kind]
+            stats['retries'] += 1
+            stats['backoff'] += delay
+            if quota:
+                stats['quota_errors'] += 1
+        self.sleep(delay)
+        return delay
+
+    def throttled_seconds(self):
+        with self._lock:
+            return sum(s['waited'] + s['backoff'] for s in self.stats.values())
+
+    def summary(self):
+        with self._lock:
+            parts = [f"{kind} {s['calls']} call(s), {s['waited']:.1f}s waiting for budget, "
+                     f"{s['retries']} retr{'y' if s['retries'] == 1 else 'ies'} "
+                     f"({s['quota_errors']} quota) with {s['backoff']:.1f}s backoff"
+                     for kind, s in self.stats.items() if s['calls']]
+        return "Rate limiter (times summed over workers): " + ("; ".join(parts) if parts else "no calls")
+
+    def record(self, tracer):
+        """Add one 'throttle' span per kind to a sync_trace.Tracer."""
+        with self._lock:
+            stats = {kind: dict(s) for kind, s in self.stats.items()}
+        for kind, s in stats.items():
+            if s['calls']:
+                tracer.record(project=None, phase='throttle', kind=kind, duration=round(s['waited'] + s['backoff'], 6),
+                              outcome='ok', calls=s['calls'], waited=round(s['waited'], 6),
+                              backoff=round(s['backoff'], 6), retries=s['retries'], quota_errors=s['quota_errors'])
+
+
+limiter = RateLimiter()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+reconcile.py
+
+Run the whole sync pipeline in one process:
+
+  list       `clasp list` -> clasp-list.txt
+  parse      clasp-list.txt -> clasp-list.json
+  finder     download gas-project-finder.json from the GAS Project Finder web app
+  delta      diff the listing against the previous run's: added, removed,
+             renamed and touched (lastUpdated moved forward) projects
+  dirs       create a directory and .clasp.json for every added scriptId
+  freshness  decide which projects changed (finder snapshot, then the API)
+  pull       pull the changed projects
+  analyze    update the code-analysis index (code_analysis.py)
+  metadata   regenerate metadata.json
+  site       update the search index, the catalog and sw.js
+
+This replaces the chain of workflows that each checked out the repository
+and rescanned the tree. The workspace index, the parsed list and the sync
+state are kept in memory between stages; the state store is written once at
+the end. --stages selects a subset (e.g. --stages parse,dirs,metadata), and
+the time spent in each stage is printed and traced as a "stage:<name>" span.
+--time-budget counts from the start of the process, not of the pull stage.
+
+With a delta, the later stages only visit the projects it names, plus those
+that are behind their listed lastUpdated or failed last time, so an hourly
+run does work in proportion to what changed. Projects removed from the
+listing are marked delisted in the sync state and no longer pulled. The
+listing snapshot is only advanced after a run in which every stage that
+consumes the delta succeeded, so a failed run sees the same delta again.
+There is no delta on the first run, with --full, or when the finder
+snapshot is too old to tell which projects were touched; then every
+project is reconciled as before.
+"""
+import argparse
+import datetime
+import importlib
+import json
+import os
+import sys
+import time
+import urllib.request
+
+import catalog
+import clasp_watchdog
+import code_analysis
+import create_missing_scriptid_dirs
+import fsutil
+import manifest
+import parse_clasp_list
+import rate_limit
+import search_index
+import service_worker
+import sync_state
+import sync_trace
+import workspace
+
+clasp_pull = importlib.import_module('clasp-pull')
+
+STAGES = ('list', 'parse', 'finder', 'delta', 'dirs', 'freshness', 'pull', 'analyze', 'metadata', 'site')
+# The stages that only visit what the delta names; the snapshot is advanced when all of them ran.
+DELTA_CONSUMERS = {'dirs', 'freshness', 'pull', 'analyze', 'metadata', 'site'}
+FINDER_URL = ('https://script.google.com/macros/s/AKfycbz0a4RTpHE5Bxn3AeHWEAD7QHreptLqpa3HLxatARciZwYLJk8jd494G3Dd5_PF3WsJFg'
+              '/exec?json')
+
+
+def parse_stages(text):
+    stages = [s.strip() for s in text.split(',') if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown stage(s) {', '.join(unknown)}; choose from {', '.join(STAGES)}")
+    return set(stages)
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class Pipeline:
+    """What the stages share while the process runs."""
+
+    def __init__(self, args):
+        self.args = args
+        self.started = time.monotonic()
+        self.state = sync_state.SyncState(args.state, in_memory=True)
+        self.tracer = sync_trace.Tracer(args.trace, script='reconcile')
+        self.index = workspace.load_index()
+        self.listed = None
+        self.list_complete = True
+        self.finder_age = None
+        self.snapshot = None
+        self.delta = None
+        # scriptIds the later stages visit; None means every project.
+        self.targets = None
+        self.sync_list = None
+        self.freshness = None
+        self.tokens = None
+        self.client = None
+        self.changed = set()
+        self.timings = []
+
+    def api(self):
+        """The shared token manager and API client, opened on first use."""
+        if self.tokens is None:
+            self.tokens, self.client = clasp_pull.open_client(self.args)
+        return self.tokens, self.client
+
+    def projects(self):
+        """The projects of this shard that the stages should visit."""
+        projects = self.index.projects(self.args.shard)
+        if self.targets is not None:
+            projects = [p for p in projects if p[2] in self.targets]
+        return projects
+
+    def sync_projects(self):
+        """projects() without the delisted ones, for the freshness check and the pull."""
+        if self.sync_list is None:
+            self.sync_list = clasp_pull.listed_projects(self.projects(), self.state.all())
+        return self.sync_list
+
+    def write(self, path, data):
+        if fsutil.write_if_changed(path, data):
+            self.changed.add(os.path.relpath(path))
+
+    def close(self):
+        if self.client:
+            self.client.close()
+        self.state.save()
+        self.state.close()
+        rate_limit.limiter.record(self.tracer)
+        clasp_watchdog.watchdog.record(self.tracer)
+        self.tracer.close()
+
+    # Stages, in order.
+
+    def stage_list(self):
+        tokens, _ = self.api()
+        proc = clasp_pull.run_clasp_with_retry('clasp list', capture_output=True, tokens=tokens, hedgeable=True)
+        self.write('clasp-list.txt', proc.stdout)
+        print(proc.stdout.splitlines()[0] if proc.stdout else "clasp list printed nothing.")
+
+    def stage_parse(self):
+        with open('clasp-list.txt', 'r', encoding='utf-8') as f:
+            lines = f.readlines()
+        self.listed = parse_clasp_list.parse_lines(lines)
+        expected = parse_clasp_list.expected_count(lines)
+        self.list_complete = expected == len(self.listed)
+        self.write('clasp-list.json', parse_clasp_list.to_json(self.listed))
+        print(f"Parsed {len(self.listed)} projects.")
+        if not self.list_complete:
+            print(f"Warning: clasp list announced {expected} scripts; no project is treated as removed.",
+                  file=sys.stderr)
+
+    def stage_finder(self):
+        try:
+            with urllib.request.urlopen(self.args.finder_url, timeout=120) as response:
+                data = response.read()
+            finder = json.loads(data)
+            if not isinstance(finder, list):
+                raise ValueError('expected a JSON list')
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not fetch the finder snapshot ({e}); keeping {self.args.finder}.", file=sys.stderr)
+            return
+        self.write(self.args.finder, data)
+        self.finder_age = 0.0
+        print(f"Finder snapshot lists {len(finder)} projects.")
+
+    def stage_delta(self):
+        if self.listed is None:
+            self.listed = load_json('clasp-list.json', [])
+        current = parse_clasp_list.snapshot(self.listed, load_json(self.args.finder, []))
+        previous = self.state.get_meta(parse_clasp_list.SNAPSHOT_KEY)
+        if previous is None:
+            self.snapshot = current
+            print(f"No previous listing snapshot; reconciling all {len(current)} listed projects.")
+            return
+        delta = parse_clasp_list.diff(previous, current, self.list_complete)
+        if not self.list_complete:
+            # Projects missing from a truncated listing stay in the snapshot until a full one drops them.
+            current = dict({sid: entry for sid, entry in previous.items() if sid not in current}, **current)
+        self.snapshot = current
+        self.delta = delta
+        print(f"Listing delta: {delta.summary()} (of {len(current)} listed).")
+
+        records = self.state.all()
+        now = sync_state.utc_now()
+        for script_id in delta.removed:
+            if not (records.get(script_id) or {}).get('delisted_time'):
+                self.state.update(script_id, delisted_time=now)
+        for script_id in delta.added:
+            if (records.get(script_id) or {}).get('delisted_time'):
+                self.state.update(script_id, delisted_time=None)
+
+        if self.args.full:
+            print("--full: reconciling every project anyway.")
+            return
+        age = self.finder_age if self.finder_age is not None else clasp_pull.finder_snapshot_age(self.args.finder, self.state)
+        if age is None or age > self.args.finder_max_age * 3600:
+            print("The finder snapshot is missing or too old to tell which projects were touched; "
+                  "reconciling every project.")
+            return
+        # Besides the delta: projects still behind their listed lastUpdated (e.g. deferred by the
+        # time budget), never synced or failed last time. Projects without a lastUpdated to compare
+        # are checked again once their last check is older than --finder-max-age.
+        targets = delta.script_ids()
+        cutoff = (datetime.datetime.now(datetime.timezone.utc)
+                  - datetime.timedelta(hours=self.args.finder_max_age)).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        removed = set(delta.removed)
+        for script_id in set(current) | self.index.script_ids():
+            record = records.get(script_id) or {}
+            if script_id in removed or record.get('delisted_time'):
+                continue
+            listed_time = (current.get(script_id) or {}).get('lastUpdated')
+            synced = clasp_pull.synced_time(record)
+            if record.get('last_error') or not synced:
+                targets.add(script_id)
+            elif listed_time:
+                if listed_time > synced:
+                    targets.add(script_id)
+            elif max(record.get('last_checked') or '', record.get('last_pulled') or '') < cutoff:
+                targets.add(script_id)
+        self.targets = targets
+        print(f"{len(targets)} project(s) to reconcile.")
+
+    def stage_dirs(self):
+        if self.listed is None:
+            self.listed = load_json('clasp-list.json', [])
+        if self.delta is not None and not self.args.full:
+            added = set(self.delta.added)
+            entries = [(p['id'], p.get('name', '')) for p in self.listed if p.get('id') in added]
+        else:
+            entries = [(p['id'], p.get('name', '')) for p in self.listed if 'id' in p]
+        created = create_missing_scriptid_dirs.create_missing(entries, self.index.script_ids(), self.state,
+                                                              shard=self.args.shard)
+        if created:
+            self.changed.update(os.path.join(sid, '.clasp.json') for sid in created)
+            self.index = workspace.load_index()
+            self.sync_list = None
+
+    def stage_freshness(self):
+        _, client = self.api()
+        projects = self.sync_projects()
+        self.state.import_legacy_metadata(projects)
+        ids = [sid for _, _, sid in projects if sid]
+        self.freshness = clasp_pull.check_freshness(ids, self.state.all(), client, self.args, self.tracer,
+                                                    finder_age=self.finder_age, state=self.state)
+
+    def stage_pull(self):
+        tokens, client = self.api()
+        projects = self.sync_projects()
+        freshness = self.freshness or clasp_pull.Freshness({}, set(), {})
+        if self.freshness is None:
+            print("No freshness stage: pulling every project.")
+        cursor_key = 'pull_cursor' + (f":{workspace.format_shard(self.args.shard)}" if self.args.shard else '')
+        results, changed = clasp_pull.pull_projects(projects, self.state, self.state.all(), freshness,
+                                                    client, tokens, self.args, self.tracer, self.started, cursor_key)
+        self.changed.update(changed)
+        clasp_pull.print_summary(results)
+
+    def stage_analyze(self):
+        analyzed, written = code_analysis.build(only=self.targets)
+        self.changed.update(os.path.relpath(path) for path in written)
+        if self.targets is not None:
+            # e.g. projects indexed for the first time: their metadata.json needs the entry too.
+            self.targets |= set(analyzed)
+
+    def stage_metadata(self):
+        finder_list = load_json(self.args.finder, [])
+        projects = self.projects()
+        changed = manifest.generate(projects, self.state, finder_list, tracer=self.tracer,
+                                    code_index=code_analysis.load_projects())
+        self.changed.update(changed)
+        print(f"metadata.json changed in {len(changed)} of {len(projects)} projects.")
+
+    def stage_site(self):
+        reindexed, written = search_index.build(only=self.targets)
+        written += catalog.build(only=self.targets)
+        written += service_worker.build()
+        self.changed.update(os.path.relpath(path) for path in written)
+        print(f"Search index: {len(reindexed)} project(s) re-indexed; {len(written)} site file(s) changed.")
+
+    def run(self, stages):
+        for name in STAGES:
+            if name not in stages:
+                continue
+            print(f"== {name} ==")
+            start = time.perf_counter()
+            outcome = 'ok'
+            try:
+                with self.tracer.span(None, f"stage:{name}"):
+                    getattr(self, f"stage_{name}")()
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                self.timings.append((name, time.perf_counter() - start, outcome))
+        if self.snapshot is not None:
+            if DELTA_CONSUMERS <= stages:
+                self.state.set_meta(parse_clasp_list.SNAPSHOT_KEY, self.snapshot)
+            else:
+                print("Not every stage that uses the delta ran; the listing snapshot is left as it was.")
+
+
+def print_timings(timings):
+    print("Stage timings:")
+    for name, seconds, outcome in timings:
+        print(f"  {name:<10} {seconds:>9.3f}s  {outcome}")
+    print(f"  {'total':<10} {sum(t for _, t, _ in timings):>9.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run list, parse, finder, delta, dirs, freshness, pull, analyze, metadata and site in one process.')
+    parser.add_argument(
+        '--stages', type=parse_stages, default=set(STAGES),
+        help=f"Comma-separated stages to run (default: all of {','.join(STAGES)})."
+    )
+    clasp_pull.add_sync_arguments(parser)
+    parser.add_argument(
+        '--finder-url', default=FINDER_URL,
+        help='URL of the GAS Project Finder web app JSON (used by the finder stage).'
+    )
+    parser.add_argument(
+        '--state',
+        help=f'Path of the sync-state database (default: $SYNC_STATE_DB or {sync_state.DEFAULT_STATE_PATH}).'
+    )
+    parser.add_argument(
+        '--trace',
+        help=f'Append timing spans to this JSONL file; empty to disable (default: $SYNC_TRACE or {sync_trace.DEFAULT_TRACE_PATH}).'
+    )
+    parser.add_argument(
+        '--changed-paths',
+        help='Write the paths of the files that changed in any stage to this file, one per line.'
+    )
+    parser.add_argument(
+        '--shard', type=workspace.parse_shard,
+        help='Limit dirs, freshness, pull and metadata to shard i of N (e.g. 0/4).'
+    )
+    parser.add_argument(
+        '--full', action='store_true',
+        help='Visit every project in the stages after delta, not only the ones the listing delta names.'
+    )
+    args = parser.parse_args()
+
+    pipeline = Pipeline(args)
+    failed = False
+    try:
+        pipeline.run(args.stages)
+    except Exception as e:
+        print(f"Error: stage failed: {e!r}", file=sys.stderr)
+        failed = True
+    finally:
+        pipeline.close()
+
+    print_timings(pipeline.timings)
+    print(rate_limit.limiter.summary())
+    print(clasp_watchdog.watchdog.summary())
+    print(f"{len(pipeline.changed)} file(s) changed.")
+    if args.changed_paths:
+        with open(args.changed_paths, 'w', encoding='utf-8') as f:
+            f.writelines(path + '\n' for path in sorted(pipeline.changed))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+search_index.py
+
+Build a static full-text search index over every project's sources for
+find.html.
+
+Each project's .js / .html files, README.md and appsscript.json are
+tokenised: ASCII identifiers and words are lowercased (camelCase identifiers
+are also indexed by their parts), and Japanese text is indexed as character
+bigrams. The result is an inverted index split into a fixed number of shards:
+
+  search-index/projects.json   {"version", "shards", "projects": {num: {"id", "name", "hash"}}}
+  search-index/shard-NN.json   {token: [project num, ...]}
+
+A token's shard is FNV-1a (32 bit, over UTF-16 code units) of the token
+modulo the shard count, so the browser can compute which file to fetch.
+
+The build is incremental: a project is re-tokenised only when the hash of its
+indexed files changed, its postings are replaced in place, and only shards
+whose bytes change are rewritten.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+
+import fsutil
+import workspace
+
+INDEX_DIR = 'search-index'
+INDEX_VERSION = 1
+DEFAULT_SHARDS = 32
+
+INDEXED_NAMES = ('README.md', 'appsscript.json')
+INDEXED_EXTENSIONS = ('.js', '.gs', '.html')
+MAX_TOKEN_LENGTH = 40
+
+WORD_RE = re.compile(r"[A-Za-z_$][A-Za-z0-9_$]*")
+CAMEL_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+# Hiragana, katakana, CJK ideographs (incl. extension A and compatibility) and half-width katakana.
+CJK_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff66-\uff9f]+")
+
+STOP_WORDS = {
+    'var', 'let', 'const', 'function', 'return', 'if', 'else', 'for', 'while',
+    'the', 'and', 'of', 'to', 'in', 'is', 'it', 'new', 'this', 'true', 'false', 'null',
+}
+
+
+def tokenize(text):
+    """Return the set of index tokens in text. Kept in sync with tokenize() in find.html."""
+    tokens = set()
+    for word in WORD_RE.findall(text):
+        lower = word.lower()
+        if len(lower) < 2 or len(lower) > MAX_TOKEN_LENGTH or lower in STOP_WORDS:
+            continue
+        tokens.add(lower)
+        parts = CAMEL_RE.findall(word)
+        if len(parts) > 1:
+            for part in parts:
+                part = part.lower()
+                if len(part) >= 2 and part not in STOP_WORDS:
+                    tokens.add(part)
+    for run in CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        for i in range(len(run) - 1):
+            tokens.add(run[i:i + 2])
+    return tokens
+
+
+def shard_of(token, shards):
+    """FNV-1a over the UTF-16 code units of token, modulo shards."""
+    h = 0x811c9dc5
+    data = token.encode('utf-16-le')
+    for i in range(0, len(data), 2):
+        h ^= data[i] | (data[i + 1] << 8)
+        h = (h * 0x01000193) & 0xffffffff
+    return h % shards
+
+
+def indexed_files(project_dir):
+    """Relative paths of the files of a project that go into the index, sorted."""
+    paths = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name in INDEXED_NAMES or name.endswith(INDEXED_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(root, name), project_dir))
+    return sorted(paths)
+
+
+def read_project(project_dir):
+    """Return (content hash, list of file texts) for a project."""
+    digest = hashlib.sha256()
+    texts = []
+    for rel_path in indexed_files(project_dir):
+        with open(os.path.join(project_dir, rel_path), 'rb') as f:
+            data = f.read()
+        digest.update(rel_path.replace(os.sep, '/').encode('utf-8') + b'\0' + data + b'\0')
+        texts.append(data.decode('utf-8', errors='replace'))
+    return digest.hexdigest(), texts
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def load_finder_names(path='gas-project-finder.json'):
+    finder = load_json(path, [])
+    return {entry['id']: entry.get('name') for entry in finder if isinstance(entry, dict) and 'id' in entry}
+
+
+def build(index_dir=INDEX_DIR, shards=DEFAULT_SHARDS, force=False, only=None):
+    """
+    Update the index in index_dir. With only (a set of scriptIds), the files
+    of the other already indexed projects are not even read. Returns (list of
+    reindexed scriptIds, list of paths of the index files that were
+    rewritten).
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    projects_path = os.path.join(index_dir, 'projects.json')
+    previous = load_json(projects_path, {})
+    if force or previous.get('version') != INDEX_VERSION or previous.get('shards') != shards:
+        previous = {}
+    old_projects = {int(num): info for num, info in previous.get('projects', {}).items()}
+    num_of = {info['id']: num for num, info in old_projects.items()}
+
+    postings = [{} for _ in range(shards)]
+    if previous:
+        for n in range(shards):
+            shard = load_json(os.path.join(index_dir, f"shard-{n:02d}.json"), {})
+            postings[n] = {token: set(nums) for token, nums in shard.items()}
+
+    names = load_finder_names()
+    current = workspace.load_index()
+    projects = {}
+    stale = set()
+    fresh_tokens = {}
+    next_num = max(old_projects, default=-1) + 1
+    for directory, project_dir, script_id in current.projects():
+        if not script_id:
+            continue
+        num = num_of.get(script_id)
+        if num is not None and only is not None and script_id not in only:
+            projects[num] = dict(old_projects[num], name=names.get(script_id) or old_projects[num].get('name'))
+            continue
+        content_hash, texts = read_project(project_dir)
+        if num is None:
+            num = next_num
+            next_num += 1
+        elif old_projects[num].get('hash') == content_hash:
+            projects[num] = dict(old_projects[num], name=names.get(script_id) or old_projects[num].get('name'))
+            continue
+        else:
+            stale.add(num)
+        projects[num] = {'id': script_id, 'name': names.get(script_id) or directory, 'hash': content_hash}
+        tokens = set()
+        for text in texts:
+            tokens |= tokenize(text)
+        fresh_tokens[num] = tokens
+
+    # Projects that disappeared from the workspace are dropped from the postings too.
+    stale |= set(old_projects) - set(projects)
+    if stale:
+        for shard in postings:
+            for token in list(shard):
+                nums = shard[token] - stale
+                if nums:
+                    shard[token] = nums
+                else:
+                    del shard[token]
+    for num, tokens in fresh_tokens.items():
+        for token in tokens:
+            postings[shard_of(token, shards)].setdefault(token, set()).add(num)
+
+    written = []
+    for n, shard in enumerate(postings):
+        path = os.path.join(index_dir, f"shard-{n:02d}.json")
+        data = json.dumps({token: sorted(shard[token]) for token in sorted(shard)},
+                          ensure_ascii=False, separators=(',', ':'))
+        if fsutil.write_if_changed(path, data):
+            written.append(path)
+    for name in os.listdir(index_dir):
+        m = re.match(r'^shard-(\d+)\.json$', name)
+        if m and int(m.group(1)) >= shards:
+            os.remove(os.path.join(index_dir, name))
+            written.append(os.path.join(index_dir, name))
+    data = json.dumps({
+        'version': INDEX_VERSION,
+        'shards': shards,
+        'projects': {str(num): projects[num] for num in sorted(projects)},
+    }, ensure_ascii=False, indent=1)
+    if fsutil.write_if_changed(projects_path, data):
+        written.append(projects_path)
+    return sorted(projects[num]['id'] for num in fresh_tokens), written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the full-text search index for find.html.')
+    parser.add_argument('--index-dir', default=INDEX_DIR, help=f'Output directory (default: {INDEX_DIR}).')
+    parser.add_argument('--shards', type=int, default=DEFAULT_SHARDS,
+                        help=f'Number of index shards (default: {DEFAULT_SHARDS}).')
+    parser.add_argument('--force', action='store_true', help='Rebuild every project from scratch.')
+    parser.add_argument('--changed-paths', help='Append the paths of rewritten index files to this file.')
+    args = parser.parse_args()
+
+    reindexed, written = build(args.index_dir, args.shards, args.force)
+    print(f"Re-indexed {len(reindexed)} project(s); {len(written)} index file(s) changed.")
+    for script_id in reindexed:
+        print(f"  {script_id}")
+    if args.changed_paths:
+        with open(args.changed_paths, 'a', encoding='utf-8') as f:
+            f.writelines(os.path.relpath(path) + '\n' for path in written)
+
+
+if __name__ == '__main__':
+    main()
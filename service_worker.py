@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+service_worker.py
+
+Generate sw.js for the static site from the published assets, instead of
+hand-editing a CACHE_NAME timestamp on every deploy.
+
+The generated worker carries a precache manifest of [{"url", "revision"}]
+where the revision is the first 12 hex digits of the sha256 of the file:
+
+  index.html, find.html, style.css, README.md (and ./ as index.html)
+  catalog/index.json and the catalog shards it lists
+  every project's README.md
+  the site icons, when the moukaeritai-pictgram submodule is checked out
+  the pinned Bootstrap files on the CDN (revision null: the URL is versioned)
+
+Each entry is cached under its URL plus its revision, so when sw.js changes
+the browser only downloads the entries whose revision changed and the
+activate step drops the rest. The large JSON lists (clasp-list.json,
+gas-project-finder.json, the search index) are not precached; they are
+served stale-while-revalidate from a runtime cache.
+
+sw.js only changes when a revision does, so rerunning this is a no-op.
+"""
+import argparse
+import hashlib
+import json
+import os
+
+import fsutil
+import workspace
+
+SW_PATH = 'sw.js'
+CACHE_PREFIX = 'moukaeritai-work'
+STATIC_ASSETS = ('index.html', 'find.html', 'style.css', 'README.md')
+ICONS = ('moukaeritai-pictgram/64x64.webp/gold_green.webp', 'moukaeritai-pictgram/64x64.webp/slate_teal.webp')
+CDN_URLS = (
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+    'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
+)
+# URL prefixes (relative to the worker's scope, or absolute) served stale-while-revalidate.
+STALE_WHILE_REVALIDATE = (
+    './clasp-list.json',
+    './gas-project-finder.json',
+    './search-index/',
+    './moukaeritai-pictgram/',
+    'https://cdn.jsdelivr.net/npm/marked/',
+)
+
+SW_TEMPLATE = """\
+// Generated by service_worker.py from the published files; do not edit by hand.
+const PRECACHE = '%(cache_prefix)s-precache';
+const RUNTIME = '%(cache_prefix)s-runtime';
+
+// [{url, revision}]: an entry is downloaded again only when its revision changes.
+const PRECACHE_MANIFEST = %(manifest)s;
+
+// Served from the runtime cache at once and refreshed from the network in the background.
+const STALE_WHILE_REVALIDATE = %(swr)s;
+
+function absoluteUrl(url) {
+  return new URL(url, self.registration.scope).href;
+}
+
+function cacheKey(entry) {
+  const url = new URL(entry.url, self.registration.scope);
+  if (entry.revision) {
+    url.searchParams.set('__revision', entry.revision);
+  }
+  return url.href;
+}
+
+const precacheKeys = new Map(PRECACHE_MANIFEST.map(entry => [absoluteUrl(entry.url), cacheKey(entry)]));
+const swrPrefixes = STALE_WHILE_REVALIDATE.map(absoluteUrl);
+
+self.addEventListener('install', event => {
+  event.waitUntil((async () => {
+    const cache = await caches.open(PRECACHE);
+    const cached = new Set((await cache.keys()).map(request => request.url));
+    const missing = PRECACHE_MANIFEST.filter(entry => !cached.has(cacheKey(entry)));
+    console.log(`Precaching ${missing.length} of ${PRECACHE_MANIFEST.length} files`);
+    await Promise.all(missing.map(async entry => {
+      // Bypass the HTTP cache so the stored copy really has this revision.
+      const response = await fetch(entry.url, { cache: 'reload' });
+      if (!response.ok) {
+        throw new Error(`Precaching ${entry.url} failed: ${response.status}`);
+      }
+      await cache.put(cacheKey(entry), response);
+    }));
+  })());
+});
+
+self.addEventListener('activate', event => {
+  event.waitUntil((async () => {
+    const cacheNames = await caches.keys();
+    await Promise.all(cacheNames
+      .filter(name => name !== PRECACHE && name !== RUNTIME)
+      .map(name => caches.delete(name)));
+    const cache = await caches.open(PRECACHE);
+    const expected = new Set(precacheKeys.values());
+    const requests = await cache.keys();
+    await Promise.all(requests
+      .filter(request => !expected.has(request.url))
+      .map(request => cache.delete(request)));
+    await self.clients.claim();
+  })());
+});
+
+async function staleWhileRevalidate(event) {
+  const cache = await caches.open(RUNTIME);
+  const cached = await cache.match(event.request, { ignoreSearch: true });
+  const network = fetch(event.request).then(response => {
+    if (response.ok) {
+      return cache.put(event.request, response.clone()).then(() => response);
+    }
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+  }
+  return network;
+}
+
+self.addEventListener('fetch', event => {
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(request.url);
+  url.hash = '';
+  let key = precacheKeys.get(url.href);
+  if (!key && request.mode === 'navigate') {
+    url.search = '';
+    key = precacheKeys.get(url.href);
+  }
+  if (key) {
+    event.respondWith(caches.open(PRECACHE)
+      .then(cache => cache.match(key))
+      .then(response => response || fetch(request)));
+  } else if (swrPrefixes.some(prefix => request.url.startsWith(prefix))) {
+    event.respondWith(staleWhileRevalidate(event));
+  }
+});
+"""
+
+
+def revision(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+def load_json(path, default):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def precache_manifest(catalog_dir='catalog'):
+    """The [{"url", "revision"}] entries for every published file that exists, in a stable order."""
+    paths = [path for path in STATIC_ASSETS if os.path.isfile(path)]
+    catalog_index = os.path.join(catalog_dir, 'index.json')
+    if os.path.isfile(catalog_index):
+        paths.append(catalog_index)
+        for shard in load_json(catalog_index, {}).get('shards', []):
+            path = os.path.join(catalog_dir, shard['file'])
+            if os.path.isfile(path):
+                paths.append(path)
+    paths.extend(path for path in ICONS if os.path.isfile(path))
+    readmes = []
+    for directory, project_dir, _ in workspace.load_index().projects():
+        path = os.path.join(project_dir, 'README.md')
+        if os.path.isfile(path):
+            readmes.append(os.path.join(directory, 'README.md'))
+    paths.extend(sorted(readmes))
+
+    manifest = []
+    if os.path.isfile('index.html'):
+        manifest.append({'url': './', 'revision': revision('index.html')})
+    for path in paths:
+        manifest.append({'url': './' + path.replace(os.sep, '/'), 'revision': revision(path)})
+    manifest.extend({'url': url, 'revision': None} for url in CDN_URLS)
+    return manifest
+
+
+def build(sw_path=SW_PATH, catalog_dir='catalog'):
+    """Write sw.js. Returns the list of paths that were written."""
+    manifest = precache_manifest(catalog_dir)
+    source = SW_TEMPLATE % {
+        'cache_prefix': CACHE_PREFIX,
+        # One entry per line, so a deploy's diff of sw.js shows which files changed.
+        'manifest': '[\n' + ',\n'.join('  ' + json.dumps(entry, ensure_ascii=False) for entry in manifest) + '\n]',
+        'swr': json.dumps(list(STALE_WHILE_REVALIDATE), indent=2),
+    }
+    return [sw_path] if fsutil.write_if_changed(sw_path, source) else []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate sw.js with a content-hashed precache manifest.')
+    parser.add_argument('--output', default=SW_PATH, help=f'Service worker path (default: {SW_PATH}).')
+    parser.add_argument('--catalog-dir', default='catalog', help='Catalog directory (default: catalog).')
+    parser.add_argument('--changed-paths', help='Append the path of sw.js to this file if it changed.')
+    args = parser.parse_args()
+
+    written = build(args.output, args.catalog_dir)
+    print(f"{args.output} {'updated' if written else 'unchanged'}.")
+    if args.changed_paths:
+        with open(args.changed_paths, 'a', encoding='utf-8') as f:
+            f.writelines(os.path.relpath(path) + '\n' for path in written)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,224 @@
-const CACHE_NAME = 'moukaeritai-work-v20251222-0741';
-const urlsToCache = [
-  './',
-  './index.html',
-  './README.md',
-  './find.html',
-  './moukaeritai-pictgram/64x64.webp/gold_green.webp',
-  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
-  'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js',
-  'https://cdn.jsdelivr.net/npm/marked/marked.min.js'
+// Generated by service_worker.py from the published files; do not edit by hand.
+const PRECACHE = 'moukaeritai-work-precache';
+const RUNTIME = 'moukaeritai-work-runtime';
+
+// [{url, revision}]: an entry is downloaded again only when its revision changes.
+const PRECACHE_MANIFEST = [
+  {"url": "./", "revision": "5697459e8431"},
+  {"url": "./index.html", "revision": "5697459e8431"},
+  {"url": "./find.html", "revision": "a34a8cfe7a78"},
+  {"url": "./style.css", "revision": "73cb5aed5d86"},
+  {"url": "./README.md", "revision": "9859f3f8af7f"},
+  {"url": "./catalog/index.json", "revision": "0fd884e9002c"},
+  {"url": "./catalog/catalog-00.7c8c67b9672a.json", "revision": "7c8c67b9672a"},
+  {"url": "./catalog/catalog-01.f7b5a72519db.json", "revision": "f7b5a72519db"},
+  {"url": "./catalog/catalog-02.f5273de1d5d7.json", "revision": "f5273de1d5d7"},
+  {"url": "./catalog/catalog-03.0428bdaa8a23.json", "revision": "0428bdaa8a23"},
+  {"url": "./1-0bJIb3TYc29MosGWLbTUl12TuVC7_W_BccV_moQwZX9HXqR8bnb6wcs/README.md", "revision": "de28e66cbde4"},
+  {"url": "./1-DK5w5wmpLrTNKv8-WNrAn9oVJ0vf6Oh7Z29Q2h-0ZMtSkr6yC2U1dsR/README.md", "revision": "415d2f0380da"},
+  {"url": "./1-oFq3B2G4PgnzCmmXpxiOO8JIUOHXoSO7lnKyUSZB_EJb8rA2OGzypw2/README.md", "revision": "1d4be50404bd"},
+  {"url": "./1-wPE2i22f0Awr1fkg9z0XDxIQeLPlvSOOQ7kzYCSQd1YPNkFo5MwkLiJ/README.md", "revision": "bf740046ad1e"},
+  {"url": "./107QMAgKGFZ6dXRCrA7mpN9aSapN0fZlXw57ipPZREt5zSQ0UNSTLEH50/README.md", "revision": "539da3ac2e1c"},
+  {"url": "./107zb2vOE4Cn-ziIbJRk0AavZeS5l_suZIQplfhuzAeCSqaef7jYvxdP_/README.md", "revision": "ded693e2328b"},
+  {"url": "./10b2Nk8rDW58NeofuEfhzQt9na5hWRHJHu_EMETlKgosiFJVXsfsOhb9U/README.md", "revision": "6d4537d5c213"},
+  {"url": "./10lJqYuurUoouFS-aPsPs4HU2s--Xkm5vTu7QVZH4HwcAZgtCDU6ZltQN/README.md", "revision": "2e54e117e21e"},
+  {"url": "./11rpH01pllhsLXw8piWIWlI06yc_BrfqQ4sAP9jxRMgbq1mXrg3mHVmzQ/README.md", "revision": "9ef2cec3f558"},
+  {"url": "./13faGzNt1a3JjMs8zCfYdm9-L7UCtrWa16Ha5G-_Q9-8yxAZxRCylv6eY/README.md", "revision": "9da35b6e2ecf"},
+  {"url": "./13rMvpSI80JS1Hq3MMwLOwGBZmIWHX71VDyq8Gj8o2P3X_YS-jLV313Xs/README.md", "revision": "474ef20c9af1"},
+  {"url": "./13sX98YHiFh-5eBWTAJtWR52SbdnCxaHzX3GXgt8zUU07ELz9ArLhlJvD/README.md", "revision": "bf3d5739a048"},
+  {"url": "./145HOZDGMnvmYoPGYsN--JfNWQtotCDYFYLeSh-dPm-VQxx9sVlWE64um/README.md", "revision": "69e8cb181438"},
+  {"url": "./14OUFXtFBsyL7_H3lGOSzCTPlSegMO3VE2fN6ZuW4t6FDexc6370Fl1CJ/README.md", "revision": "e5f322169592"},
+  {"url": "./152hdXdkyiKko-Ciggv_GdV8b5TQ83ZrV5E2MB-j8ayW_S5zVxLim7YWL/README.md", "revision": "0bbf1600fc03"},
+  {"url": "./155SE7dCPH52t6l_we4avFQGhawNVjChOTiMdRC8UYuniDb_UWwW-yIx8/README.md", "revision": "d8331765fbce"},
+  {"url": "./16KG4N2zbYxh_VPQwALvPDukRVC6a-zCt2gAE1-2C0GkxKJdlvoe1G3oN/README.md", "revision": "c9221f2eaca3"},
+  {"url": "./16aPNNXwgQT5HUc7ch5nkTC9NfCbvHBFjVRr2KiiKSRXPnV0l1LjhXvdB/README.md", "revision": "e0b67128bf49"},
+  {"url": "./16bdYnyvTFOjko1J10ysGHbq0mNkwBzFFyf81VuCWoM7E_-1Y44KN2IX4/README.md", "revision": "d552ea6b650a"},
+  {"url": "./17SmjkOHGM7bAnLPoePgH-hC45i6YCAgORgTA66hdmqqnMm2p7_goR8C1/README.md", "revision": "b5e68a627b90"},
+  {"url": "./18adAHG43To87g8tgWJ0KwVg9gpE09gLTm9Fogw2R7YK28Gl_NG9hODlc/README.md", "revision": "9ef12ff747f3"},
+  {"url": "./18fkObcqcU91kBSTc0UHqI3vOyd1zxSX6CHvJxaE1Urn6T-dS9d_lLiKj/README.md", "revision": "eaf01ec98193"},
+  {"url": "./191-QOfGkDNe9otT_2cJxL1Afh04ulD8ArB5JnPkM7yddJ2-OiUTvvtVJ/README.md", "revision": "be5d42ad34bf"},
+  {"url": "./19gfPoC2um5FcDCPyzHenOg_MUHsJruM9X82VQqeR9zxdZEg0wnbWRwQM/README.md", "revision": "e548b46a1669"},
+  {"url": "./1A_kkWBH9eqn08Rir8tv_KdaVyYZkJt487UD69qAbQ0fGHCjKKTPwhC0H/README.md", "revision": "52de5859e331"},
+  {"url": "./1AavEYmp44tHxyqTvV8kBTHM26zOaUdsVDjr6KMnKojbV5kPwr2EJ6LLi/README.md", "revision": "bbed8b145da3"},
+  {"url": "./1Bxt-4ULv8Rh0aAmltAcAUZpOmp8ifF5d_9f-DzASSJkDEAtSHNwlm1Gh/README.md", "revision": "8f509af1476b"},
+  {"url": "./1Ck4-5l9YWT52gsWOnLGlVqc-H2dtVOMwUhKCoPKFKZ4qS4Ii_CDgdOfz/README.md", "revision": "bb202c2e40c5"},
+  {"url": "./1DJbk8E57h7UVVXyzS9PIDn_iL0ZJf39VRdLepQbf_DDI9WPVkzVlSN2Z/README.md", "revision": "9cd1ba37cc8f"},
+  {"url": "./1DODUgAitkJ2cD9jdo-xbYfMbJQIM_LwQioFIWxu8TBYj-d1GJc_JsLYe/README.md", "revision": "609ae11f6c78"},
+  {"url": "./1DzGVrsZvn5Svk_I7f48AiSeYrzDP0wIWsCxkHrS6B5ZFThcamXB0wwo0/README.md", "revision": "8bf03313a562"},
+  {"url": "./1EGXorZ5FfN-bpWU5PpYdqdt3hSbt84hWhsk7tMXN9J2L2w3HUHBBXWZc/README.md", "revision": "24a0f7f7bde5"},
+  {"url": "./1EUaapnjQf2c1QcTtEct0GWeztTGAByDD1jD2n1iFu17m7ycr0Wq0bQyn/README.md", "revision": "b1f59faebfcd"},
+  {"url": "./1FSAJj929as1EcS03jp-NAAueuy_VTWtzNfiL7EoiG9uFBf0o7wVBaQHQ/README.md", "revision": "1c3933deb428"},
+  {"url": "./1GYfj-JgHwhPdQoxpqfD-wL0XXCJtm972x4fXr291WkLbFEsCp-yhkodK/README.md", "revision": "bf12237efa71"},
+  {"url": "./1HdefH6zukEzlrAQNol72ckv9GbjCirkQM4RqrJbnjktxuW9n7k5ysfR8/README.md", "revision": "8a64a90de4ee"},
+  {"url": "./1J1eizA18n82rnRB0bWEWXQuyx6ca6FlI4rCQpsMX2K1-_RSj57HmU-cK/README.md", "revision": "7e8ae8688b36"},
+  {"url": "./1JVePgIVR2zhTuWZPLChi12dd6qAJSuCcIU68z4YeQoPuzyOYmMPFM0hY/README.md", "revision": "207615c34bce"},
+  {"url": "./1JsxPkJk_0isXeZwzI5EbpXCgTDvNmp_6NKrrNx61q_iefSjQwe5eEZzC/README.md", "revision": "16b5a4f367c0"},
+  {"url": "./1K5yN1kcV4s3nfkuRpmXWwMX8rMylejrSz63HO8__7M1zUtL-h-cqPxpH/README.md", "revision": "362f40f76a22"},
+  {"url": "./1KmIn9qigeR161F2AoSp2Dltb5InjiUJ1AgmmOlyqYN1441K2ku8WNiiU/README.md", "revision": "1d0e2424f10d"},
+  {"url": "./1L9H8eQdinme63XIk8TtgfH5u-zn0KVqw4UnwWUj6yhW3SMJlXJkq7AKm/README.md", "revision": "05c9aeb89e57"},
+  {"url": "./1LHcsYXfrTmZAC2WxM-FHRiClhiFacYtIj5OWaZlnVnDHjGXCxWQMNLnw/README.md", "revision": "e9881c5d9f47"},
+  {"url": "./1LSYokZ_LmtIkXv-URsN99givIHlIkDNHwQjkLAo6JkzwLvsbagpdbTaE/README.md", "revision": "7441e327fc0d"},
+  {"url": "./1LXZ33F_GXt5lZLQj-0qTirlr2jG-D0nBn6A8SX2RyqD4bBOEZTRT_sz7/README.md", "revision": "1124dd87ca03"},
+  {"url": "./1LuCC_nahtVS-4EMIxLDIEoRRIssXrmNKOH3ggZuEk14jfAMDB6uTUCle/README.md", "revision": "64f97593f540"},
+  {"url": "./1M1amG2VwddxG9UpHjERfroY9wntSro8xSbEE02tVJnvsg7pQ_AsNS6p5/README.md", "revision": "4f573d71b917"},
+  {"url": "./1N94EvQQ3JB0od091wek3iOQ5bHxKxDZiHfW1fhsuLLKbPlo7uyVicKxE/README.md", "revision": "1cc1071929f8"},
+  {"url": "./1NYN_AoEoGoZIOKurCE2dSWFMzpBTeZFczQ-q_F4d-mvQ2XK6rdtz3Zev/README.md", "revision": "9249c21592ed"},
+  {"url": "./1NtKt5zOmO0Hvgx_6Jxfl1xyHSK4A65O9krJSfqUfdx-mfjp1fcqiRbSr/README.md", "revision": "2d3dc08a69b5"},
+  {"url": "./1OFyuUHAA2lLSjmadG07uEnafWEoRj18X5FqpFk2Oi1Z0xtFXCKx7g0es/README.md", "revision": "2f59f803b036"},
+  {"url": "./1OcQHj6g4a4jpoBpIKeacLAv1j9t-I6vGn2t91zyRqL3MHZC8inEUcpSb/README.md", "revision": "cf4cfda94373"},
+  {"url": "./1PnI4XHOcM36rGvhn5ox_Eb6bWIMlZvPMK7TX1EP2sX-Qu-dywJLwfizW/README.md", "revision": "89c1fbde9b7b"},
+  {"url": "./1Q2CN9ciOLohbeWioR_RSv-OszsVlN2-S1FtzugY0ZoR77sgWiTlCaZbG/README.md", "revision": "740ca2b86c82"},
+  {"url": "./1R6Wr7q2KhcEMl6aUGc4YtwcKyuDfPkX-duWxyA93qLVLnpvAFkx47N4r/README.md", "revision": "68cb3977ce9c"},
+  {"url": "./1RsAjkBTBEy4w8Q0kdStuJAXbAIcrnVqXvMGDj5nhQJkmZuMT3tBFTFoE/README.md", "revision": "bdc7db78f8bc"},
+  {"url": "./1RvhfmTi5Il33TqPVCX0SzkgOTN14obJxdEDrv69CkfBuKHQ6LXSnIAQ5/README.md", "revision": "65d0c87a67d6"},
+  {"url": "./1SN862ojGSUHB0KjJW-p4iYu8O_U8OYBnOsYMIQhb4soKnnioCHCVhH72/README.md", "revision": "b6f4cd4c00aa"},
+  {"url": "./1Uf0YpVntqswRo0bwSXCBA7glomAfrNz43dxiJziapYeXIy90b_EHpt3_/README.md", "revision": "7d18b41640b7"},
+  {"url": "./1Ukzd26N4sR2e_S_ZmBB2Z_dEIYXzuT8JkZu6DUNnHt53v-PSIG_9HB8k/README.md", "revision": "9bcd0ee66b39"},
+  {"url": "./1VGrvbuilEvfwcJXQ2mx9VmO6doyD7RlpT9-1n3oThjIBYz1kMUBOl-Jr/README.md", "revision": "5789eab9aa5f"},
+  {"url": "./1WC3AZoysl3LOVPj2WtyX-wBn6Ecvyv6fUjulDRUVhoNI_fN40d3KaCGV/README.md", "revision": "496c15ea4a68"},
+  {"url": "./1XB8G6BUwfRJsR9KyHOaEX8F1D2k3hmP0tB5Zec6cKoXNwx4hA4turlAj/README.md", "revision": "5900da878278"},
+  {"url": "./1Y1_JzAgUas7Wi8Wou9aASAMaBNNc19zDuIOJdkKGrt9GZAYltA7EMDeQ/README.md", "revision": "40d9e7c3dcd1"},
+  {"url": "./1YAxockQcSTXfpD08yNET6PkcuJP2VGWlikGNineVeMx68CC-x4E07rax/README.md", "revision": "f393bf7caaf4"},
+  {"url": "./1ZKdRjD7_vTfM1WdztdpTZATzOwvO8cWg5sZcDBgfdHAjny_DXH2sK3Zk/README.md", "revision": "941a491f41d6"},
+  {"url": "./1ZoVS-ez7yPdNhbknvqjotEMC3p5xDrmzvTwgIo_mmMd2Y3DhyqVzRYiS/README.md", "revision": "d0a0f030fef4"},
+  {"url": "./1Zx_o3LVk8gY7QSBrdWR1BvEYU5v2JDK-JPdEXGS6U-HFdZUUX4n2utOT/README.md", "revision": "d42dbfd6d436"},
+  {"url": "./1_SuiFIOR_EKToX4e2h8Jp3IEi8iSlJBnH24i2zQZSq2ETXDRTHXsQps3/README.md", "revision": "cb6420f367fb"},
+  {"url": "./1a5RnEduBLbD4kq4NHlyiGZChdRTXyxT6rnUs-JB7-_f2tM4fV1SONhd5/README.md", "revision": "c4003f3eb8cb"},
+  {"url": "./1bgCdh7JZGqTUHEV814A-YLhsj053Z0Zly54QIWusrHK1hsEeYGNqvRol/README.md", "revision": "5906b066094b"},
+  {"url": "./1bv9vqLAy7LQO1ek_nOrb7iSrcQO8pcGr_NhiP75qJ3fjggqvkiZ6FAqN/README.md", "revision": "b99f7b5d52f6"},
+  {"url": "./1bx4FYU9Udq0fl6JUI5tWdGQTW-MiZctHSpI3kR5hy-sZtLEOCTK0mXBy/README.md", "revision": "f99e5bdbd6c6"},
+  {"url": "./1cQ2Y30dXVHjU6JVuod9G_aOXGo-9CRAkIej7-lG8YCVPQUcJrKg9kVvj/README.md", "revision": "55940f34c268"},
+  {"url": "./1d_tEHQAW3ZrD1zcIcdYG2kxKHNTA_IDyrBJEkVNxOTv6e6qLlIUsa1Mn/README.md", "revision": "a200589e5166"},
+  {"url": "./1fWFGiC7PwwYBmNTY12zxbSdBqkgP6RKta-bGSFDD90jliFIYOqxHbYEg/README.md", "revision": "9fbe3c63d156"},
+  {"url": "./1gZ1kwgVe2ZTz6B5c2N-OtdasCjRnuoeitNyuQmuESKYTrpryZk4GEMxG/README.md", "revision": "0977b13c3572"},
+  {"url": "./1gb8NXL4DwVwkdnSDBjgu1bjH55PgaaQXX_vm5sLJqjIbdBRI4C-ROQqs/README.md", "revision": "23753c1c5c23"},
+  {"url": "./1glSqRTMOxnhV3fGvaiuoJRMW0EM1bHIDurZbjph6lmp8bZYKOcP5s9WP/README.md", "revision": "62a1cd93903d"},
+  {"url": "./1hAcanrB68UTn-SUi_5qMYErKZcnupVtz1YrxM9zzJaoIdKEt0r950dyI/README.md", "revision": "6b4062a83fa9"},
+  {"url": "./1iFYcSphfVXjCkBAZ8aGqIU5L37rvFjqLdLP0YsuLPWoOPm_xj0YRJ4uL/README.md", "revision": "abc9a1d0ea88"},
+  {"url": "./1iSAbJgupNLOxKwff9-bHeJ1whiE8sZmCxy2eb5D7qDyl4nZE_LjrKpHA/README.md", "revision": "a02e6420634c"},
+  {"url": "./1jiI5HqUgUVyI4LA4gFueiux_mHjFuKlgJIVYY4EjRwIx0MAWqi5-Eyef/README.md", "revision": "95faea4b5229"},
+  {"url": "./1kmWE6C2RkVxw1nAymD1HXkgAjENsCCNajiuKwwQjF81fGjwb7shhMKk4/README.md", "revision": "399ab710e23e"},
+  {"url": "./1lG3a8hUu7QGk0rJ6RFycFl0p7YoZIHjn9k6SWeXEPryUvW-GKupvITNp/README.md", "revision": "fceb2b2c4ed2"},
+  {"url": "./1lNnrAhYlTFhmxDlSI-HRypOATxNcsujO3hpUMK5MJTl-Ozt_CjRFE08c/README.md", "revision": "9b0369971726"},
+  {"url": "./1lUx3c6HCcad3YYZOVb8lO7DzzTGZQWkbRwU_HMY-PHEZrqMu6roXSnKN/README.md", "revision": "0a4db79fae25"},
+  {"url": "./1la6BhVxQnF3NhstdhUEJILODy23g3W-7BzKm-p867c7G-jQvCOVCY5Tk/README.md", "revision": "1f636640f0a1"},
+  {"url": "./1lhUG7nF6LqCfFV2ZzITuEuIPolWJ6vt9HYdGGoQnicxm-EgyGu198-0g/README.md", "revision": "27b23b7caecf"},
+  {"url": "./1nH20n09gtpxjWEo5FUv9Ixor2nIO0Et0GJ8emW6dIOsgYQf7LXBUwNG0/README.md", "revision": "acf9173bc749"},
+  {"url": "./1ncv2vCJ4Yoz_ZF1dATET1NlEI0HAeCalrq3yqhnUuSZ9leOxYhq9nK4M/README.md", "revision": "57f7c5c3b4a2"},
+  {"url": "./1oKLfiJY_0SIAx62t0fHFW0dcgkq41VNJZaxhoUqurNP_LKxKh6xTa3WN/README.md", "revision": "991b7bc1deb3"},
+  {"url": "./1ovfzNY0BUREXY5Ky0eX1HZaz3VxEoq3wyjwZuYg4L6m8H83Rjb8Q1yhw/README.md", "revision": "6137656d1e1c"},
+  {"url": "./1p7R-6QdWJBVNQHYeLgL-0shyTRhOuZ_nrMVYLqX3M6rdv6Ot2nABez0n/README.md", "revision": "a30204347716"},
+  {"url": "./1pI3uylENjL9mgMFifDvwraraNgxCnyjVN3Cx76xNH4qqWIxFqC5C_ctU/README.md", "revision": "505e3254fdb6"},
+  {"url": "./1q1-0M4PCEaMBcsPQ13HVp6S_j4gP7rbmXjp_8R8uribE2PPVp7lZTg-8/README.md", "revision": "a48106ab756f"},
+  {"url": "./1q8vDJ1xEbrkOYBgSuxyqjQ8r_W12OgUqhN-SzxhzTLJvLfB6X93MC_kg/README.md", "revision": "b11933ba99bb"},
+  {"url": "./1qbZkCgB4yUYFF3G4P2oBtOfCNfV73d0jG-ov4Iea7rXq6yO3lnT2LB_2/README.md", "revision": "6f77a698da5c"},
+  {"url": "./1qt5XuJT9yqEmtFJoVrEm1HEbplsp1ZSYtJ76IsdSk1CDfwkWqAGz198x/README.md", "revision": "604362a298e5"},
+  {"url": "./1rscecWbcSJ3xD5z7QmT0ZJde73TQWOwQaA7jrxTVNgpOxd-7DYeLtI3V/README.md", "revision": "6c2706ffb57c"},
+  {"url": "./1ryBTdV-IJH57QxJefgX334JWuJ7KHLjpT43v45VAqwAmFSKqkXkMFnAY/README.md", "revision": "c545393cfd42"},
+  {"url": "./1tEJHwlwUnrmb4488tbOkvhlBBfrAVHflvXT2WqXp_z8GGNgIi-Mv5VQ6/README.md", "revision": "83c2d40ceadb"},
+  {"url": "./1tPNJshkGnHrSKO5HIkFGvTyrCm6nZDQsDAxn-p38VhHI17ovSVpEA_uJ/README.md", "revision": "32bd2e59ccda"},
+  {"url": "./1toCTzwoHcWb0VQGQ3aYO9QZpRY9P5f4g3Hn4K9FCWFIth7OJjW4jssP5/README.md", "revision": "5906b066094b"},
+  {"url": "./1x28p9g4GUQ1Yf-rdWm3b0CIqLrcSHJlI_Adg784nFm0b2x1vvcQSRhTm/README.md", "revision": "37b5e0b9dab3"},
+  {"url": "./1x2MezlZVu4l6hHwOjLQY8hrdjx4i-ZMg7g7DNLn_Qm_D-j5Bqfkw_v_S/README.md", "revision": "01f89b154618"},
+  {"url": "./1yHbFwsxR7LGHpT-AaYcepbv3DObqkvGp1JfqLiL4SmYYgRHRrWf50kxt/README.md", "revision": "b6d487cd610a"},
+  {"url": "./1ye0LXwZ4NyWjO8jnljnGDXMyNDSsAsFotCeMVcC3dtr0gLVOgGEXVZlg/README.md", "revision": "1e2a1f41f526"},
+  {"url": "./1yeQ42lIGOQq2Zkl33L0B6RdUfdtH-e_8rqEaHLoRXCu3iwHrc7EjDixf/README.md", "revision": "78bd7117199d"},
+  {"url": "./1z3HCVNHvj2W-flbvkl2y-5QCWnl_GF4cPDqMbA2IlvbXqhtneLvEDEBz/README.md", "revision": "78bd7117199d"},
+  {"url": "./1z_jBz0uoeT8VfbsuBhbw9op6GBZSolw89bFbEx3J4HDmCTOCfhsfwOoN/README.md", "revision": "dd31f00c6d73"},
+  {"url": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css", "revision": null},
+  {"url": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js", "revision": null}
+];
+
+// Served from the runtime cache at once and refreshed from the network in the background.
+const STALE_WHILE_REVALIDATE = [
+  "./clasp-list.json",
+  "./gas-project-finder.json",
+  "./search-index/",
+  "./moukaeritai-pictgram/",
+  "https://cdn.jsdelivr.net/npm/marked/"
 ];
 
+function absoluteUrl(url) {
+  return new URL(url, self.registration.scope).href;
+}
+
+function cacheKey(entry) {
+  const url = new URL(entry.url, self.registration.scope);
+  if (entry.revision) {
+    url.searchParams.set('__revision', entry.revision);
+  }
+  return url.href;
+}
+
+const precacheKeys = new Map(PRECACHE_MANIFEST.map(entry => [absoluteUrl(entry.url), cacheKey(entry)]));
+const swrPrefixes = STALE_WHILE_REVALIDATE.map(absoluteUrl);
+
 self.addEventListener('install', event => {
-  event.waitUntil(
-    caches.open(CACHE_NAME)
-      .then(cache => {
-        console.log('Opened cache');
-        return cache.addAll(urlsToCache);
-      })
-  );
+  event.waitUntil((async () => {
+    const cache = await caches.open(PRECACHE);
+    const cached = new Set((await cache.keys()).map(request => request.url));
+    const missing = PRECACHE_MANIFEST.filter(entry => !cached.has(cacheKey(entry)));
+    console.log(`Precaching ${missing.length} of ${PRECACHE_MANIFEST.length} files`);
+    await Promise.all(missing.map(async entry => {
+      // Bypass the HTTP cache so the stored copy really has this revision.
+      const response = await fetch(entry.url, { cache: 'reload' });
+      if (!response.ok) {
+        throw new Error(`Precaching ${entry.url} failed: ${response.status}`);
+      }
+      await cache.put(cacheKey(entry), response);
+    }));
+  })());
 });
 
 self.addEventListener('activate', event => {
-  const cacheWhitelist = [CACHE_NAME];
-  event.waitUntil(
-    caches.keys().then(cacheNames => {
-      return Promise.all(
-        cacheNames.map(cacheName => {
-          if (cacheWhitelist.indexOf(cacheName) === -1) {
-            return caches.delete(cacheName);
-          }
-        })
-      );
-    })
-  );
+  event.waitUntil((async () => {
+    const cacheNames = await caches.keys();
+    await Promise.all(cacheNames
+      .filter(name => name !== PRECACHE && name !== RUNTIME)
+      .map(name => caches.delete(name)));
+    const cache = await caches.open(PRECACHE);
+    const expected = new Set(precacheKeys.values());
+    const requests = await cache.keys();
+    await Promise.all(requests
+      .filter(request => !expected.has(request.url))
+      .map(request => cache.delete(request)));
+    await self.clients.claim();
+  })());
 });
 
+async function staleWhileRevalidate(event) {
+  const cache = await caches.open(RUNTIME);
+  const cached = await cache.match(event.request, { ignoreSearch: true });
+  const network = fetch(event.request).then(response => {
+    if (response.ok) {
+      return cache.put(event.request, response.clone()).then(() => response);
+    }
+    return response;
+  });
+  if (cached) {
+    event.waitUntil(network.catch(() => undefined));
+    return cached;
+  }
+  return network;
+}
+
 self.addEventListener('fetch', event => {
-  event.respondWith(
-    caches.match(event.request)
-      .then(response => {
-        if (response) {
-          return response;
-        }
-        return fetch(event.request);
-      })
-  );
+  const request = event.request;
+  if (request.method !== 'GET') {
+    return;
+  }
+  const url = new URL(request.url);
+  url.hash = '';
+  let key = precacheKeys.get(url.href);
+  if (!key && request.mode === 'navigate') {
+    url.search = '';
+    key = precacheKeys.get(url.href);
+  }
+  if (key) {
+    event.respondWith(caches.open(PRECACHE)
+      .then(cache => cache.match(key))
+      .then(response => response || fetch(request)));
+  } else if (swrPrefixes.some(prefix => request.url.startsWith(prefix))) {
+    event.respondWith(staleWhileRevalidate(event));
+  }
 });
@@ -0,0 +1,263 @@
+"""
+sync_state.py
+
+Persistent sync state for every Apps Script project, kept in one SQLite file at
+the repository root (sync-state.db, or $SYNC_STATE_DB).
+
+Each scriptId has one record:
+  script_id           scriptId (primary key)
+  directory           project directory name
+  remote_update_time  updateTime reported by the API when the project was last synced
+  last_pulled         UTC time of the last successful pull
+  last_checked        UTC time the project was last compared with its remote
+                      updateTime (pulled or found unchanged)
+  content_hash        sha256 over the project's source files after the last pull
+  deployment_count    number of deployments at the last pull
+  version_count       number of versions at the last pull
+  last_error          message of the last failed sync (None after a success)
+  last_error_time     UTC time of the last failed sync
+  command_durations   JSON {clasp command: [seconds of recent successful runs]},
+                      from which clasp_watchdog derives the command deadlines
+  delisted_time       UTC time the project disappeared from the project listing
+                      (None while it is listed); delisted projects are not pulled
+
+The state used to live in each project's metadata.json; on first use the store
+imports lastUpdated from those files so existing projects are not pulled again.
+"""
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+DEFAULT_STATE_PATH = 'sync-state.db'
+
+FIELDS = (
+    'directory',
+    'remote_update_time',
+    'last_pulled',
+    'content_hash',
+    'deployment_count',
+    'version_count',
+    'last_error',
+    'last_error_time',
+    'command_durations',
+    'delisted_time',
+    'last_checked',
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    script_id TEXT PRIMARY KEY,
+    directory TEXT,
+    remote_update_time TEXT,
+    last_pulled TEXT,
+    content_hash TEXT,
+    deployment_count INTEGER,
+    version_count INTEGER,
+    last_error TEXT,
+    last_error_time TEXT,
+    command_durations TEXT,
+    delisted_time TEXT,
+    last_checked TEXT
+);
+CREATE INDEX IF NOT EXISTS projects_directory ON projects (directory);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Files in a project directory that are written by this repository's scripts
+# rather than pulled from Apps Script.
+GENERATED_FILES = {
+    '.clasp.json',
+    'metadata.json',
+    'application.json',
+    'deployments.json',
+    'deployments.txt',
+    'versions.json',
+    'versions.txt',
+}
+SOURCE_EXTENSIONS = ('.js', '.gs', '.ts', '.html', '.json')
+
+
+def get_state_path(path=None):
+    return path or os.environ.get('SYNC_STATE_DB') or DEFAULT_STATE_PATH
+
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def content_hash(project_dir):
+    """sha256 over the relative paths and bytes of the project's source files."""
+    digest = hashlib.sha256()
+    paths = []
+    for root, dirs, files in os.walk(project_dir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in files:
+            if name in GENERATED_FILES and root == project_dir:
+                continue
+            if name.endswith(SOURCE_EXTENSIONS):
+                paths.append(os.path.relpath(os.path.join(root, name), project_dir))
+    for rel_path in sorted(paths):
+        digest.update(rel_path.replace(os.sep, '/').encode('utf-8') + b'\0')
+        with open(os.path.join(project_dir, rel_path), 'rb') as f:
+            digest.update(f.read())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SyncState:
+    """
+    The sync-state store. One connection is shared by all threads of a
+    process; other processes wait on SQLite's lock instead of racing.
+    """
+
+    def __init__(self, path=None, in_memory=False):
+        """
+        With in_memory=True the store is loaded from path into memory and
+        nothing is written to disk until save() is called.
+        """
+        self.path = get_state_path(path)
+        self.in_memory = in_memory
+        if in_memory:
+            self._conn = sqlite3.connect(':memory:', check_same_thread=False)
+            if os.path.exists(self.path):
+                disk = sqlite3.connect(self.path, timeout=60)
+                try:
+                    disk.backup(self._conn)
+                finally:
+                    disk.close()
+        else:
+            self._conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+            # Stores created before a field was added get the column now.
+            columns = {row[1] for row in self._conn.execute('PRAGMA table_info(projects)')}
+            missing = [field for field in FIELDS if field not in columns]
+            for field in missing:
+                self._conn.execute(f"ALTER TABLE projects ADD COLUMN {field}")
+        # Rows changed since the store was loaded or saved; None forces the next save().
+        self._saved_changes = None if missing else self._conn.total_changes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, script_id):
+        """Return the record for a scriptId as a dict, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM projects WHERE script_id = ?', (script_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def all(self):
+        """Return every record as {scriptId: dict} with a single query."""
+        with self._lock:
+            rows = self._conn.execute('SELECT * FROM projects').fetchall()
+        return {row['script_id']: dict(row) for row in rows}
+
+    def update(self, script_id, **fields):
+        """Insert or update the given fields of a scriptId's record."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"unknown sync-state fields: {sorted(unknown)}")
+        if not fields:
+            return
+        columns = ', '.join(fields)
+        placeholders = ', '.join('?' for _ in fields)
+        assignments = ', '.join(f"{k} = excluded.{k}" for k in fields)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT INTO projects (script_id, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT (script_id) DO UPDATE SET {assignments}",
+                (script_id, *fields.values()),
+            )
+
+    def record_error(self, script_id, error):
+        self.update(script_id, last_error=str(error), last_error_time=utc_now())
+
+    def get_meta(self, key, default=None):
+        """Read a store-wide value (JSON-decoded)."""
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def all_meta(self):
+        """Return every store-wide value as {key: value}."""
+        with self._lock:
+            rows = self._conn.execute('SELECT key, value FROM meta').fetchall()
+        return {row[0]: json.loads(row[1]) for row in rows}
+
+    def backup(self, path):
+        """Write a consistent copy of the store to path (SQLite online backup)."""
+        target = sqlite3.connect(path)
+        try:
+            with self._lock:
+                self._conn.backup(target)
+        finally:
+            target.close()
+
+    def save(self):
+        """
+        Write an in-memory store back to its file; a no-op for a file-backed
+        store. Nothing is written when no row changed, because even an
+        identical copy gets new header bytes and would be committed again.
+        """
+        if not self.in_memory:
+            return
+        if self._saved_changes == self._conn.total_changes and os.path.exists(self.path):
+            return
+        self.backup(self.path)
+        self._saved_changes = self._conn.total_changes
+
+    def set_meta(self, key, value):
+        """Write a store-wide value (JSON-encoded); an unchanged value is not written again."""
+        text = json.dumps(value, ensure_ascii=False)
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+            if row and row[0] == text:
+                return
+            self._conn.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET value = excluded.value',
+                (key, text),
+            )
+
+    def import_legacy_metadata(self, projects):
+        """
+        Seed the store once from the lastUpdated values in each project's
+        metadata.json. projects is a list of (directory name, path, scriptId)
+        as returned by workspace.WorkspaceIndex.projects(). Records that
+        already have a remote_update_time are left alone. Returns the number
+        of imported records.
+        """
+        if self.get_meta('legacy_metadata_imported'):
+            return 0
+        records = self.all()
+        imported = 0
+        for entry, project_dir, script_id in projects:
+            try:
+                with open(os.path.join(project_dir, 'metadata.json'), encoding='utf-8') as f:
+                    last_updated = json.load(f).get('lastUpdated')
+            except (OSError, ValueError):
+                continue
+            if script_id and not (records.get(script_id) or {}).get('remote_update_time'):
+                self.update(script_id, directory=entry, remote_update_time=last_updated)
+                imported += 1
+        self.set_meta('legacy_metadata_imported', utc_now())
+        if imported:
+            print(f"Imported {imported} records from metadata.json into {self.path}.", file=sys.stderr)
+        return imported
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+sync_trace.py
+
+Structured timing traces for the sync and metadata scripts.
+
+Every traced step is appended to a JSONL file (sync-trace.jsonl, or
+$SYNC_TRACE) as one span:
+  {"run": ..., "script": ..., "project": ..., "phase": ..., "start": ...,
+   "duration": seconds, "attempt": n, "outcome": "ok" | "error" | ..., "bytes": n}
+Phases used by the scripts: freshness, pull, deployments, versions, metadata,
+stage:<name> for each stage of reconcile.py, and one throttle span per run and
+kind with the time spent waiting for rate budget and backing off, and one hang
+span per run with the time lost to clasp commands killed at their deadline.
+
+Usage:
+  python3 sync_trace.py report [--trace FILE] [--run RUN_ID] [--top N]
+prints the slowest projects, the retry hot spots and p50/p95 latency per phase.
+"""
+import argparse
+import collections
+import contextlib
+import datetime
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_TRACE_PATH = 'sync-trace.jsonl'
+
+
+def get_trace_path(path=None):
+    if path is not None:
+        return path
+    return os.environ.get('SYNC_TRACE', DEFAULT_TRACE_PATH)
+
+
+class Tracer:
+    """Thread-safe JSONL span writer. An empty path disables tracing."""
+
+    def __init__(self, path=None, script=None, run_id=None):
+        self.path = get_trace_path(path)
+        self.script = script
+        self.run_id = run_id or datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ-') + uuid.uuid4().hex[:6]
+        self._lock = threading.Lock()
+        self._file = open(self.path, 'a', encoding='utf-8') if self.path else None
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def record(self, **span):
+        if not self._file:
+            return
+        span = {'run': self.run_id, 'script': self.script, **span}
+        line = json.dumps(span, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    @contextlib.contextmanager
+    def span(self, project, phase, attempt=None, **fields):
+        """
+        Time the enclosed block. The yielded dict can be updated with extra
+        fields (e.g. bytes, outcome). An exception marks the span as an error
+        and is re-raised.
+        """
+        span = {'project': project, 'phase': phase, 'attempt': attempt, 'outcome': 'ok', 'bytes': None}
+        span.update(fields)
+        start_wall = datetime.datetime.now(datetime.timezone.utc)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span['outcome'] = 'error'
+            span.setdefault('error', str(e) or type(e).__name__)
+            raise
+        finally:
+            self.record(
+                start=start_wall.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                duration=round(time.perf_counter() - start, 6),
+                **span,
+            )
+
+
+def load_spans(path, run_id=None):
+    spans = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                span = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run_id and span.get('run') != run_id:
+                continue
+            spans.append(span)
+    return spans
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of a non-empty list."""
+    values = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+def report(spans, top=10):
+    if not spans:
+        print("No spans found.")
+        return
+    runs = sorted({s.get('run') for s in spans})
+    print(f"{len(spans)} spans from {len(runs)} run(s).")
+
+    print("\nLatency per phase (seconds):")
+    by_phase = collections.defaultdict(list)
+    errors = collections.Counter()
+    for s in spans:
+        by_phase[s.get('phase')].append(s.get('duration') or 0)
+        if s.get('outcome') == 'error':
+            errors[s.get('phase')] += 1
+    print(f"  {'phase':<16} {'count':>6} {'errors':>6} {'p50':>8} {'p95':>8} {'max':>8} {'total':>9}")
+    for phase, durations in sorted(by_phase.items(), key=lambda kv: -sum(kv[1])):
+        print(f"  {str(phase):<16} {len(durations):>6} {errors[phase]:>6} "
+              f"{percentile(durations, 50):>8.3f} {percentile(durations, 95):>8.3f} "
+              f"{max(durations):>8.3f} {sum(durations):>9.3f}")
+
+    print(f"\nSlowest projects (total span time, top {top}):")
+    by_project = collections.defaultdict(float)
+    for s in spans:
+        if s.get('project'):
+            by_project[s['project']] += s.get('duration') or 0
+    for project, total in sorted(by_project.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {total:>9.3f}  {project}")
+
+    print(f"\nRetry hot spots (spans with attempt > 1, top {top}):")
+    retries = collections.Counter()
+    for s in spans:
+        if (s.get('attempt') or 1) > 1:
+            retries[(s.get('project'), s.get('phase'))] += 1
+    if not retries:
+        print("  none")
+    for (project, phase), count in retries.most_common(top):
+        print(f"  {count:>4}  {project} ({phase})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarise sync timing traces.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rep = sub.add_parser('report', help='Print a summary of the recorded spans.')
+    rep.add_argument('--trace', help=f'Trace file (default: $SYNC_TRACE or {DEFAULT_TRACE_PATH}).')
+    rep.add_argument('--run', help='Only include spans of this run id.')
+    rep.add_argument('--last', action='store_true', help='Only include the most recent run.')
+    rep.add_argument('--top', type=int, default=10, help='Rows in the per-project tables (default: 10).')
+    args = parser.parse_args()
+
+    spans = load_spans(get_trace_path(args.trace), args.run)
+    if args.last and spans:
+        last = spans[-1].get('run')
+        spans = [s for s in spans if s.get('run') == last]
+    report(spans, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+token_manager.py
+
+OAuth token handling for the sync scripts.
+
+TokenManager reads the credentials clasp stores in ~/.clasprc.json, keeps track
+of the access token's expiry and refreshes it in-process with the
+refresh_token grant before it runs out. One manager is shared by every worker,
+so a refresh happens once and every worker picks up the new token. The
+refreshed token is written back to ~/.clasprc.json so that clasp subprocesses
+use it as well.
+
+If the file has no refresh_token or client credentials, the manager falls back
+to running `clasp list`, which makes clasp refresh the file itself.
+"""
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+DEFAULT_RC_PATH = '~/.clasprc.json'
+DEFAULT_TOKEN_ENDPOINT = 'https://oauth2.googleapis.com/token'
+
+# Refresh this many seconds before the recorded expiry.
+REFRESH_MARGIN = 300
+
+# Longest the `clasp list` fallback refresh may take.
+CLASP_REFRESH_TIMEOUT = 120
+
+# Output of clasp (or an API error body) that indicates an authentication
+# problem rather than a network or server failure.
+AUTH_ERROR_PATTERN = re.compile(
+    r"invalid_grant|invalid_token|unauthenticated|unauthorized|"
+    r"missing required authentication credential|invalid authentication credentials|"
+    r"no credentials found|could not read api credentials|login required|\b401\b",
+    re.IGNORECASE,
+)
+
+
+def is_auth_error(text):
+    """True if a clasp/API error message is an authentication failure."""
+    return bool(text and AUTH_ERROR_PATTERN.search(text))
+
+
+def get_token_endpoint(token_endpoint=None):
+    return token_endpoint or os.environ.get('OAUTH_TOKEN_ENDPOINT') or DEFAULT_TOKEN_ENDPOINT
+
+
+def find_token(data):
+    """
+    Locate the token object inside a parsed .clasprc.json.
+    Returns (token_dict, client_dict); either may be None.
+
+    Supported layouts:
+      clasp 2: {"token": {...}, "oauth2ClientSettings": {"clientId", "clientSecret"}}
+      clasp 3: {"tokens": {"default": {"access_token", "refresh_token", "client_id", "client_secret"}}}
+      bare:    {"access_token": ...}
+    """
+    client = data.get('oauth2ClientSettings') if isinstance(data.get('oauth2ClientSettings'), dict) else None
+    if isinstance(data.get('token'), dict) and 'access_token' in data['token']:
+        return data['token'], client
+    if 'access_token' in data:
+        return data, client
+    if isinstance(data.get('tokens'), dict):
+        tokens = data['tokens']
+        for key in ['default'] + [k for k in tokens if k != 'default']:
+            token = tokens.get(key)
+            if isinstance(token, dict) and ('access_token' in token or 'refresh_token' in token):
+                return token, client
+    return None, client
+
+
+class TokenManager:
+    """Shared, thread-safe access token with proactive refresh."""
+
+    def __init__(self, rc_path=None, token_endpoint=None, refresh_margin=REFRESH_MARGIN):
+        self.rc_path = os.path.expanduser(rc_path or DEFAULT_RC_PATH)
+        self.token_endpoint = get_token_endpoint(token_endpoint)
+        self.refresh_margin = refresh_margin
+        self.refresh_count = 0
+        self._lock = threading.Lock()
+        self._data = None
+        self._token = None
+        self._client = None
+        self._load()
+
+    def _load(self):
+        self._data, self._token, self._client = None, None, None
+        if not os.path.exists(self.rc_path):
+            print(f"Warning: {self.rc_path} does not exist.", file=sys.stderr)
+            return
+        try:
+            with open(self.rc_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if not content.strip():
+                print(f"Warning: {self.rc_path} is empty.", file=sys.stderr)
+                return
+            self._data = json.loads(content)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Error reading {self.rc_path}: {e}", file=sys.stderr)
+            return
+        self._token, self._client = find_token(self._data)
+        if self._token is None:
+            print(f"Warning: no access token found in {self.rc_path} "
+                  f"(top-level keys: {list(self._data.keys())}).", file=sys.stderr)
+
+    @property
+    def access_token(self):
+        return (self._token or {}).get('access_token')
+
+    def _expiry(self):
+        """Expiry as a Unix timestamp, or None when unknown."""
+        expiry = (self._token or {}).get('expiry_date')
+        if expiry is None:
+            return None
+        # clasp stores milliseconds.
+        return expiry / 1000 if expiry > 1e11 else expiry
+
+    def _expiring(self):
+        expiry = self._expiry()
+        return expiry is not None and expiry - self.refresh_margin <= time.time()
+
+    def _client_credentials(self):
+        token, client = self._token or {}, self._client or {}
+        client_id = token.get('client_id') or client.get('clientId')
+        client_secret = token.get('client_secret') or client.get('clientSecret')
+        return client_id, client_secret
+
+    def can_refresh_in_process(self):
+        client_id, client_secret = self._client_credentials()
+        return bool((self._token or {}).get('refresh_token') and client_id and client_secret)
+
+    def get_token(self):
+        """Return a valid access token, refreshing first if it is about to expire."""
+        with self._lock:
+            if self._token is not None and self._expiring():
+                self._refresh_locked()
+            return self.access_token
+
+    def refresh(self, stale_token=None):
+        """
+        Refresh the token after an authentication failure.
+        If stale_token is given and another worker has already replaced it,
+        no new refresh is made. Returns the current access token.
+        """
+        with self._lock:
+            if stale_token is not None and self.access_token and self.access_token != stale_token:
+                return self.access_token
+            self._refresh_locked()
+            return self.access_token
+
+    def _refresh_locked(self):
+        self.refresh_count += 1
+        if self.can_refresh_in_process():
+            try:
+                self._refresh_with_grant()
+                return
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                print(f"Warning: token refresh against {self.token_endpoint} failed: {e}", file=sys.stderr)
+        self._refresh_with_clasp()
+
+    def _refresh_with_grant(self):
+        client_id, client_secret = self._client_credentials()
+        body = urllib.parse.urlencode({
+            'grant_type': 'refresh_token',
+            'refresh_token': self._token['refresh_token'],
+            'client_id': client_id,
+            'client_secret': client_secret,
+        }).encode('ascii')
+        req = urllib.request.Request(self.token_endpoint, data=body, method='POST')
+        req.add_header('Content-Type', 'application/x-www-form-urlencoded')
+        with urllib.request.urlopen(req, timeout=30) as res:
+            payload = json.load(res)
+        if 'access_token' not in payload:
+            raise ValueError(f"no access_token in token response: {list(payload)}")
+        self._token['access_token'] = payload['access_token']
+        if 'expires_in' in payload:
+            self._token['expiry_date'] = int((time.time() + payload['expires_in']) * 1000)
+        if payload.get('refresh_token'):
+            self._token['refresh_token'] = payload['refresh_token']
+        self._save()
+
+    def _save(self):
+        """Write the refreshed token back so clasp subprocesses see it too."""
+        tmp_path = self.rc_path + '.tmp'
+        try:
+            # Created private, so the refresh token is never readable by others.
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=2)
+            os.replace(tmp_path, self.rc_path)
+        except OSError as e:
+            print(f"Warning: could not update {self.rc_path}: {e}", file=sys.stderr)
+
+    def _refresh_with_clasp(self):
+        print("Refreshing clasp token via `clasp list`...", file=sys.stderr)
+        try:
+            # Every worker waits on this refresh, so a hung clasp must not block them for good.
+            subprocess.run('clasp list', shell=True, check=True, timeout=CLASP_REFRESH_TIMEOUT,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except subprocess.CalledProcessError:
+            print("Warning: `clasp list` failed. Token might be invalid.", file=sys.stderr)
+        except subprocess.TimeoutExpired:
+            print(f"Warning: `clasp list` did not finish in {CLASP_REFRESH_TIMEOUT}s. Token might be invalid.",
+                  file=sys.stderr)
+        self._load()
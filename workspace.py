@@ -0,0 +1,160 @@
+"""
+workspace.py
+
+Shared index of the Apps Script projects in this repository: every immediate
+subdirectory that contains a .clasp.json, mapped to the scriptId inside it.
+
+The index is built with a single os.scandir of the base directory and cached
+in .workspace-index.json, keyed on the mtime and size of each .clasp.json. A
+repeated run therefore costs one directory listing plus one stat per project,
+and parses nothing unless a .clasp.json was added, removed or changed. Nothing
+below the project roots is ever walked.
+
+For parallel runners, the scripts accept --shard i/N (parse_shard) and only
+handle the projects whose shard_of() is i; a project without a scriptId is
+sharded by its directory name.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+
+INDEX_CACHE = '.workspace-index.json'
+CACHE_VERSION = 1
+
+
+def shard_of(script_id, shards):
+    """
+    Stable shard number of a scriptId: the first 32 bits of its sha1, modulo
+    shards. Independent of the Python hash seed and of the set of projects, so
+    a project stays in the same shard across runs and machines.
+    """
+    return int.from_bytes(hashlib.sha1(script_id.encode('utf-8')).digest()[:4], 'big') % shards
+
+
+def parse_shard(text):
+    """argparse type for --shard i/N (0 <= i < N). Returns (i, N)."""
+    m = re.match(r'^(\d+)/(\d+)$', text or '')
+    if not m or not 0 <= int(m.group(1)) < int(m.group(2)):
+        raise argparse.ArgumentTypeError(f"expected i/N with 0 <= i < N, got {text!r}")
+    return int(m.group(1)), int(m.group(2))
+
+
+def format_shard(shard):
+    return f"{shard[0]}/{shard[1]}"
+
+
+def in_shard(key, shard):
+    """True if key (a scriptId, or a directory name) belongs to shard; shard None means all."""
+    return shard is None or shard_of(key, shard[1]) == shard[0]
+
+
+class WorkspaceIndex:
+    """scriptId <-> directory index of one workspace."""
+
+    def __init__(self, base_dir, entries):
+        self.base_dir = base_dir
+        # directory name -> scriptId (None if .clasp.json has no valid scriptId)
+        self.by_directory = {name: entries[name]['scriptId'] for name in sorted(entries)}
+        self.by_script_id = {}
+        for name, script_id in self.by_directory.items():
+            if script_id and script_id not in self.by_script_id:
+                self.by_script_id[script_id] = name
+
+    def __len__(self):
+        return len(self.by_directory)
+
+    def projects(self, shard=None):
+        """
+        List of (directory name, absolute path, scriptId), sorted by directory
+        name; with shard=(i, N), only the projects of that shard.
+        """
+        return [
+            (name, os.path.join(self.base_dir, name), script_id)
+            for name, script_id in self.by_directory.items()
+            if in_shard(script_id or name, shard)
+        ]
+
+    def script_ids(self):
+        return set(self.by_script_id)
+
+    def directory_of(self, script_id):
+        return self.by_script_id.get(script_id)
+
+    def script_id_of(self, directory):
+        return self.by_directory.get(directory)
+
+
+def _read_script_id(config_path):
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('scriptId')
+    except (json.JSONDecodeError, OSError, AttributeError) as e:
+        print(f"Warning: Failed to read {config_path}: {e}", file=sys.stderr)
+        return None
+
+
+def _stat_key(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _load_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+        return None
+    return cache
+
+
+def _save_cache(cache_path, cache):
+    tmp_path = cache_path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"Warning: could not write {cache_path}: {e}", file=sys.stderr)
+
+
+def load_index(base_dir=None, cache_path=None, use_cache=True):
+    """
+    Return the WorkspaceIndex of base_dir (default: the current directory).
+    With use_cache=False the tree is scanned and parsed from scratch and no
+    cache file is read or written.
+    """
+    base_dir = os.path.abspath(base_dir or os.getcwd())
+    cache_path = cache_path or os.path.join(base_dir, INDEX_CACHE)
+    cache = _load_cache(cache_path) if use_cache else None
+    cached_entries = (cache or {}).get('entries', {})
+
+    names = []
+    with os.scandir(base_dir) as it:
+        for entry in it:
+            if entry.is_dir() and not entry.name.startswith('.'):
+                names.append(entry.name)
+
+    entries = {}
+    for name in names:
+        config_path = os.path.join(base_dir, name, '.clasp.json')
+        key = _stat_key(config_path)
+        if key is None:
+            continue
+        cached = cached_entries.get(name)
+        if cached and cached.get('stat') == key:
+            entries[name] = cached
+        else:
+            entries[name] = {'stat': key, 'scriptId': _read_script_id(config_path)}
+
+    if use_cache and (cache is None or entries != cached_entries):
+        _save_cache(cache_path, {'version': CACHE_VERSION, 'entries': entries})
+
+    return WorkspaceIndex(base_dir, entries)